@@ -0,0 +1,75 @@
+"""
+Startup time benchmark of the datero CLI and API.
+Every scenario is run in a fresh interpreter, so module imports and config parsing are measured as a user sees them.
+Usage:
+    python scripts/bench_startup.py [-c config.yaml] [-n 20]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+HEAVY_MODULES = ['psycopg2', 'ruamel.yaml']
+
+# scenario name -> python code executed in a fresh interpreter
+SCENARIOS = {
+    'import datero.app': 'import datero.app',
+    'App()': 'from datero.app import App; App({config_file!r})',
+    'App().config': 'from datero.app import App; App({config_file!r}).config.get("servers")',
+    'cli --version': 'import sys; sys.argv = ["datero", "--version"]; from datero.main import main; main()',
+}
+
+
+def run(code: str, env: dict) -> tuple:
+    """Run the code in a fresh interpreter. Returns wall time in seconds and heavy modules loaded by the code"""
+    probe = f'import sys; print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules), file=sys.stderr)'
+    script = f'try:\n    {code}\nexcept SystemExit:\n    pass\n{probe}'
+
+    start = time.perf_counter()
+    res = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+
+    return elapsed, res.stderr.strip().splitlines()[-1] if res.stderr.strip() else ''
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config_file', help='config file passed to App')
+    parser.add_argument('-n', '--repeat', type=int, default=10, help='number of runs per scenario')
+    parser.add_argument('--no-cache', action='store_true', help='disable compiled config cache')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC_DIR, os.environ.get('PYTHONPATH', '')]))
+    if args.no_cache:
+        env['DATERO_CONFIG_CACHE'] = '0'
+
+    baseline = [run('pass', env)[0] for _ in range(args.repeat)]
+    base = statistics.median(baseline)
+    print(f'{"interpreter":<20} median {base * 1000:8.1f} ms')
+
+    for name, template in SCENARIOS.items():
+        code = template.format(config_file=args.config_file)
+        # warm up compiled config cache and bytecode
+        run(code, env)
+
+        timings = []
+        loaded = ''
+        for _ in range(args.repeat):
+            elapsed, loaded = run(code, env)
+            timings.append(elapsed)
+
+        median = statistics.median(timings)
+        print(
+            f'{name:<20} median {median * 1000:8.1f} ms'
+            f'  min {min(timings) * 1000:8.1f} ms'
+            f'  over interpreter {(median - base) * 1000:8.1f} ms'
+            f'  loaded: {loaded or "-"}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -88,3 +88,17 @@ class Adapter:
                 print('Getting table list is not supported')
 
         return stmt
+
+
+    def local_table_name(self, table_name: str, import_options: dict = None) -> str:
+        """Name of the foreign table created by IMPORT FOREIGN SCHEMA for the given remote table"""
+        name = table_name
+
+        match self.fdw_name:
+            case FdwType.ORACLE.value:
+                # oracle_fdw "case" import option. "smart" by default: only all uppercase names are folded to lowercase
+                case = (import_options or {}).get('case', 'smart')
+                if case == 'lower' or (case == 'smart' and table_name.isupper()):
+                    name = table_name.lower()
+
+        return name
@@ -50,7 +50,7 @@ class MSSQL:
                  , tab.table_name       AS table_name
                  , tab.table_type       AS table_type
               FROM {full_table_name}    tab
-             WHERE tab.schema_name      NOT IN ( 'guest'
+             WHERE tab.table_schema     NOT IN ( 'guest'
                                                , 'INFORMATION_SCHEMA'
                                                , 'sys'
                                                , 'db_owner'
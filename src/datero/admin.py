@@ -6,7 +6,7 @@ import datetime
 import os
 
 from . import CONNECTION
-from .connection import ConnectionPool
+from .connection import ConnectionPool, Session
 
 class Admin:
     """Administrative functions"""
@@ -16,12 +16,17 @@ class Admin:
         self.pool = ConnectionPool(self.config[CONNECTION])
 
 
-    def healthcheck(self):
+    def healthcheck_query(self) -> str:
+        """Health check query. Shared by sync and async API"""
+        return "SELECT 'Connected' AS status, now() AS heartbeat"
+
+
+    def healthcheck(self, session: Session = None):
         """Check database availability"""
         try:
-            query = f"SELECT 'Connected' AS status, now() AS heartbeat"
+            query = self.healthcheck_query()
 
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
                     cur.execute(query)
                     row = cur.fetchone()
@@ -36,11 +41,11 @@ class Admin:
             #raise e
 
 
-    def create_system_schema(self, schema_name: str):
+    def create_system_schema(self, schema_name: str, session: Session = None):
         """Create system schema"""
         try:
             stmt = None
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
                     query = sql.SQL('CREATE SCHEMA IF NOT EXISTS {datero_schema}') \
                         .format(datero_schema=sql.Identifier(schema_name))
@@ -52,11 +57,11 @@ class Admin:
             print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}')
 
 
-    def deploy_datero_schema(self):
+    def deploy_datero_schema(self, session: Session = None):
         """Apply SQL scripts to deploy Datero schema"""
         try:
             print('Start deploying "datero" schema')
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
                     script_dir = os.path.dirname(__file__)  # Directory of the script
                     file_path = os.path.join(script_dir, 'sql', 'datero.sql')
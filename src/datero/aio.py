@@ -0,0 +1,435 @@
+"""asyncio API interface"""
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import datetime
+import functools
+import uuid
+import psycopg2
+from psycopg2 import extensions, sql
+from psycopg2.pool import PoolError
+
+from .app import App
+from . import CONNECTION
+
+
+async def wait(conn):
+    """Drive asynchronous connection until the current operation is completed without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    fd = conn.fileno()
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+
+        future = loop.create_future()
+        if state == extensions.POLL_READ:
+            loop.add_reader(fd, future.set_result, None)
+            remove = loop.remove_reader
+        elif state == extensions.POLL_WRITE:
+            loop.add_writer(fd, future.set_result, None)
+            remove = loop.remove_writer
+        else:
+            raise psycopg2.OperationalError(f'Unexpected connection poll state: {state}')
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            remove(fd)
+            # interrupt the running statement. cancel request is a blocking round trip, so it's sent from a thread.
+            # it's awaited, because the pool discards the connection right after and cancel can't outlive it
+            await asyncio.shield(loop.run_in_executor(None, cancel, conn))
+            raise
+        finally:
+            remove(fd)
+
+
+def cancel(conn):
+    """Send cancel request for the current statement of the connection. Errors are ignored, connection is discarded anyway"""
+    try:
+        conn.cancel()
+    except psycopg2.Error:
+        pass
+
+
+class AsyncConnectionPool:
+    """
+    Pool of asynchronous psycopg2 connections.
+    Such connections are always in autocommit mode. Explicit transaction is opened only for cursors.
+    At most "max_size" connections are in use, other callers wait for a free one up to "timeout" seconds.
+    """
+
+    def __init__(self, config: Dict):
+        pool_config = config.get('pool') or {}
+
+        self.config = config
+        self.maxconn = pool_config.get('max_size', 10)
+        self.timeout = pool_config.get('timeout')
+
+        self._idle = []
+        self._semaphore = None
+
+
+    async def connect(self):
+        """Open new asynchronous connection"""
+        conn = psycopg2.connect(
+            dbname=self.config['database'],
+            user=self.config['username'],
+            password=self.config['password'],
+            host=self.config['hostname'],
+            port=self.config['port'],
+            application_name='datero',
+            async_=True
+        )
+        await wait(conn)
+        return conn
+
+
+    @asynccontextmanager
+    async def connection(self):
+        """Get connection from the pool and return it back once done. Broken connections are discarded"""
+        # semaphore is created lazily to be bound to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.maxconn)
+
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError as e:
+            raise PoolError(f'connection pool exhausted: no connection available within {self.timeout}s') from e
+
+        conn = None
+        try:
+            while len(self._idle) > 0 and conn is None:
+                conn = self._idle.pop()
+                if conn.closed:
+                    conn = None
+            if conn is None:
+                conn = await self.connect()
+
+            yield conn
+
+        except BaseException:
+            if conn is not None and not conn.closed:
+                conn.close()
+            raise
+
+        finally:
+            if conn is not None and not conn.closed \
+                and conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE:
+                self._idle.append(conn)
+            elif conn is not None and not conn.closed:
+                conn.close()
+            self._semaphore.release()
+
+
+    def closeall(self):
+        """Close idle connections"""
+        while len(self._idle) > 0:
+            self._idle.pop().close()
+
+
+class AsyncApp:
+    """
+    asyncio API interface.
+    Catalog lookups and queries are executed on the asynchronous connection pool, so many of them are kept in flight
+    by a single thread. Their SQL is built by the same query builders as the sync API uses.
+    Queries scanning foreign servers with limits are delegated to the sync API, so the limits are enforced.
+    Multi-step transactional operations (servers and user mappings management, schema import, export, planning)
+    are delegated to the sync API on a bounded thread pool of the connection pool size.
+    Usage:
+        app = AsyncApp('config.yaml')
+        servers = await app.server_list()
+        async for rows in app.stream('SELECT * FROM mysql.orders'):
+            process(rows)
+    """
+
+    def __init__(self, config_file: str = None, workers: int = None):
+        self.app = App(config_file)
+        self.pool = AsyncConnectionPool(self.config[CONNECTION])
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or self.pool.maxconn,
+            thread_name_prefix='datero-async'
+        )
+
+        # sync subsystems used by this class are created upfront. the first of them opens the sync connection pool,
+        # which must not be done by a blocking connect on the event loop
+        for name in ('pool', 'admin', 'extension', 'server', 'user', 'schema', 'queries'):
+            getattr(self.app, name)
+
+    @property
+    def config(self):
+        """Current configuration. Merge of default and user config files"""
+        return self.app.config
+
+
+    async def execute(self, query, params: Dict = None, conn=None, limits: bool = True) -> Tuple[List[tuple], List[str]]:
+        """
+        Execute single statement. Returns its rows and column names.
+        Statements scanning foreign servers with limits are delegated to the sync API, which enforces them.
+        Limits aren't checked for the given connection and, with "limits" off, for catalog queries built by Datero.
+        """
+        if conn is None:
+            if limits and await self.run(self.app.queries.limited_servers, query, params):
+                res = await self.run(self.app.queries.fetch, query, params, False)
+                return (res['rows'], res['columns'])
+
+            async with self.pool.connection() as conn:
+                return await self.execute(query, params, conn)
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                await wait(conn)
+
+                if cur.description is None:
+                    return ([], [])
+                return (cur.fetchall(), [col.name for col in cur.description])
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {query}\nParams: {params}')
+            raise e
+
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run sync API call on the bounded thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+
+    async def close(self):
+        """Release connections and worker threads"""
+        self.pool.closeall()
+        self.executor.shutdown(wait=False)
+
+
+    # natively asynchronous API
+
+    async def health_check(self) -> Dict:
+        """Return health check status"""
+        try:
+            rows, _ = await self.execute(self.app.admin.healthcheck_query(), limits=False)
+            return { 'status': rows[0][0], 'heartbeat': rows[0][1] }
+        except psycopg2.Error:
+            return { 'status': 'Not connected', 'heartbeat': datetime.datetime.now() }
+
+
+    async def fdw_list(self) -> List[Dict]:
+        """Return list of available FDWs"""
+        rows, _ = await self.execute(self.app.extension.fdw_list_query(), limits=False)
+        return self.app.extension.fdw_list_result(rows)
+
+
+    async def server_list(self, server_name: str = None) -> List[Dict]:
+        """Return list of foreign servers. Optionally filtered by server name"""
+        rows, _ = await self.execute(*self.app.server.server_list_query(server_name), limits=False)
+        return self.app.server.server_list_result(rows)
+
+
+    async def get_server(self, server_name: str) -> Dict:
+        """Get server details"""
+        res = await self.server_list(server_name)
+        return res[0] if len(res) > 0 else None
+
+
+    async def get_local_schema_list(self) -> List[str]:
+        """Get list of local schemas"""
+        rows, _ = await self.execute(*self.app.schema.get_local_schema_list_query(), limits=False)
+        return [val[0] for val in rows]
+
+
+    async def server_index(self) -> Dict[str, Dict]:
+        """Existing foreign servers keyed by server name"""
+        return {server['server_name']: server for server in await self.server_list()}
+
+
+    async def get_objects_details(
+        self,
+        schema_name: str,
+        object_names: List[str] = None,
+        after: Tuple[str, str] = None,
+        limit: int = None
+    ) -> Dict:
+        """Get page of columns for tables/views in a schema. See Schema.get_objects_details"""
+        rows, _ = await self.execute(
+            *self.app.schema.get_objects_details_query(schema_name, object_names, after, limit),
+            limits=False
+        )
+        return self.app.schema.get_objects_details_result(rows, limit)
+
+
+    async def iter_objects_details(
+        self,
+        schema_name: str,
+        object_names: List[str] = None,
+        page_size: int = 500
+    ) -> AsyncIterator[List[Dict]]:
+        """Stream columns of all tables/views in a schema page by page. See Schema.iter_objects_details"""
+        after = None
+        while True:
+            page = await self.get_objects_details(schema_name, object_names, after, page_size)
+            if len(page['objects']) > 0:
+                yield page['objects']
+
+            after = page['next']
+            if after is None:
+                break
+
+
+    async def fetch(self, stmt: str, params: Dict = None, cache: bool = None) -> Dict:
+        """
+        Execute query and return its whole result as {'columns': [...], 'rows': [...]}.
+        If result cache is enabled, sync path is used to share the cache. Limits are enforced by "execute".
+        """
+        queries = self.app.queries
+        if queries.result_cache.enabled if cache is None else cache:
+            return await self.run(queries.fetch, stmt, params, cache)
+
+        rows, columns = await self.execute(stmt, params)
+        return {'columns': columns, 'rows': rows}
+
+
+    async def stream(self, stmt: str, params: Dict = None, batch_size: int = None) -> AsyncIterator[List[tuple]]:
+        """
+        Execute query and yield its result in batches of up to "batch_size" rows.
+        Rows are read through a server-side cursor declared in an explicit transaction.
+        Connection is held until the generator is exhausted or closed.
+        Queries scanning foreign servers with limits are streamed by the sync API, which enforces them,
+        and their batches are read on the thread pool.
+        """
+        batch_size = batch_size or self.app.queries.batch_size
+
+        if await self.run(self.app.queries.limited_servers, stmt, params):
+            batches = self.app.queries.stream(stmt, params, batch_size)
+            try:
+                while True:
+                    rows = await self.run(next, batches, None)
+                    if rows is None:
+                        break
+                    yield rows
+            finally:
+                await self.run(batches.close)
+            return
+
+        name = sql.Identifier(f'datero_{uuid.uuid4().hex}')
+
+        async with self.pool.connection() as conn:
+            await self.execute('BEGIN', conn=conn)
+            await self.execute(
+                sql.SQL('DECLARE {name} NO SCROLL CURSOR FOR {query}').format(
+                    name=name,
+                    query=sql.SQL(stmt.strip().rstrip(';'))
+                ),
+                params,
+                conn
+            )
+
+            while True:
+                rows, _ = await self.execute(
+                    sql.SQL('FETCH FORWARD {size} FROM {name}').format(size=sql.Literal(batch_size), name=name),
+                    conn=conn
+                )
+                if len(rows) == 0:
+                    break
+                yield rows
+
+            await self.execute(sql.SQL('CLOSE {name}').format(name=name), conn=conn)
+            await self.execute('COMMIT', conn=conn)
+
+
+    # sync API delegated to the thread pool
+
+    async def create_system_schema(self, schema_name: str):
+        """Create system schema"""
+        return await self.run(self.app.admin.create_system_schema, schema_name)
+
+
+    async def deploy_datero_schema(self):
+        """Apply SQL scripts to deploy Datero schema"""
+        return await self.run(self.app.admin.deploy_datero_schema)
+
+
+    async def init_extensions(self):
+        """Create FDW extensions from the config and if they are available in the system"""
+        return await self.run(self.app.extension.init_extensions)
+
+
+    async def create_server(self, data: Dict) -> Dict:
+        """Create foreign server"""
+        return await self.run(self.app.server.create_server, data)
+
+
+    async def update_server(self, data: Dict) -> Dict:
+        """Update foreign server"""
+        return await self.run(self.app.server.update_server, data)
+
+
+    async def delete_server(self, data: Dict) -> Dict:
+        """Delete foreign server"""
+        return await self.run(self.app.server.delete_server, data)
+
+
+    async def set_limits(self, server_name: str, limits: Dict = None):
+        """Set or, if "limits" is empty, remove server limits"""
+        return await self.run(self.app.server.set_limits, server_name, limits)
+
+
+    async def create_user_mapping(self, server_name: str, props: Dict):
+        """Create user mapping for the current user"""
+        return await self.run(self.app.user.create_user_mapping, server_name, props)
+
+
+    async def alter_user_mapping(self, server_name: str, props: Dict):
+        """Alter user mapping of the current user"""
+        return await self.run(self.app.user.alter_user_mapping, server_name, props)
+
+
+    async def get_foreign_schema_list(self, server_name: str, fdw_name: str, refresh: bool = False):
+        """Get list of remote schemas available to import"""
+        return await self.run(self.app.schema.get_foreign_schema_list, server_name, fdw_name, refresh=refresh)
+
+
+    async def get_foreign_table_list(self, server_name: str, remote_schema: str, refresh: bool = False):
+        """Get list of remote tables of the remote schema"""
+        return await self.run(self.app.schema.get_foreign_table_list, server_name, remote_schema, refresh=refresh)
+
+
+    async def import_foreign_schema(self, data: Dict) -> Dict:
+        """Import foreign schema"""
+        return await self.run(self.app.schema.import_foreign_schema, data)
+
+
+    async def get_local_schema_objects(self, schema_name: str):
+        """Get list of local schema objects"""
+        return await self.run(self.app.schema.get_local_schema_objects, schema_name)
+
+
+    async def get_object_details(self, schema_name: str, object_name: str, object_type: str):
+        """Get columns of the local object"""
+        return await self.run(self.app.schema.get_object_details, schema_name, object_name, object_type)
+
+
+    async def export(self, stmt: str, sink, fmt: str = 'csv', params: Dict = None):
+        """Export query result into the file path or binary file-like object"""
+        return await self.run(self.app.export, stmt, sink, fmt, params)
+
+
+    async def explain_pushdown(self, stmt: str, params: Dict = None, analyze: bool = False) -> Dict:
+        """Report query parts evaluated locally instead of on the remote servers"""
+        return await self.run(self.app.explain_pushdown, stmt, params, analyze)
+
+
+    async def submit(self, kind: str, params: Dict = None) -> int:
+        """Run long operation as a background job. Returns job id"""
+        return await self.run(self.app.submit, kind, params)
+
+
+    async def plan(self, prune: bool = False):
+        """Compute changes required to bring foreign servers in line with config file"""
+        return await self.run(self.app.plan, prune)
+
+
+    async def apply(self, prune: bool = False):
+        """Apply changes required to bring foreign servers in line with config file"""
+        return await self.run(self.app.apply, prune)
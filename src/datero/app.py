@@ -1,28 +1,130 @@
 """main API interface"""
+from typing import Dict, List
+from functools import cached_property
 
 from .config import ConfigParser
-from .fdw import Extension, Server, UserMapping, Schema
-from .admin import Admin
-from .connection import ConnectionPool
 from . import CONNECTION, DATERO_SCHEMA, DATERO_FDW_SCHEMA
 
 class App:
-    """main API interface"""
+    """
+    main API interface.
+    Subsystems and connection pool are created on the first access, together with import of their modules.
+    So the call uses only what it needs. For example, config inspection doesn't open a database connection.
+    """
 
     def __init__(self, config_file: str = None):
         self.config_file = config_file
         self.cp = ConfigParser(config_file)
 
-        self.admin = Admin(self.config)
+    @cached_property
+    def admin(self):
+        """Administrative API"""
+        from .admin import Admin
+        return Admin(self.config)
 
-        self.extension = Extension(self.config)
-        self.server = Server(self.config)
-        self.user = UserMapping(self.config)
-        self.schema = Schema(self.config)
+    @cached_property
+    def extension(self):
+        """FDW extensions API"""
+        from .fdw import Extension
+        return Extension(self.config)
 
-        # exposing connection pool object for outer usage by Query functionality
-        self.pool = ConnectionPool(self.config[CONNECTION])
+    @cached_property
+    def server(self):
+        """Foreign servers API"""
+        from .fdw import Server
+        return Server(self.config)
 
+    @cached_property
+    def user(self):
+        """User mappings API"""
+        from .fdw import UserMapping
+        return UserMapping(self.config)
+
+    @cached_property
+    def schema(self):
+        """Foreign schemas API"""
+        from .fdw import Schema
+        return Schema(self.config)
+
+    @cached_property
+    def planner(self):
+        """Declarative foreign servers planner"""
+        from .fdw import Planner
+        return Planner(self.config)
+
+    @cached_property
+    def materialization(self):
+        """Materializations of foreign tables API"""
+        from .fdw import Materialization
+        return Materialization(self.config)
+
+    @cached_property
+    def scheduler(self):
+        """Background refresh of materializations"""
+        from .fdw import RefreshScheduler
+        return RefreshScheduler(
+            self.materialization,
+            (self.config.get('materialization') or {}).get('scheduler_interval', 60)
+        )
+
+    @cached_property
+    def pool(self):
+        """Connection pool. Exposed for outer usage by Query functionality"""
+        from .connection import ConnectionPool
+        return ConnectionPool(self.config[CONNECTION])
+
+    @cached_property
+    def queries(self):
+        """Queries execution API"""
+        from .query import Query
+        return Query(self.config)
+
+    @cached_property
+    def exports(self):
+        """Query result export API"""
+        from .export import Export
+        return Export(self.config)
+
+    @cached_property
+    def advisor(self):
+        """Pushdown advisor"""
+        from .explain import PushdownAdvisor
+        return PushdownAdvisor(self.config)
+
+    @cached_property
+    def benchmark(self):
+        """Tuning profiles benchmark"""
+        from .benchmark import Benchmark
+        return Benchmark(self.config)
+
+    @cached_property
+    def jobs(self):
+        """Queue of long-running operations which could be offloaded to the background workers"""
+        from .jobs import JobQueue
+        jobs = JobQueue(self.config)
+        jobs.register(
+            'import_foreign_schema',
+            lambda params, session, progress: self.schema.import_foreign_schema(params, session, progress)
+        )
+        jobs.register(
+            'refresh_materialization',
+            lambda params, session, progress: self.materialization.refresh(params['target_schema'], params['target_table'], session)
+        )
+        jobs.register(
+            'export',
+            lambda params, session, progress: self.exports.export(
+                params['stmt'], params['path'], params.get('format', 'csv'), params.get('params'),
+                session=session, progress=progress
+            )
+        )
+        return jobs
+
+
+    @cached_property
+    def watcher(self):
+        """Config files watcher applying changes of foreign servers"""
+        from .watch import ConfigWatcher
+        return ConfigWatcher(self.cp)
 
     @property
     def config(self):
@@ -55,6 +157,18 @@ class App:
         return self.admin.healthcheck()
 
 
+    def transaction(self):
+        """
+        Unit of work scope. Yields session object to be passed into API methods.
+        All of them are executed on a single connection in a single transaction.
+        Usage:
+            with app.transaction() as session:
+                app.server.create_server(data, session)
+                app.schema.import_foreign_schema(schema, session)
+        """
+        return self.pool.transaction()
+
+
     def run(self):
         """Process config file and create specified extensions and foreign servers"""
 
@@ -71,3 +185,148 @@ class App:
         self.server.init_servers()
         #self.user.init_user_mappings()
         #self.schema.init_foreign_schemas()
+
+
+    def query(self, stmt: str, params: Dict = None, batch_size: int = None):
+        """
+        Execute query and return generator of row batches.
+        Result set is streamed through server-side cursor, so it's never fully materialized in memory.
+        Usage:
+            for rows in app.query('SELECT * FROM mysql.orders WHERE status = %(status)s', {'status': 'new'}):
+                process(rows)
+        """
+        return self.queries.stream(stmt, params, batch_size)
+
+
+    def fetch(self, stmt: str, params: Dict = None, cache: bool = None):
+        """
+        Execute query and return its whole result as {'columns': [...], 'rows': [...]}.
+        Identical queries are answered from the result cache if it's enabled in config or by "cache" flag.
+        Cached results are invalidated on changes of the involved foreign servers and their schemas imports.
+        """
+        return self.queries.fetch(stmt, params, cache)
+
+
+    def scan(self, schema_name: str, table_name: str, key: str, partitions: int = None, columns: List[str] = None):
+        """
+        Read foreign table by key range slices scanned concurrently on separate connections.
+        Returns generator of row batches merged from all slices. Rows order is not preserved.
+        Usage:
+            for rows in app.scan('mysql', 'orders', 'order_id', partitions=8):
+                process(rows)
+        """
+        return self.queries.scan_partitioned(schema_name, table_name, key, partitions, columns)
+
+
+    def load(self, schema_name: str, table_name: str, key: str, target_schema: str, target_table: str = None, partitions: int = None):
+        """Copy foreign table into the local table by key range slices loaded concurrently"""
+        return self.queries.load_partitioned(schema_name, table_name, key, target_schema, target_table or table_name, partitions)
+
+
+    def export(self, stmt: str, sink, fmt: str = 'csv', params: Dict = None):
+        """
+        Export query result into the file path or binary file-like object.
+        Supported formats: csv, parquet, arrow. Parquet and Arrow require "pyarrow" package.
+        """
+        return self.exports.export(stmt, sink, fmt, params)
+
+
+    def explain_pushdown(self, stmt: str, params: Dict = None, analyze: bool = False):
+        """
+        Print and return report on query parts evaluated locally instead of on the remote servers:
+        remote queries of foreign scans, local filters, joins, sorts, aggregates and estimated rows shipped.
+        With "analyze" the query is executed to get real row counts.
+        """
+        report = self.advisor.explain_pushdown(stmt, params, analyze)
+        for line in self.advisor.render(report):
+            print(line)
+
+        return report
+
+
+    def benchmark_profiles(self, server_name: str, stmt: str, profiles: List[str] = None, repeat: int = 1):
+        """
+        Measure rows/sec of the sample query over the foreign server under every tuning profile.
+        Server definition isn't changed, profiles are applied in a rolled back transaction.
+        """
+        res = self.benchmark.run(server_name, stmt, profiles, repeat=repeat)
+        for line in self.benchmark.render(res):
+            print(line)
+
+        return res
+
+
+    def submit(self, kind: str, params: Dict = None) -> int:
+        """
+        Run long operation in background. Returns job id to poll its status and progress or cancel it.
+        Job kinds: import_foreign_schema, refresh_materialization, export.
+        Usage:
+            job_id = app.submit('import_foreign_schema', {'server_name': 'mysql', 'remote_schema': 'sales', 'local_schema': 'sales'})
+            app.jobs.poll(job_id)
+            app.jobs.cancel(job_id)
+        """
+        return self.jobs.submit(kind, params)
+
+
+    def plan(self, prune: bool = False):
+        """
+        Compare foreign servers defined in config file with the database catalog.
+        Print and return minimal list of changes required to bring the catalog in line with the config.
+        """
+        changes = self.planner.plan(prune)
+
+        if len(changes) == 0:
+            print('No changes. Foreign servers are up-to-date with config file')
+        else:
+            print(f'Planned changes: {len(changes)}')
+            for line in self.planner.render(changes):
+                print(line)
+
+        return changes
+
+
+    def apply(self, prune: bool = False):
+        """Compute and apply minimal list of changes required to bring the catalog in line with config file"""
+        changes = self.plan(prune)
+        return self.planner.apply(changes) if len(changes) > 0 else None
+
+
+    def materialize(self, data: Dict):
+        """
+        Create local copy of the foreign table and populate it.
+        Copies with "refresh_interval" are refreshed by the scheduler started with "start_scheduler" method.
+        Usage:
+            app.materialize({
+                'source_schema': 'mysql', 'source_table': 'orders',
+                'target_schema': 'local', 'refresh_interval': 3600,
+                'watermark_column': 'updated_at', 'key_columns': ['order_id']
+            })
+        """
+        return self.materialization.create_materialization(data)
+
+
+    def start_scheduler(self):
+        """Start background refresh of materializations"""
+        self.scheduler.start()
+
+
+    def stop_scheduler(self):
+        """Stop background refresh of materializations"""
+        self.scheduler.stop()
+
+
+    def watch(self, prune: bool = False):
+        """
+        Watch config files and apply changes of foreign servers until interrupted.
+        Only created, changed and, with "prune", removed servers are processed.
+        Bursts of edits are collapsed into a single reload. See "watch" config section for timings.
+        """
+        self.watcher.prune = prune
+        self.watcher.start()
+        try:
+            while self.watcher.join(1):
+                pass
+        except KeyboardInterrupt:
+            print('Stopping config watcher...')
+        finally:
+            self.watcher.stop()
@@ -0,0 +1,167 @@
+"""Benchmark of FDW tuning profiles"""
+from typing import Dict, List
+import time
+import uuid
+import psycopg2
+from psycopg2 import sql
+
+from . import CONNECTION
+from .connection import ConnectionPool
+from .explain import PushdownAdvisor
+from .fdw.server import Server
+from .fdw.tuning import TUNING_PROFILES, TABLE_SECTIONS, profile_options
+from .fdw.util import options_and_values
+
+BASELINE = 'current'
+
+
+class Benchmark:
+    """
+    Measures throughput of a sample query over the foreign server under every tuning profile.
+    Profile options are applied by ALTER SERVER / ALTER FOREIGN TABLE in a transaction which is rolled back
+    after the measurement, so the server definition is never changed.
+    """
+    BATCH_SIZE = 10000
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.pool = ConnectionPool(self.config[CONNECTION])
+        self.server = Server(self.config)
+        self.advisor = PushdownAdvisor(self.config)
+
+
+    def foreign_tables_options(self, cur, server_name: str) -> Dict[str, Dict]:
+        """Options of the server foreign tables keyed by qualified table identifier"""
+        cur.execute("""
+            SELECT n.nspname
+                 , c.relname
+                 , COALESCE(ft.ftoptions, '{}')
+              FROM pg_foreign_table             ft
+              JOIN pg_foreign_server            s
+                ON s.oid                        = ft.ftserver
+              JOIN pg_class                     c
+                ON c.oid                        = ft.ftrelid
+              JOIN pg_namespace                 n
+                ON n.oid                        = c.relnamespace
+             WHERE s.srvname                    = %(server_name)s
+        """, {'server_name': server_name})
+
+        return {
+            (row[0], row[1]): dict(option.split('=', 1) for option in row[2])
+            for row in cur.fetchall()
+        }
+
+
+    def query_tables(self, server_name: str, stmt: str, params: Dict = None) -> set:
+        """Qualified names of the server foreign tables scanned by the query"""
+        scans = self.advisor.explain_pushdown(stmt, params)['scans']
+        return {relation for scan in scans if scan['server'] == server_name for relation in scan['relations']}
+
+
+    def apply_profile(self, cur, server_name: str, fdw_name: str, profile: str, tables: set):
+        """
+        Apply profile options to the server and the given foreign tables within the current transaction.
+        ALTER FOREIGN TABLE takes an exclusive lock, so only tables scanned by the query are altered.
+        """
+        options = profile_options(self.config, profile, fdw_name)
+
+        server_options = options.get('foreign_server') or {}
+        if server_options:
+            current = self.server.get_server_options(server_name)
+            query, values = self.server.alter_server_query(
+                server_name, {**current, **server_options}, current, changed_only=True
+            )
+            cur.execute(query, values)
+
+        table_options = {}
+        for section in TABLE_SECTIONS:
+            table_options.update(options.get(section) or {})
+
+        if table_options:
+            for (schema_name, table_name), current in self.foreign_tables_options(cur, server_name).items():
+                if f'{schema_name}.{table_name}' not in tables:
+                    continue
+
+                keys, values = options_and_values({**current, **table_options}, current, changed_only=True)
+                cur.execute(
+                    sql.SQL('ALTER FOREIGN TABLE {table} OPTIONS ({options})').format(
+                        table=sql.Identifier(schema_name, table_name),
+                        options=keys
+                    ),
+                    values
+                )
+
+
+    def measure(self, server_name: str, fdw_name: str, profile: str, stmt: str, params: Dict = None, tables: set = None) -> Dict:
+        """Run the query to the end under the profile and measure rows per second"""
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    if profile != BASELINE:
+                        self.apply_profile(cur, server_name, fdw_name, profile, tables or set())
+
+                started = time.perf_counter()
+                rows = 0
+                first_batch = None
+
+                with conn.cursor(name=f'datero_{uuid.uuid4().hex}') as cur:
+                    cur.execute(stmt, params)
+                    while True:
+                        batch = cur.fetchmany(Benchmark.BATCH_SIZE)
+                        if first_batch is None:
+                            first_batch = time.perf_counter() - started
+                        if len(batch) == 0:
+                            break
+                        rows += len(batch)
+
+                elapsed = time.perf_counter() - started
+            finally:
+                conn.rollback()
+
+        return {
+            'rows': rows,
+            'elapsed': elapsed,
+            'first_batch': first_batch,
+            'rows_per_sec': rows / elapsed if elapsed > 0 else 0.0
+        }
+
+
+    def run(self, server_name: str, stmt: str, profiles: List[str] = None, params: Dict = None, repeat: int = 1) -> Dict[str, Dict]:
+        """
+        Benchmark the query under the current server options and every given profile (all defined ones by default).
+        Every profile is run "repeat" times and the best run is reported.
+        """
+        server = self.server.get_server(server_name)
+        if server is None:
+            raise ValueError(f'Foreign server "{server_name}" doesn\'t exist')
+
+        profiles = [BASELINE] + list(profiles or (self.config.get(TUNING_PROFILES) or {}).keys())
+        tables = self.query_tables(server_name, stmt, params)
+
+        res = {}
+        for profile in profiles:
+            try:
+                runs = [
+                    self.measure(server_name, server['fdw_name'], profile, stmt, params, tables)
+                    for _ in range(max(int(repeat), 1))
+                ]
+                res[profile] = max(runs, key=lambda run: run['rows_per_sec'])
+            except psycopg2.Error as e:
+                print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nProfile: {profile}')
+                res[profile] = {'error': str(e)}
+
+        return res
+
+
+    def render(self, res: Dict[str, Dict]) -> List[str]:
+        """Human readable results table"""
+        lines = [f'{"profile":<16}{"rows":>12}{"seconds":>12}{"first batch":>14}{"rows/sec":>14}']
+        for profile, run in res.items():
+            if 'error' in run:
+                lines.append(f'{profile:<16}error: {run["error"].strip()}')
+            else:
+                lines.append(
+                    f'{profile:<16}{run["rows"]:>12}{run["elapsed"]:>12.3f}'
+                    f'{run["first_batch"]:>14.3f}{run["rows_per_sec"]:>14.0f}'
+                )
+        return lines
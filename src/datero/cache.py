@@ -0,0 +1,314 @@
+"""In-memory caches"""
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe size bounded cache.
+    Every entry expires after "ttl" seconds. When "max_size" is reached, least recently used entry is evicted.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()  # key -> (expiration time, value). least recently used are on the left
+        self._lock = threading.RLock()
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get not expired value. Marks entry as recently used"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        """Store value. Evicts least recently used entries if size limit is exceeded"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], refresh: bool = False) -> Any:
+        """
+        Get cached value or load and cache it.
+        Loader is called outside of the lock, so concurrent misses of the same key could load it several times.
+        """
+        value = _MISSING if refresh else self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+
+        return value
+
+
+    def invalidate(self, predicate: Callable[[Hashable], bool] = None) -> int:
+        """Drop entries with keys matching the predicate or all entries if it's not specified"""
+        with self._lock:
+            keys = [key for key in self._data if predicate is None or predicate(key)]
+            for key in keys:
+                del self._data[key]
+
+            return len(keys)
+
+
+    def stats(self) -> Dict:
+        """Cache usage statistics"""
+        with self._lock:
+            return { 'size': len(self._data), 'hits': self.hits, 'misses': self.misses }
+
+
+class CatalogCache(TTLCache):
+    """
+    Cache of the remote catalog lookups (schemas and tables lists) singleton.
+    Keys are tuples starting with foreign server name followed by the lookup kind and its arguments.
+    """
+    _lock_instance = threading.Lock()
+
+    def __new__(cls, *_):
+        """Cache object is singleton"""
+        with cls._lock_instance:
+            if not hasattr(cls, 'instance'):
+                cls.instance = super(CatalogCache, cls).__new__(cls)
+                cls._initialized = False
+        return cls.instance
+
+
+    def __init__(self, config: Dict):
+        with CatalogCache._lock_instance:
+            if self._initialized:
+                return
+
+            settings = (config.get('cache') or {}).get('catalog') or {}
+            super().__init__(settings.get('max_size', 1024), settings.get('ttl', 300))
+
+            self._initialized = True
+
+
+    def invalidate_server(self, server_name: str) -> int:
+        """Drop all cached lookups of the foreign server"""
+        return self.invalidate(lambda key: key[0] == server_name)
+
+
+class ResultCache:
+    """
+    Cache of the federated queries results singleton.
+    Entries are kept pickled, so memory usage is accounted exactly and callers can't modify cached rows.
+    When "max_bytes" budget is exceeded, least recently used entries are evicted or, if "spill_dir" is set,
+    moved to the local disk bounded by "max_disk_bytes". Every entry expires after "ttl" seconds.
+    Each entry remembers foreign servers involved into the query to be invalidated when any of them is changed.
+    """
+    _lock_instance = threading.Lock()
+
+    def __new__(cls, *_):
+        """Cache object is singleton"""
+        with cls._lock_instance:
+            if not hasattr(cls, 'instance'):
+                cls.instance = super(ResultCache, cls).__new__(cls)
+                cls._initialized = False
+        return cls.instance
+
+
+    def __init__(self, config: Dict):
+        with ResultCache._lock_instance:
+            if self._initialized:
+                return
+
+            settings = (config.get('cache') or {}).get('results') or {}
+            self.enabled = settings.get('enabled', False)
+            self.ttl = settings.get('ttl', 60)
+            self.max_bytes = settings.get('max_bytes', 64 * 1024 * 1024)
+            self.spill_dir = settings.get('spill_dir')
+            self.max_disk_bytes = settings.get('max_disk_bytes', 1024 * 1024 * 1024)
+            self.hits = 0
+            self.misses = 0
+
+            # key -> (expiration time, servers, pickled value). least recently used are on the left
+            self._memory = OrderedDict()
+            self._memory_bytes = 0
+            # key -> (expiration time, servers, file path, size)
+            self._disk = OrderedDict()
+            self._disk_bytes = 0
+            self._lock = threading.RLock()
+
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+
+            self._initialized = True
+
+
+    @staticmethod
+    def key(stmt: str, params: Any = None) -> Tuple[str, str]:
+        """Cache key of the query. Whitespace and trailing semicolon don't matter"""
+        query = ' '.join(stmt.split()).rstrip(';').rstrip()
+        if isinstance(params, dict):
+            params = sorted(params.items())
+        return (query, repr(params))
+
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get not expired value. Spilled entry is loaded back into memory"""
+        with self._lock:
+            now = time.monotonic()
+
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return pickle.loads(entry[2])
+                self._drop_memory(key)
+
+            entry = self._disk.get(key)
+            if entry is not None:
+                expires, servers, path, _ = entry
+                self._drop_disk(key, remove=False)
+
+                if expires > now:
+                    try:
+                        with open(path, 'rb') as f:
+                            data = f.read()
+                    except OSError:
+                        data = None
+                    finally:
+                        self._remove_file(path)
+
+                    if data is not None:
+                        self._put_memory(key, (expires, servers, data))
+                        self.hits += 1
+                        return pickle.loads(data)
+                else:
+                    self._remove_file(path)
+
+            self.misses += 1
+            return default
+
+
+    def set(self, key: Hashable, value: Any, servers: Iterable[str] = (), ttl: float = None):
+        """Store value. Value bigger than the whole memory budget isn't cached"""
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            self.discard(key)
+            self._put_memory(key, (time.monotonic() + (self.ttl if ttl is None else ttl), frozenset(servers), data))
+
+
+    def discard(self, key: Hashable):
+        """Drop entry if present"""
+        with self._lock:
+            if key in self._memory:
+                self._drop_memory(key)
+            if key in self._disk:
+                self._drop_disk(key)
+
+
+    def invalidate(self, predicate: Callable[[Hashable, frozenset], bool] = None) -> int:
+        """Drop entries matching the predicate of key and involved servers or all entries if it's not specified"""
+        with self._lock:
+            memory_keys = [key for key, entry in self._memory.items() if predicate is None or predicate(key, entry[1])]
+            for key in memory_keys:
+                self._drop_memory(key)
+
+            disk_keys = [key for key, entry in self._disk.items() if predicate is None or predicate(key, entry[1])]
+            for key in disk_keys:
+                self._drop_disk(key)
+
+            return len(memory_keys) + len(disk_keys)
+
+
+    def invalidate_server(self, server_name: str) -> int:
+        """Drop all cached results of the queries involving the foreign server"""
+        return self.invalidate(lambda _, servers: server_name in servers)
+
+
+    def stats(self) -> Dict:
+        """Cache usage statistics"""
+        with self._lock:
+            return {
+                'size': len(self._memory) + len(self._disk),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+    def _put_memory(self, key: Hashable, entry: Tuple):
+        """Store entry in memory. Evicts least recently used entries over the budget"""
+        self._memory[key] = entry
+        self._memory_bytes += len(entry[2])
+
+        while self._memory_bytes > self.max_bytes:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted[2])
+            if self.spill_dir and evicted[0] > time.monotonic():
+                self._spill(evicted_key, evicted)
+
+
+    def _spill(self, key: Hashable, entry: Tuple):
+        """Move evicted entry to the disk. Evicts least recently used spilled entries over the disk budget"""
+        expires, servers, data = entry
+        if len(data) > self.max_disk_bytes:
+            return
+
+        path = os.path.join(self.spill_dir, hashlib.sha256(repr(key).encode()).hexdigest())
+        try:
+            with open(path, 'wb') as f:
+                f.write(data)
+        except OSError:
+            return
+
+        self._disk[key] = (expires, servers, path, len(data))
+        self._disk_bytes += len(data)
+
+        while self._disk_bytes > self.max_disk_bytes:
+            self._drop_disk(next(iter(self._disk)))
+
+
+    def _drop_memory(self, key: Hashable):
+        entry = self._memory.pop(key)
+        self._memory_bytes -= len(entry[2])
+
+
+    def _drop_disk(self, key: Hashable, remove: bool = True):
+        entry = self._disk.pop(key)
+        self._disk_bytes -= entry[3]
+        if remove:
+            self._remove_file(entry[2])
+
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,11 +1,20 @@
 """Parsing config file"""
+from typing import Callable
+from collections.abc import Mapping, MutableMapping
 import os
+import glob
 import json
+import hashlib
+import functools
+import logging
+import threading
 
 from copy import deepcopy
-from ruamel.yaml import YAML
 
 from . import CONFIG_DIR, DEFAULT_CONFIG, USER_CONFIG, CONNECTION
+from .parallel import run_parallel
+
+logger = logging.getLogger(__name__)
 
 FDW_SPEC_SECTIONS = [
     'foreign_server',
@@ -15,8 +24,78 @@ FDW_SPEC_SECTIONS = [
     'foreign_table_column'
 ]
 
+# default config sections with tunable settings which could be overridden in the user config file
+SETTINGS_SECTIONS = [
+    'provisioning',
+    'cache',
+    'query',
+    'export',
+    'materialization',
+    'tuning_profiles',
+    'jobs',
+    'limits',
+    'watch'
+]
+
+class LazyFdwOptions(MutableMapping):
+    """
+    FDW options mapping which expands FDW specification on the first access to the FDW entry.
+    Expanded entries are kept in the memo dictionary shared by all deep copies of the mapping,
+    so every FDW specification is expanded at most once per process.
+    Assigned entries (e.g. from the user config) are local to the mapping and don't affect its copies.
+    """
+
+    def __init__(self, raw: dict, expand: Callable[[str, dict], dict], memo: dict, overrides: dict = None):
+        self.raw = raw
+        self.expand = expand
+        self.memo = memo
+        self.overrides = overrides or {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, fdw_name: str) -> dict:
+        if fdw_name in self.overrides:
+            return self.overrides[fdw_name]
+        if fdw_name not in self.memo:
+            raw = self.raw[fdw_name]
+            with self._lock:
+                if fdw_name not in self.memo:
+                    self.memo[fdw_name] = self.expand(fdw_name, raw)
+        return self.memo[fdw_name]
+
+    def __setitem__(self, fdw_name: str, value: dict):
+        self.raw[fdw_name] = value
+        self.overrides[fdw_name] = value
+
+    def __delitem__(self, fdw_name: str):
+        del self.raw[fdw_name]
+        self.overrides.pop(fdw_name, None)
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __contains__(self, fdw_name) -> bool:
+        return fdw_name in self.raw
+
+    def __deepcopy__(self, memo: dict):
+        # expanded entries are read-only, so they are shared instead of being expanded again
+        return LazyFdwOptions(deepcopy(self.raw, memo), self.expand, self.memo, deepcopy(self.overrides, memo))
+
+    def __repr__(self):
+        return f'LazyFdwOptions({list(self.raw)}, expanded={list(self.memo)})'
+
+    def to_dict(self) -> dict:
+        """Fully expanded options as a plain dictionary"""
+        return {fdw_name: self[fdw_name] for fdw_name in self}
+
+
 class ConfigParser:
     """Parsing config files"""
+    PARSE_PARALLELISM = 8
+    # fragments with these keys hold credentials and are never written to the compiled config cache
+    SECRET_KEYS = ('user_mapping', 'password')
 
     def __new__(cls, *args):
         """Config object is singleton"""
@@ -40,23 +119,119 @@ class ConfigParser:
         self.default_params = {}
         self.user_params = {}
         self.params = {}
+        self.expanded_fdw_options = {}   # fdw name -> expanded options. shared by all copies of the config
+        self.fragments = {}              # user config file path -> (size, mtime_ns, parsed content)
 
-        self.yaml = YAML(typ='safe')
-        self.yaml.allow_duplicate_keys = True
+        self._yaml = None
 
         self.parse_config()
 
         self._initialized = True
 
 
+    @property
+    def yaml(self):
+        """YAML parser. ruamel.yaml is imported only when some config file has to be parsed"""
+        if self._yaml is None:
+            from ruamel.yaml import YAML
+
+            self._yaml = YAML(typ='safe')
+            self._yaml.allow_duplicate_keys = True
+
+        return self._yaml
+
+
     def parse_default_config(self):
         "Parse default config file"
-        with open(self.default_config_file, encoding='utf-8') as f:
-            self.default_params = self.yaml.load(f)
+        cache_file = self.compiled_config_file('default', [self.default_config_file])
+        self.default_params = self.load_compiled_config(cache_file)
+
+        if self.default_params is None:
+            with open(self.default_config_file, encoding='utf-8') as f:
+                self.default_params = self.yaml.load(f)
+
+            self.save_compiled_config(cache_file, self.default_params)
 
         self.transform_default_config()
 
 
+    def compiled_config_file(self, kind: str, sources: list) -> str:
+        """
+        Path of the compiled config cache file of the given kind.
+        Its name is derived from size and modification time of the source files and this module,
+        so any change of them leads to a new file.
+        Cache is disabled if DATERO_CONFIG_CACHE environment variable is set to "0".
+        Cache directory is DATERO_CACHE_DIR or "datero" folder in the user cache directory.
+        """
+        if os.getenv('DATERO_CONFIG_CACHE', '1') == '0':
+            return None
+
+        fingerprint = hashlib.sha256()
+        for path in sources + [__file__]:
+            stat = os.stat(path)
+            fingerprint.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+
+        return os.path.join(self.cache_dir(), f'{kind}-{fingerprint.hexdigest()[:16]}.json')
+
+
+    def cache_dir(self) -> str:
+        """Compiled config cache directory"""
+        return os.getenv('DATERO_CACHE_DIR') or os.path.join(
+            os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+            'datero'
+        )
+
+
+    def load_compiled_config(self, cache_file: str):
+        """Load compiled config from the cache file. Returns None on cache miss"""
+        if cache_file is None:
+            return None
+
+        try:
+            with open(cache_file, encoding='utf-8') as f:
+                res = json.load(f)
+        except (OSError, ValueError):
+            logger.debug('Compiled config cache miss: %s', cache_file)
+            return None
+
+        logger.debug('Compiled config cache hit: %s', cache_file)
+        return res
+
+
+    def save_compiled_config(self, cache_file: str, data: dict):
+        """
+        Store compiled config into the cache file and remove outdated cache files of the same kind.
+        Config which doesn't survive JSON round trip unchanged isn't cached.
+        Cache is optional, so any failure is reported and ignored.
+        """
+        if cache_file is None:
+            return
+
+        try:
+            content = json.dumps(data)
+            if json.loads(content) != data:
+                print(f'Config contains values not representable in JSON. Not cached: {cache_file}')
+                return
+
+            cache_dir, name = os.path.split(cache_file)
+            kind = name.rsplit('-', 1)[0]
+            os.makedirs(cache_dir, exist_ok=True)
+
+            # write and rename to not expose partially written file to concurrent processes
+            # user config could contain credentials, so the file is readable by the owner only
+            tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+            with open(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(tmp_file, cache_file)
+
+            for other in os.listdir(cache_dir):
+                if other.rsplit('-', 1)[0] == kind and other.endswith('.json') and other != name:
+                    os.remove(os.path.join(cache_dir, other))
+
+        except (OSError, TypeError, ValueError) as e:
+            print(f'Failed to save compiled config cache {cache_file}: {e}')
+
+
     def parse_config(self):
         """
         Parse different config files and merge them into one configuration.
@@ -74,12 +249,39 @@ class ConfigParser:
         self.apply_env_config()
 
 
+    def reload(self) -> dict:
+        """
+        Parse config files again. Only changed fragments of the user config are parsed.
+        Params dictionary is updated in place, so the objects holding it see the new configuration.
+        On error the current configuration is kept.
+        Returns previous params.
+        """
+        current = self.params
+        default_params, user_params = self.default_params, self.user_params
+
+        try:
+            self.parse_config()
+        except Exception:
+            self.params, self.default_params, self.user_params = current, default_params, user_params
+            raise
+
+        # sections are replaced one by one and removed ones are deleted afterwards.
+        # readers in other threads never see empty config, only a mix of old and new sections
+        previous = dict(current)
+        current.update(self.params)
+        for key in previous.keys() - self.params.keys():
+            del current[key]
+        self.params = current
+
+        return previous
+
+
     def deep_merge(self, a: dict, b: dict) -> dict:
         """Merging two dictionaries of arbitrary depth"""
         res = deepcopy(a)
         for k, bv in b.items():
             av = res.get(k)
-            if isinstance(av, dict) and isinstance(bv, dict):
+            if isinstance(av, Mapping) and isinstance(bv, Mapping):
                 res[k] = self.deep_merge(av, bv)
             elif bv is not None:
                 res[k] = deepcopy(bv)
@@ -89,30 +291,48 @@ class ConfigParser:
     def transform_default_config(self):
         """
         For "fdw_options" key in the default config file check for any drivers references denoted by "version" key.
-        If present, get corresponding driver options from the "fdw_spec" folder and merge them with the default config.
+        If present, corresponding driver options from the "fdw_spec" folder are merged with the default config.
+        This is done lazily on the first access to the FDW options. Result is memoized for the life of the process.
         """
-        for fdw_name in self.default_params['fdw_options']:
-            if 'version' in self.default_params['fdw_options'][fdw_name]:
-                print(f'Expanding {fdw_name} options...')
-                version = self.default_params['fdw_options'][fdw_name]['version']
-                fdw_spec_path = os.path.join(
-                    os.path.dirname(__file__),
-                    CONFIG_DIR,
-                    'fdw_spec',
-                    fdw_name,
-                    f'{version}.yaml'
-                )
-                with open(fdw_spec_path, encoding='utf-8') as f:
-                    fdw_spec = self.yaml.load(f)
+        self.default_params['fdw_options'] = LazyFdwOptions(
+            self.default_params['fdw_options'],
+            self.expand_fdw_options,
+            self.expanded_fdw_options
+        )
+
+
+    def expand_fdw_options(self, fdw_name: str, datero_fdw_options: dict) -> dict:
+        """FDW options merged with the referenced driver specification. Expansion result is cached on disk as well"""
+        if 'version' not in datero_fdw_options:
+            return datero_fdw_options
+
+        version = datero_fdw_options['version']
+        fdw_spec_path = os.path.join(
+            os.path.dirname(__file__),
+            CONFIG_DIR,
+            'fdw_spec',
+            fdw_name,
+            f'{version}.yaml'
+        )
+
+        cache_file = self.compiled_config_file(f'fdw-{fdw_name}', [self.default_config_file, fdw_spec_path])
+        res = self.load_compiled_config(cache_file)
+
+        if res is None:
+            print(f'Expanding {fdw_name} options...')
+            with open(fdw_spec_path, encoding='utf-8') as f:
+                fdw_spec = self.yaml.load(f)
+
+            res = self.prepare_fdw_options(fdw_name, fdw_spec, datero_fdw_options)
+            self.save_compiled_config(cache_file, res)
 
-                self.prepare_fdw_options(fdw_name, fdw_spec)
+        return res
 
 
-    def prepare_fdw_options(self, fdw_name: str, fdw_spec: dict):
+    def prepare_fdw_options(self, fdw_name: str, fdw_spec: dict, datero_fdw_options: dict) -> dict:
         """
         Basing on the given FDW specification, prepare FDW options with Datero added attributes.
         """
-        datero_fdw_options = self.default_params['fdw_options'][fdw_name]
         result = {
             'name': fdw_spec['name'],
             'version': fdw_spec['version'],
@@ -188,8 +408,7 @@ class ConfigParser:
 
         #print(json.dumps(result, indent=2))
 
-        # replace the original fdw_options with the expanded one
-        self.default_params['fdw_options'][fdw_name] = result
+        return result
 
 
     def apply_user_config(self):
@@ -197,8 +416,7 @@ class ConfigParser:
         If user config file is present, apply it on top of the the default config.
         """
         if self.user_config_file is not None:
-            with open(self.user_config_file, encoding='utf-8') as f:
-                self.user_params = self.yaml.load(f)
+            self.user_params = self.load_user_config()
 
         # check if user config contains any parameters
         if self.user_params is not None:
@@ -208,13 +426,193 @@ class ConfigParser:
                     'port'    : self.user_params[CONNECTION].get('port'    , self.params[CONNECTION]['port'    ]),
                     'database': self.user_params[CONNECTION].get('database', self.params[CONNECTION]['database']),
                     'username': self.user_params[CONNECTION].get('username', self.params[CONNECTION]['username']),
-                    'password': self.user_params[CONNECTION].get('password', self.params[CONNECTION]['password'])
+                    'password': self.user_params[CONNECTION].get('password', self.params[CONNECTION]['password']),
+                    'pool'    : self.deep_merge(
+                        self.params[CONNECTION].get('pool') or {},
+                        self.user_params[CONNECTION].get('pool') or {}
+                    )
                 })
 
             key = 'servers'
             if key in self.user_params and self.user_params[key] is not None:
                 self.params[key] = self.user_params[key]
 
+            for key in SETTINGS_SECTIONS:
+                if key in self.user_params and self.user_params[key] is not None:
+                    self.params[key] = self.deep_merge(self.params.get(key) or {}, self.user_params[key])
+
+
+    def user_config_fragments(self) -> list:
+        """
+        User config files. Config file could be a single file, a directory or a glob pattern.
+        Directory stands for all *.yaml and *.yml files in it and its subdirectories.
+        Files are sorted by path, so the merge result doesn't depend on the file system listing order.
+        """
+        path = self.user_config_file
+
+        if os.path.isdir(path):
+            patterns = [os.path.join(path, '**', '*.yaml'), os.path.join(path, '**', '*.yml')]
+        elif any(c in path for c in '*?['):
+            patterns = [path]
+        else:
+            return [path]
+
+        files = sorted({f for pattern in patterns for f in glob.glob(pattern, recursive=True) if os.path.isfile(f)})
+        if len(files) == 0:
+            raise FileNotFoundError(f'No config files found by "{path}"')
+
+        return files
+
+
+    def fragments_snapshot_file(self) -> str:
+        """Compiled config cache file of the parsed user config fragments. One per config directory or glob"""
+        if os.getenv('DATERO_CONFIG_CACHE', '1') == '0':
+            return None
+
+        digest = hashlib.sha256(os.path.abspath(self.user_config_file).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir(), f'user_{digest}-fragments.json')
+
+
+    def parse_fragment(self, path: str) -> dict:
+        """Parse single config file. Own parser instance is used, so files could be parsed concurrently"""
+        from ruamel.yaml import YAML
+
+        yaml = YAML(typ='safe')
+        yaml.allow_duplicate_keys = True
+
+        with open(path, encoding='utf-8') as f:
+            return yaml.load(f)
+
+
+    def load_user_config(self) -> dict:
+        """
+        Parse user config file or fragments of the config directory/glob and merge them into one config.
+        Fragment is parsed only if its size or modification time is changed since the previous parsing.
+        Previous results are kept in memory and, for directory/glob config, in the compiled config cache.
+        Changed fragments are parsed concurrently.
+        """
+        files = self.user_config_fragments()
+
+        if files == [self.user_config_file]:
+            stat = os.stat(self.user_config_file)
+            cached = self.fragments.get(self.user_config_file)
+
+            if cached is None or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+                with open(self.user_config_file, encoding='utf-8') as f:
+                    cached = (stat.st_size, stat.st_mtime_ns, self.yaml.load(f))
+                self.fragments = {self.user_config_file: cached}
+
+            return cached[2]
+
+        snapshot_file = self.fragments_snapshot_file()
+        if len(self.fragments) == 0 and snapshot_file is not None:
+            # snapshot written by older version could hold credentials. such entries are reparsed and dropped
+            self.fragments = {
+                path: tuple(entry) for path, entry in (self.load_compiled_config(snapshot_file) or {}).items()
+                if not self.has_secrets(entry[2])
+            }
+
+        stats = {path: os.stat(path) for path in files}
+        changed = [
+            path for path in files
+            if path not in self.fragments or self.fragments[path][:2] != (stats[path].st_size, stats[path].st_mtime_ns)
+        ]
+
+        res = run_parallel(
+            {path: functools.partial(self.parse_fragment, path) for path in changed},
+            ConfigParser.PARSE_PARALLELISM
+        )
+        errors = [f'{path}: {outcome["error"]}' for path, outcome in res.items() if outcome['status'] == 'error']
+        if len(errors) > 0:
+            raise ValueError('Failed to parse config files:\n' + '\n'.join(errors))
+
+        fragments = {
+            path: (
+                stats[path].st_size,
+                stats[path].st_mtime_ns,
+                res[path]['result'] if path in res else self.fragments[path][2]
+            )
+            for path in files
+        }
+        user_params = self.merge_fragments({path: entry[2] for path, entry in fragments.items()})
+
+        if len(changed) > 0 or fragments.keys() != self.fragments.keys():
+            logger.debug('Parsed %d of %d config files', len(changed), len(files))
+            self.save_fragments_snapshot(snapshot_file, fragments)
+        self.fragments = fragments
+
+        return user_params
+
+
+    @staticmethod
+    def has_secrets(value) -> bool:
+        """Whether parsed config contains credentials at any level"""
+        if isinstance(value, dict):
+            return any(key in ConfigParser.SECRET_KEYS or ConfigParser.has_secrets(val) for key, val in value.items())
+        if isinstance(value, list):
+            return any(ConfigParser.has_secrets(val) for val in value)
+        return False
+
+
+    def save_fragments_snapshot(self, snapshot_file: str, fragments: dict):
+        """
+        Store parsed fragments into the compiled config cache.
+        Fragments with credentials and the ones not representable in JSON are skipped, so they are parsed every run.
+        """
+        if snapshot_file is None:
+            return
+
+        snapshot = {}
+        for path, entry in fragments.items():
+            if self.has_secrets(entry[2]):
+                continue
+            try:
+                if json.loads(json.dumps(entry[2])) == entry[2]:
+                    snapshot[path] = list(entry)
+            except (TypeError, ValueError):
+                pass
+
+        self.save_compiled_config(snapshot_file, snapshot)
+
+
+    def merge_fragments(self, fragments: dict) -> dict:
+        """
+        Merge user config fragments into one config.
+        Every foreign server must be defined in a single fragment.
+        Other sections could be split between fragments, but any setting could be set by one fragment only.
+        """
+        res = {}
+        origin = {}     # setting path -> fragment which set it
+
+        def merge(target: dict, source: dict, path: tuple, fragment: str):
+            for key, value in source.items():
+                if value is None:
+                    continue
+
+                setting = path + (key,)
+                leaf = not isinstance(value, dict) or path == ('servers',)
+
+                if key in target and (leaf or not isinstance(target[key], dict)):
+                    name = f'Foreign server "{key}"' if path == ('servers',) else \
+                        f'Config setting "{".".join(str(item) for item in setting)}"'
+                    raise ValueError(f'{name} is defined in both {origin[setting]} and {fragment}')
+
+                if leaf:
+                    target[key] = value
+                else:
+                    target.setdefault(key, {})
+                    merge(target[key], value, setting, fragment)
+                origin.setdefault(setting, fragment)
+
+        for fragment, params in fragments.items():
+            if params is None:
+                continue
+            if not isinstance(params, dict):
+                raise ValueError(f'Config file {fragment} must contain a mapping of config sections')
+            merge(res, params, (), fragment)
+
+        return res
+
 
     def apply_env_config(self):
         """
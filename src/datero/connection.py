@@ -1,31 +1,52 @@
 """Singleton class for postgres database connection"""
-from typing import Dict
+from typing import Callable, Dict
 from contextlib import contextmanager
+import threading
 
 from .pool import RestartableConnectionPool
 
 
+class Session:
+    """
+    Unit of work.
+    Holds single connection with an open transaction, which is shared by all API calls accepting the session.
+    Transaction is committed when session scope is left successfully and rolled back on error.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.callbacks = []
+
+
+    def after_commit(self, callback: Callable[[], None]):
+        """Run callback once session transaction is committed. Callbacks are dropped on rollback"""
+        self.callbacks.append(callback)
+
+
 class ConnectionPool:
     """Connection Pool Singleton class"""
     MIN_CONNECTIONS = 1
-    MAX_CONNECTIONS = 2
+    MAX_CONNECTIONS = 10
+    _lock = threading.Lock()
 
     def __new__(cls, *_):
         """Connection object is singleton"""
-        if not hasattr(cls, 'instance'):
-            cls.instance = super(ConnectionPool, cls).__new__(cls)
-            cls._initialized = False
+        with cls._lock:
+            if not hasattr(cls, 'instance'):
+                cls.instance = super(ConnectionPool, cls).__new__(cls)
+                cls._initialized = False
         return cls.instance
 
 
     def __init__(self, config: Dict):
-        if self._initialized:
-            return
+        with ConnectionPool._lock:
+            if self._initialized:
+                return
 
-        self.config = config
-        self.pool = self.init_pool()
+            self.config = config
+            self.pool = self.init_pool()
 
-        self._initialized = True
+            self._initialized = True
 
 
     def __del__(self):
@@ -35,9 +56,20 @@ class ConnectionPool:
 
     def init_pool(self):
         """Instantiating connection from config credentials"""
+        pool_config = self.config.get('pool') or {}
+        # null can't override the default value on config merge, so 0 stands for waiting forever
+        timeout = pool_config.get('timeout') or None
+
         return RestartableConnectionPool(
-            ConnectionPool.MIN_CONNECTIONS,
-            ConnectionPool.MAX_CONNECTIONS,
+            pool_config.get('min_size', ConnectionPool.MIN_CONNECTIONS),
+            pool_config.get('max_size', ConnectionPool.MAX_CONNECTIONS),
+            timeout=timeout,
+            max_idle=pool_config.get('max_idle'),
+            validation=pool_config.get('validation', RestartableConnectionPool.VALIDATE_IDLE),
+            validation_idle_time=pool_config.get('validation_idle_time', 30),
+            reconnect_attempts=pool_config.get('reconnect_attempts', 10),
+            reconnect_backoff=pool_config.get('reconnect_backoff', 0.1),
+            reconnect_max_backoff=pool_config.get('reconnect_max_backoff', 5),
             dbname=self.config['database'],
             user=self.config['username'],
             password=self.config['password'],
@@ -56,13 +88,57 @@ class ConnectionPool:
 
 
     @contextmanager
-    def connection(self):
+    def connection(self, session: Session = None):
+        """
+        Get connection from the pool and commit changes once done.
+        If session is specified, its connection is used and transaction is left to be finished by the session owner.
+        """
+        if session is not None:
+            yield session.conn
+            return
+
         conn = self.get_conn()
         try:
             yield conn
         except Exception:
-            conn.rollback()  # rollback changes in case of error
+            if conn.closed:
+                # connection is lost. most probably server was restarted after FDW crash
+                self.pool.mark_failed()
+            else:
+                conn.rollback()  # rollback changes in case of error
             raise
         finally:
-            conn.commit()  # commit changes before returning the connection
-            self.put_conn(conn)
+            try:
+                if not conn.closed:
+                    conn.commit()  # commit changes before returning the connection
+            finally:
+                self.put_conn(conn)
+
+
+    @contextmanager
+    def transaction(self, session: Session = None):
+        """
+        Run enclosed operations in a single transaction on a single connection.
+        If session is specified, operations join it instead of starting a new one.
+        """
+        if session is not None:
+            yield session
+            return
+
+        with self.connection() as conn:
+            session = Session(conn)
+            yield session
+
+        for callback in session.callbacks:
+            callback()
+
+
+    def after_commit(self, session: Session, callback: Callable[[], None]):
+        """
+        Run callback once changes are committed.
+        Without session changes are expected to be committed already, so it's run right away.
+        """
+        if session is None:
+            callback()
+        else:
+            session.after_commit(callback)
@@ -0,0 +1,329 @@
+"""Pushdown analysis of federated queries"""
+from typing import Dict, List
+import json
+import re
+import psycopg2
+from psycopg2 import sql
+
+from . import CONNECTION
+from .connection import ConnectionPool, Session
+from .fdw.util import FdwType
+
+# EXPLAIN VERBOSE property holding the query sent to the remote server
+REMOTE_QUERY_KEYS = {
+    FdwType.POSTGRES.value: 'Remote SQL',
+    FdwType.MYSQL.value: 'Remote query',
+    FdwType.ORACLE.value: 'Oracle query',
+    FdwType.SQLITE.value: 'SQLite query',
+    FdwType.DUCKDB.value: 'DuckDB query',
+    FdwType.TDS.value: 'Remote query',
+    FdwType.MONGO.value: 'Foreign Namespace',
+}
+
+# operations each FDW is able to push down to the remote server
+PUSHDOWN_CAPABILITIES = {
+    FdwType.POSTGRES.value: {'filter', 'join', 'sort', 'aggregate', 'limit'},
+    FdwType.MYSQL.value: {'filter', 'join', 'sort', 'aggregate', 'limit'},
+    FdwType.ORACLE.value: {'filter', 'join', 'sort'},
+    FdwType.SQLITE.value: {'filter', 'join', 'sort', 'aggregate', 'limit'},
+    FdwType.DUCKDB.value: {'filter', 'sort', 'aggregate', 'limit'},
+    FdwType.MONGO.value: {'filter', 'join', 'sort', 'aggregate', 'limit'},
+    FdwType.TDS.value: {'filter'},
+    FdwType.FILE.value: set(),
+    FdwType.REDIS.value: set(),
+}
+
+# plan node types evaluated locally on top of the foreign scans
+LOCAL_NODES = {
+    'Hash Join': 'join',
+    'Merge Join': 'join',
+    'Nested Loop': 'join',
+    'Sort': 'sort',
+    'Incremental Sort': 'sort',
+    'Aggregate': 'aggregate',
+    'Limit': 'limit',
+}
+
+RELATION_PATTERN = re.compile(r'\(([^\s().]+)\.([^\s()]+)')
+
+# leading whitespace, comments and opening parentheses preceding the first keyword of a statement
+LEADING_PATTERN = re.compile(r'(?:\s+|--[^\n]*|/\*.*?\*/|\()+', re.S)
+KEYWORD_PATTERN = re.compile(r'[A-Za-z]+')
+
+# statements returning rows without side effects on their own
+QUERY_KEYWORDS = {'SELECT', 'WITH', 'VALUES', 'TABLE'}
+# statements accepted by EXPLAIN
+EXPLAINABLE_KEYWORDS = QUERY_KEYWORDS | {'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'EXECUTE'}
+
+
+def first_keyword(stmt: str) -> str:
+    """Upper cased first keyword of the statement"""
+    leading = LEADING_PATTERN.match(stmt)
+    keyword = KEYWORD_PATTERN.match(stmt, leading.end() if leading else 0)
+    return keyword.group(0).upper() if keyword else ''
+
+
+class PushdownAdvisor:
+    """
+    Detects parts of a federated query which are evaluated locally instead of being pushed down to the remote servers.
+    Query plan is taken from EXPLAIN (VERBOSE, FORMAT JSON). Foreign Scan nodes are matched with their foreign servers
+    and FDW types to extract the remote query and to tell apart operations that FDW could push down from the ones it can't.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.pool = ConnectionPool(self.config[CONNECTION])
+
+
+    @staticmethod
+    def is_query(stmt) -> bool:
+        """Whether statement is a query. Composed statements are built by Datero itself and are always queries"""
+        return not isinstance(stmt, str) or first_keyword(stmt) in QUERY_KEYWORDS
+
+
+    @staticmethod
+    def is_explainable(stmt) -> bool:
+        """Whether statement could be examined by EXPLAIN"""
+        return not isinstance(stmt, str) or first_keyword(stmt) in EXPLAINABLE_KEYWORDS
+
+
+    def explain(
+        self,
+        stmt: str,
+        params: Dict = None,
+        analyze: bool = False,
+        session: Session = None,
+        quiet: bool = False
+    ) -> Dict:
+        """
+        Query plan in JSON format.
+        With "analyze" the query is actually executed to get real row counts.
+        Its changes are always rolled back. Within session up to a savepoint set before the statement.
+        With "quiet" errors are not printed and don't abort the session transaction.
+        """
+        options = 'ANALYZE, VERBOSE, FORMAT JSON' if analyze else 'VERBOSE, FORMAT JSON'
+        query = sql.SQL('EXPLAIN ({options}) {stmt}').format(
+            options=sql.SQL(options),
+            stmt=stmt if isinstance(stmt, sql.Composable) else sql.SQL(stmt)
+        )
+        savepoint = (analyze or quiet) and session is not None
+
+        try:
+            with self.pool.connection(session) as conn:
+                with conn.cursor() as cur:
+                    if savepoint:
+                        cur.execute('SAVEPOINT datero_explain')
+                    try:
+                        cur.execute(query, params)
+                        res = cur.fetchone()[0]
+                    except psycopg2.Error:
+                        if savepoint:
+                            cur.execute('ROLLBACK TO SAVEPOINT datero_explain')
+                            cur.execute('RELEASE SAVEPOINT datero_explain')
+                        raise
+
+                    if savepoint:
+                        if analyze:
+                            cur.execute('ROLLBACK TO SAVEPOINT datero_explain')
+                        cur.execute('RELEASE SAVEPOINT datero_explain')
+
+                if analyze and session is None:
+                    conn.rollback()
+        except psycopg2.Error as e:
+            if not quiet:
+                print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}\nParams: {params}')
+            raise e
+
+        # json type is decoded by psycopg2, but text is returned as is
+        return (json.loads(res) if isinstance(res, str) else res)[0]['Plan']
+
+
+    def foreign_tables(self, session: Session = None) -> Dict:
+        """Foreign server and FDW name of every foreign table keyed by (schema, table)"""
+        query = """
+            SELECT n.nspname                    AS schema_name
+                 , c.relname                    AS table_name
+                 , s.srvname                    AS server_name
+                 , w.fdwname                    AS fdw_name
+              FROM pg_foreign_table             ft
+              JOIN pg_class                     c
+                ON c.oid                        = ft.ftrelid
+              JOIN pg_namespace                 n
+                ON n.oid                        = c.relnamespace
+              JOIN pg_foreign_server            s
+                ON s.oid                        = ft.ftserver
+              JOIN pg_foreign_data_wrapper      w
+                ON w.oid                        = s.srvfdw
+        """
+
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                return {(row[0], row[1]): {'server': row[2], 'fdw': row[3]} for row in cur.fetchall()}
+
+
+    def explain_pushdown(self, stmt: str, params: Dict = None, analyze: bool = False, session: Session = None) -> Dict:
+        """
+        Analyze query plan for operations not pushed down to the remote servers.
+        Returns:
+            scans: Foreign Scan nodes with their remote query, local filter and estimated rows/bytes shipped
+            issues: filters, joins, sorts, aggregates and limits evaluated locally
+            rows_shipped, bytes_shipped: totals over all Foreign Scan nodes
+        """
+        plan = self.explain(stmt, params, analyze, session)
+        tables = self.foreign_tables(session)
+
+        scans = []
+        issues = []
+        self.walk(plan, tables, scans, issues, analyze)
+
+        return {
+            'plan': plan,
+            'scans': scans,
+            'issues': issues,
+            'rows_shipped': sum(scan['rows'] for scan in scans),
+            'bytes_shipped': sum(scan['bytes'] for scan in scans)
+        }
+
+
+    def servers(self, stmt: str, params: Dict = None, session: Session = None, quiet: bool = False) -> set:
+        """Names of the foreign servers scanned by the query. See "explain" for "quiet" flag"""
+        tables = self.foreign_tables(session)
+        res = set()
+
+        def visit(node: Dict):
+            if node['Node Type'] == 'Foreign Scan':
+                scan = self.foreign_scan(node, tables, False)
+                if scan['server'] is not None:
+                    res.add(scan['server'])
+            for child in node.get('Plans', []):
+                visit(child)
+
+        visit(self.explain(stmt, params, False, session, quiet))
+        return res
+
+
+    def walk(self, node: Dict, tables: Dict, scans: List[Dict], issues: List[Dict], analyze: bool) -> List[Dict]:
+        """Collect Foreign Scan nodes of the plan subtree and issues of the local nodes above them"""
+        found = []
+        for child in node.get('Plans', []):
+            found.extend(self.walk(child, tables, scans, issues, analyze))
+
+        if node['Node Type'] == 'Foreign Scan':
+            scan = self.foreign_scan(node, tables, analyze)
+            scans.append(scan)
+
+            if scan['local_filter'] is not None:
+                issues.append(self.issue('filter', scan['local_filter'], [scan]))
+
+            return found + [scan]
+
+        operation = LOCAL_NODES.get(node['Node Type'])
+        if operation is not None and len(found) > 0:
+            if operation == 'join':
+                detail = node.get('Hash Cond') or node.get('Merge Cond') or node.get('Join Filter') or node['Node Type']
+            elif operation == 'sort':
+                detail = ', '.join(node.get('Sort Key', []))
+            elif operation == 'aggregate':
+                detail = ', '.join(node.get('Group Key', [])) or node.get('Strategy', 'Plain')
+            else:
+                detail = node['Node Type']
+
+            issues.append(self.issue(operation, detail, found))
+
+            if node.get('Filter') is not None:
+                issues.append(self.issue('filter', node['Filter'], found))
+
+        return found
+
+
+    def foreign_scan(self, node: Dict, tables: Dict, analyze: bool) -> Dict:
+        """Details of a single Foreign Scan node"""
+        if 'Relation Name' in node:
+            relations = [(node.get('Schema'), node['Relation Name'])]
+        else:
+            # join or aggregate pushed down as a whole: "(public.t1 a) INNER JOIN (public.t2 b)"
+            relations = RELATION_PATTERN.findall(node.get('Relations', ''))
+
+        owner = next((tables[relation] for relation in relations if relation in tables), {})
+        fdw = owner.get('fdw')
+
+        key = REMOTE_QUERY_KEYS.get(fdw)
+        remote_sql = node.get(key) if key is not None else None
+        if remote_sql is None:
+            # unknown FDW. take any property looking like the remote query
+            remote_sql = next(
+                (value for name, value in node.items() if name.lower().endswith(('sql', 'query'))),
+                None
+            )
+
+        # without "analyze" it's the planner estimate of rows left after the local filter, so it's a lower bound
+        rows = node['Plan Rows']
+        if analyze and 'Actual Rows' in node:
+            # rows removed by the local filter were shipped as well
+            rows = (node['Actual Rows'] + node.get('Rows Removed by Filter', 0)) * node.get('Actual Loops', 1)
+
+        return {
+            'relations': ['.'.join(filter(None, relation)) for relation in relations],
+            'server': owner.get('server'),
+            'fdw': fdw,
+            'operation': node.get('Operation', 'Select'),
+            'remote_sql': remote_sql,
+            'local_filter': node.get('Filter'),
+            'rows': rows,
+            'width': node['Plan Width'],
+            'bytes': rows * node['Plan Width']
+        }
+
+
+    def issue(self, operation: str, detail: str, scans: List[Dict]) -> Dict:
+        """
+        Locally evaluated operation over the foreign scans.
+        It's "pushable" if all scans belong to the same foreign server and its FDW supports pushdown of such operation.
+        Pushable issues usually mean that expression isn't shippable (non-immutable or non built-in functions,
+        type casts, collations) or that the remote estimates made the local plan cheaper.
+        """
+        servers = sorted({scan['server'] for scan in scans if scan['server'] is not None})
+        fdws = sorted({scan['fdw'] for scan in scans if scan['fdw'] is not None})
+
+        pushable = len(servers) == 1 and len(fdws) == 1 \
+            and operation in PUSHDOWN_CAPABILITIES.get(fdws[0], set())
+
+        if len(servers) > 1:
+            reason = 'spans several foreign servers'
+        elif pushable:
+            reason = f'supported by {fdws[0]}, but not pushed down'
+        else:
+            reason = f'not supported by {", ".join(fdws) or "FDW"}'
+
+        return {
+            'operation': operation,
+            'detail': detail,
+            'servers': servers,
+            'fdw': fdws,
+            'relations': sorted({relation for scan in scans for relation in scan['relations']}),
+            'pushable': pushable,
+            'reason': reason
+        }
+
+
+    def render(self, report: Dict) -> List[str]:
+        """Human readable report lines"""
+        lines = []
+        for scan in report['scans']:
+            lines.append(
+                f'Foreign Scan on {", ".join(scan["relations"]) or "?"} '
+                f'[server: {scan["server"]}, fdw: {scan["fdw"]}] '
+                f'rows: {scan["rows"]}, bytes: {scan["bytes"]}'
+            )
+            if scan['remote_sql'] is not None:
+                lines.append(f'    remote: {scan["remote_sql"]}')
+
+        for issue in report['issues']:
+            lines.append(
+                f'{"!" if issue["pushable"] else "-"} local {issue["operation"]}: {issue["detail"]} '
+                f'on {", ".join(issue["relations"])} ({issue["reason"]})'
+            )
+
+        lines.append(f'Estimated rows shipped: {report["rows_shipped"]}, bytes: {report["bytes_shipped"]}')
+        return lines
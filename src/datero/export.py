@@ -0,0 +1,266 @@
+"""Bulk export of federated queries results"""
+from typing import BinaryIO, Callable, Dict, Iterator, Union
+import os
+import threading
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import encodings
+
+from . import CONNECTION
+from .connection import ConnectionPool, Session
+
+FORMATS = ('csv', 'parquet', 'arrow')
+
+
+class Export:
+    """
+    Bulk export of federated queries results.
+    Data is streamed by COPY (query) TO STDOUT straight into the sink without building Python row objects.
+    Parquet and Arrow IPC outputs are produced from the same CSV stream by pyarrow in fixed size record batches.
+    """
+    BATCH_SIZE = 65536
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.pool = ConnectionPool(self.config[CONNECTION])
+
+    @property
+    def batch_size(self) -> int:
+        """Default number of rows in the record batch of Parquet/Arrow output"""
+        return (self.config.get('export') or {}).get('batch_size', Export.BATCH_SIZE)
+
+
+    def export(
+        self,
+        stmt: str,
+        sink: Union[str, BinaryIO],
+        fmt: str = 'csv',
+        params: Dict = None,
+        batch_size: int = None,
+        session: Session = None,
+        progress: Callable[[float, str], None] = None
+    ):
+        """
+        Export query result into the file path or binary file-like sink in the given format.
+        Optional "progress" callback is called with number of exported bytes in the message.
+        Total size is unknown upfront, so completed fraction is None.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f'Unknown export format "{fmt}". Supported formats: {", ".join(FORMATS)}')
+
+        if isinstance(sink, str):
+            with open(sink, 'wb') as f:
+                return self.export(stmt, f, fmt, params, batch_size, session, progress)
+
+        if fmt == 'csv':
+            self.to_csv(stmt, sink, params, session, progress)
+        else:
+            self.to_arrow(stmt, sink, fmt, params, batch_size, session, progress)
+
+        print(f'Query result successfully exported in {fmt} format')
+
+
+    def copy_query(self, cur, stmt: str, params: Dict = None) -> sql.Composed:
+        """COPY statement for the query with inlined bind values"""
+        query = cur.mogrify(stmt, params).decode(encodings[cur.connection.encoding])
+        return sql.SQL('COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)').format(
+            query=sql.SQL(query.strip().rstrip(';'))
+        )
+
+
+    def to_csv(
+        self,
+        stmt: str,
+        sink: BinaryIO,
+        params: Dict = None,
+        session: Session = None,
+        progress: Callable[[float, str], None] = None,
+        utc: bool = False
+    ):
+        """
+        Stream query result as CSV with header into the sink.
+        With "utc" timestamps are rendered in UTC instead of the session time zone.
+        """
+        if progress is not None:
+            sink = ProgressSink(sink, progress)
+
+        copy_stmt = None
+        try:
+            with self.pool.connection(session) as conn:
+                with conn.cursor() as cur:
+                    if utc:
+                        cur.execute("SELECT current_setting('TimeZone')")
+                        time_zone = cur.fetchone()[0]
+                        cur.execute("SET LOCAL TimeZone = 'UTC'")
+
+                    copy_stmt = self.copy_query(cur, stmt, params)
+                    cur.copy_expert(copy_stmt, sink)
+
+                    # setting is reverted at transaction end. session transaction goes on, so it's restored explicitly
+                    if utc and session is not None:
+                        cur.execute("SELECT set_config('TimeZone', %s, true)", (time_zone,))
+
+            # error raised by the progress callback is deferred to not break COPY protocol
+            if progress is not None and sink.error is not None:
+                raise sink.error
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {copy_stmt or stmt}')
+            raise e
+
+
+    def describe(self, stmt: str, params: Dict = None, session: Session = None) -> list:
+        """
+        Result columns of the query as (name, type oid) pairs. Query is not executed.
+        Within session objects created or changed by its uncommitted transaction are described as it sees them.
+        """
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                query = cur.mogrify(stmt, params).decode(encodings[conn.encoding]).strip().rstrip(';')
+                cur.execute(sql.SQL('SELECT * FROM ({query}) q LIMIT 0').format(query=sql.SQL(query)))
+                return [(col.name, col.type_code) for col in cur.description]
+
+
+    def to_arrow(
+        self,
+        stmt: str,
+        sink: BinaryIO,
+        fmt: str = 'parquet',
+        params: Dict = None,
+        batch_size: int = None,
+        session: Session = None,
+        progress: Callable[[float, str], None] = None
+    ):
+        """
+        Stream query result into the sink as Parquet file or Arrow IPC file.
+        COPY output is piped from a background thread into pyarrow streaming CSV reader.
+        Column types are derived from the query result description, not inferred from data.
+        """
+        try:
+            import pyarrow as pa
+            from pyarrow import csv as pa_csv
+        except ImportError as e:
+            raise ImportError('Parquet/Arrow export requires "pyarrow" package: pip install datero[export]') from e
+
+        batch_size = batch_size or self.batch_size
+        columns = self.describe(stmt, params, session)
+        column_types = {name: arrow_type(pa, oid) for name, oid in columns}
+
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def produce():
+            try:
+                with os.fdopen(write_fd, 'wb') as f:
+                    # timestamps are parsed back unambiguously only in UTC
+                    self.to_csv(stmt, f, params, session, progress, utc=True)
+            except Exception as e:
+                errors.append(e)
+
+        producer = threading.Thread(target=produce, name='datero-export', daemon=True)
+        producer.start()
+
+        writer = None
+        try:
+            with os.fdopen(read_fd, 'rb') as source:
+                reader = pa_csv.open_csv(
+                    source,
+                    read_options=pa_csv.ReadOptions(use_threads=True),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types=column_types,
+                        true_values=['t'],
+                        false_values=['f'],
+                        strings_can_be_null=True,
+                        quoted_strings_can_be_null=False
+                    )
+                )
+
+                if fmt == 'parquet':
+                    from pyarrow import parquet as pq
+                    writer = pq.ParquetWriter(sink, reader.schema)
+                else:
+                    writer = pa.ipc.new_file(sink, reader.schema)
+
+                for batch in rebatch(pa, reader, reader.schema, batch_size):
+                    if fmt == 'parquet':
+                        writer.write_table(pa.Table.from_batches([batch]), row_group_size=batch_size)
+                    else:
+                        writer.write_batch(batch)
+        except Exception:
+            # failed COPY truncates the stream. report the original error instead of the parsing one
+            producer.join()
+            if errors:
+                raise errors[0]
+            raise
+        finally:
+            if writer is not None:
+                writer.close()
+            producer.join()
+
+        if errors:
+            raise errors[0]
+
+
+class ProgressSink:
+    """
+    Binary sink wrapper which reports number of written bytes every "step" bytes.
+    Error of the callback is kept to be raised once writing is done.
+    """
+    STEP = 16 * 1024 * 1024
+
+    def __init__(self, sink: BinaryIO, progress: Callable[[float, str], None], step: int = None):
+        self.sink = sink
+        self.progress = progress
+        self.step = step or ProgressSink.STEP
+        self.written = 0
+        self.reported = 0
+        self.error = None
+
+    def write(self, data) -> int:
+        res = self.sink.write(data)
+        self.written += len(data)
+
+        if self.error is None and self.written - self.reported >= self.step:
+            self.reported = self.written
+            try:
+                self.progress(None, f'{self.written} bytes exported')
+            except Exception as e:
+                self.error = e
+
+        return res
+
+
+def arrow_type(pa, oid: int):
+    """Arrow type for the postgres type oid. Not listed types are exported as strings"""
+    return {
+        16: pa.bool_(),                 # bool
+        20: pa.int64(),                 # int8
+        21: pa.int16(),                 # int2
+        23: pa.int32(),                 # int4
+        700: pa.float32(),              # float4
+        701: pa.float64(),              # float8
+        1082: pa.date32(),              # date
+        1114: pa.timestamp('us'),       # timestamp
+        1184: pa.timestamp('us', 'UTC') # timestamptz
+    }.get(oid, pa.string())
+
+
+def rebatch(pa, batches: Iterator, schema, batch_size: int) -> Iterator:
+    """Regroup stream of record batches of arbitrary size into batches of exactly "batch_size" rows. Last one could be smaller"""
+    pending = []
+    rows = 0
+
+    for batch in batches:
+        pending.append(batch)
+        rows += batch.num_rows
+
+        while rows >= batch_size:
+            table = pa.Table.from_batches(pending, schema)
+            yield from table.slice(0, batch_size).combine_chunks().to_batches(batch_size)
+
+            rest = table.slice(batch_size)
+            pending = rest.to_batches()
+            rows = rest.num_rows
+
+    if rows > 0:
+        yield from pa.Table.from_batches(pending, schema).combine_chunks().to_batches(batch_size)
@@ -1,9 +1,11 @@
 """Postgres Foreign Data Wrapper objects management"""
-from .util import FdwType, ImportType
+from .util import FdwType, ImportType, ImportMode
 from .extension import Extension
 from .schema import Schema
 from .server import Server
 from .user import UserMapping
+from .plan import Planner, Change
+from .materialization import Materialization, RefreshScheduler
 
 
 
@@ -12,6 +14,11 @@ __all__ = [
     'Schema',
     'Server',
     'UserMapping',
+    'Planner',
+    'Change',
+    'Materialization',
+    'RefreshScheduler',
     'FdwType',
-    'ImportType'
+    'ImportType',
+    'ImportMode'
 ]
\ No newline at end of file
@@ -1,5 +1,5 @@
 """Activate required extensions"""
-from typing import Dict
+from typing import Dict, List
 import psycopg2
 
 from .. import CONNECTION, DATERO_FDW_SCHEMA
@@ -18,22 +18,32 @@ class Extension:
         return self.config['fdw_list']
 
 
-    def fdw_list(self):
-        """Get list of available FDWs"""
-        query = """
+    def fdw_list_query(self) -> str:
+        """Query of the available FDWs. Shared by sync and async API"""
+        return """
             SELECT e.name                       AS name
                  , e.comment                    AS comment
               FROM pg_available_extensions      e
              WHERE e.name                       LIKE '%fdw%'
              ORDER BY e.name
         """
+
+
+    def fdw_list_result(self, rows: List[tuple]) -> List[Dict]:
+        """Available FDWs from the query rows"""
+        return [{ 'name': val[0], 'description': val[1] } for val in rows]
+
+
+    def fdw_list(self):
+        """Get list of available FDWs"""
+        query = self.fdw_list_query()
         try:
             with self.pool.connection() as conn:
                 with conn.cursor() as cur:
                     cur.execute(query)
                     rows = cur.fetchall()
 
-            res = [{ 'name': val[0], 'description': val[1] } for val in rows]
+            res = self.fdw_list_result(rows)
             return res
 
         except psycopg2.Error as e:
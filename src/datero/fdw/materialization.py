@@ -0,0 +1,432 @@
+"""Local materialization of foreign tables"""
+
+from typing import Dict, List
+from enum import Enum
+import threading
+import time
+import psycopg2
+from psycopg2 import sql
+
+from .. import CONNECTION
+from ..connection import ConnectionPool, Session
+from .. import DATERO_SCHEMA
+
+
+class MaterializationMethod(Enum):
+    """Types of local copies"""
+    TABLE = 'table'
+    MATVIEW = 'matview'
+
+
+# row locking clauses of the materialization registration
+LOCK_WAIT = 'FOR UPDATE'
+LOCK_SKIP = 'FOR UPDATE SKIP LOCKED'
+
+
+class Materialization:
+    """
+    Local copies of foreign tables.
+    Copy is either a regular table or a materialized view registered in "datero.materializations" table.
+    Tables are refreshed fully by DELETE and INSERT ... SELECT or incrementally by the watermark column.
+    Neither takes an exclusive lock, so readers see the previous content until the refresh is committed.
+    Incremental refresh upserts rows changed since the last refresh by the key columns,
+    so the watermark could be a modification timestamp and not only an ever growing id.
+    Materialized views are refreshed by REFRESH MATERIALIZED VIEW. CONCURRENTLY if they have a unique index.
+    Refreshes of the same materialization are serialized by the row lock of its registration.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.pool = ConnectionPool(self.config[CONNECTION])
+
+
+    def create_materialization(self, data: Dict, session: Session = None) -> Dict:
+        """
+        Create local copy of the foreign table and populate it.
+        Input: source_schema, source_table, target_schema, [target_table], [method], [refresh_interval],
+               [watermark_column, key_columns]
+        Incremental refresh by "watermark_column" is supported only for "table" method.
+        It requires "key_columns" list identifying the rows. Unique index on them is created on the target table.
+        """
+        method = data.get('method', MaterializationMethod.TABLE.value)
+        target_table = data.get('target_table') or data['source_table']
+
+        if method not in (MaterializationMethod.TABLE.value, MaterializationMethod.MATVIEW.value):
+            raise ValueError(f'Unknown materialization method "{method}"')
+        if data.get('watermark_column') and method != MaterializationMethod.TABLE.value:
+            raise ValueError('Incremental refresh by watermark column is supported only for "table" method')
+        if data.get('watermark_column') and not data.get('key_columns'):
+            raise ValueError('Incremental refresh by watermark column requires "key_columns" to update changed rows')
+
+        stmt = None
+        try:
+            with self.pool.transaction(session) as session:
+                with self.pool.connection(session) as conn:
+                    with conn.cursor() as cur:
+                        stmt = sql.SQL('CREATE SCHEMA IF NOT EXISTS {schema}') \
+                            .format(schema=sql.Identifier(data['target_schema']))
+                        cur.execute(stmt)
+
+                        stmt = sql.SQL(
+                            'CREATE TABLE {target} AS SELECT * FROM {source} WITH NO DATA'
+                            if method == MaterializationMethod.TABLE.value else
+                            'CREATE MATERIALIZED VIEW {target} AS SELECT * FROM {source} WITH NO DATA'
+                        ).format(
+                            target=sql.Identifier(data['target_schema'], target_table),
+                            source=sql.Identifier(data['source_schema'], data['source_table'])
+                        )
+                        cur.execute(stmt)
+
+                        if data.get('watermark_column'):
+                            stmt = sql.SQL('CREATE UNIQUE INDEX ON {target} ({columns})').format(
+                                target=sql.Identifier(data['target_schema'], target_table),
+                                columns=sql.SQL(', ').join(map(sql.Identifier, data['key_columns']))
+                            )
+                            cur.execute(stmt)
+
+                        stmt = sql.SQL("""
+                            INSERT
+                              INTO {materializations_table}
+                                 ( source_schema
+                                 , source_table
+                                 , target_schema
+                                 , target_table
+                                 , method
+                                 , refresh_interval
+                                 , watermark_column
+                                 , key_columns
+                                 )
+                            VALUES
+                                 ( %(source_schema)s
+                                 , %(source_table)s
+                                 , %(target_schema)s
+                                 , %(target_table)s
+                                 , %(method)s
+                                 , %(refresh_interval)s
+                                 , %(watermark_column)s
+                                 , %(key_columns)s
+                                 )
+                        """).format(materializations_table=sql.Identifier(DATERO_SCHEMA, 'materializations'))
+                        cur.execute(stmt, {
+                            'source_schema': data['source_schema'],
+                            'source_table': data['source_table'],
+                            'target_schema': data['target_schema'],
+                            'target_table': target_table,
+                            'method': method,
+                            'refresh_interval': data.get('refresh_interval'),
+                            'watermark_column': data.get('watermark_column'),
+                            'key_columns': data.get('key_columns') if data.get('watermark_column') else None
+                        })
+
+                print(f'Materialization "{data["target_schema"]}.{target_table}" of "{data["source_schema"]}.{data["source_table"]}" successfully created')
+
+                return self.refresh(data['target_schema'], target_table, session)
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}')
+            raise e
+
+
+    def get_materialization_list(
+        self,
+        session: Session = None,
+        target_schema: str = None,
+        target_table: str = None,
+        due: bool = False,
+        lock: str = None
+    ) -> List[Dict]:
+        """
+        Get list of registered materializations. Optionally filtered by the target and due for refresh ones only.
+        "lock" is one of the LOCK_* row locking clauses. Locks are held until the end of the session transaction.
+        """
+        where = []
+        if target_schema is not None:
+            where.append(sql.SQL('m.target_schema = %(target_schema)s'))
+        if target_table is not None:
+            where.append(sql.SQL('m.target_table = %(target_table)s'))
+        if due:
+            where.append(sql.SQL("""
+                m.refresh_interval IS NOT NULL
+                AND (   m.last_refresh IS NULL
+                     OR m.last_refresh + m.refresh_interval * INTERVAL '1 second' <= CURRENT_TIMESTAMP
+                    )
+            """))
+
+        query = sql.SQL("""
+            SELECT m.source_schema
+                 , m.source_table
+                 , m.target_schema
+                 , m.target_table
+                 , m.method
+                 , m.refresh_interval
+                 , m.watermark_column
+                 , m.watermark_value
+                 , m.key_columns
+                 , m.last_refresh
+                 , m.last_duration
+              FROM {materializations_table}     m
+             {where}
+             ORDER BY m.target_schema, m.target_table
+             {lock}
+        """).format(
+            materializations_table=sql.Identifier(DATERO_SCHEMA, 'materializations'),
+            where=sql.SQL('WHERE ') + sql.SQL(' AND ').join(where) if where else sql.SQL(''),
+            lock=sql.SQL(lock or '')
+        )
+
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, {'target_schema': target_schema, 'target_table': target_table})
+                columns = [col.name for col in cur.description]
+                return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+    def get_materialization(
+        self,
+        target_schema: str,
+        target_table: str,
+        session: Session = None,
+        due: bool = False,
+        lock: str = None
+    ) -> Dict:
+        """Get materialization details. See "get_materialization_list" for filtering and locking"""
+        res = self.get_materialization_list(session, target_schema, target_table, due, lock)
+        return res[0] if len(res) > 0 else None
+
+
+    def refresh(self, target_schema: str, target_table: str, session: Session = None, due_only: bool = False) -> Dict:
+        """
+        Refresh local copy in a single transaction.
+        - materialized view: REFRESH MATERIALIZED VIEW, CONCURRENTLY if possible. See "refresh_concurrently"
+        - table without watermark column: DELETE followed by INSERT ... SELECT of the whole foreign table.
+          TRUNCATE isn't used, because its exclusive lock would block readers for the whole remote fetch
+        - table with watermark column: INSERT ... SELECT of the rows above the last seen watermark value
+          ON CONFLICT by the key columns DO UPDATE
+        Registration row is locked for the duration of the refresh, so concurrent refreshes wait for each other.
+        With "due_only" materialization is refreshed only if it's due for refresh and isn't being refreshed
+        by another process. Otherwise None is returned.
+        """
+        stmt = None
+        try:
+            with self.pool.transaction(session) as session:
+                item = self.get_materialization(
+                    target_schema, target_table, session,
+                    due=due_only,
+                    lock=LOCK_SKIP if due_only else LOCK_WAIT
+                )
+                if item is None and due_only:
+                    return None
+                if item is None:
+                    raise ValueError(f'Materialization "{target_schema}.{target_table}" doesn\'t exist')
+
+                target = sql.Identifier(target_schema, target_table)
+                source = sql.Identifier(item['source_schema'], item['source_table'])
+                watermark = item['watermark_value']
+                started = time.perf_counter()
+                rows = None
+
+                with self.pool.connection(session) as conn:
+                    with conn.cursor() as cur:
+                        if item['method'] == MaterializationMethod.MATVIEW.value:
+                            stmt = sql.SQL(
+                                'REFRESH MATERIALIZED VIEW CONCURRENTLY {target}'
+                                if self.refresh_concurrently(cur, target_schema, target_table) else
+                                'REFRESH MATERIALIZED VIEW {target}'
+                            ).format(target=target)
+                            cur.execute(stmt)
+
+                        elif item['watermark_column'] is None:
+                            stmt = sql.SQL('DELETE FROM {target}').format(target=target)
+                            cur.execute(stmt)
+                            stmt = sql.SQL('INSERT INTO {target} SELECT * FROM {source}').format(target=target, source=source)
+                            cur.execute(stmt)
+                            rows = cur.rowcount
+
+                        else:
+                            column = sql.Identifier(item['watermark_column'])
+                            keys = item['key_columns']
+
+                            cur.execute(sql.SQL('SELECT * FROM {target} LIMIT 0').format(target=target))
+                            updated = [col.name for col in cur.description if col.name not in keys]
+
+                            # changed rows replace their previous versions
+                            upsert = sql.SQL('ON CONFLICT ({keys}) DO UPDATE SET {assignments}').format(
+                                keys=sql.SQL(', ').join(map(sql.Identifier, keys)),
+                                assignments=sql.SQL(', ').join(
+                                    sql.SQL('{col} = EXCLUDED.{col}').format(col=sql.Identifier(col)) for col in updated
+                                )
+                            ) if updated else sql.SQL('ON CONFLICT ({keys}) DO NOTHING').format(
+                                keys=sql.SQL(', ').join(map(sql.Identifier, keys))
+                            )
+
+                            # condition is pushed down to the foreign server
+                            stmt = sql.SQL('INSERT INTO {target} SELECT * FROM {source} {where} {upsert}').format(
+                                target=target,
+                                source=source,
+                                where=sql.SQL('WHERE {column} > %(watermark)s').format(column=column) \
+                                    if watermark is not None else sql.SQL(''),
+                                upsert=upsert
+                            )
+                            cur.execute(stmt, {'watermark': watermark})
+                            rows = cur.rowcount
+
+                            stmt = sql.SQL('SELECT MAX({column})::TEXT FROM {target}').format(column=column, target=target)
+                            cur.execute(stmt)
+                            # keep the previous watermark if nothing was loaded yet
+                            watermark = cur.fetchone()[0] or watermark
+
+                        duration = time.perf_counter() - started
+
+                        stmt = sql.SQL("""
+                            UPDATE {materializations_table}
+                               SET watermark_value  = %(watermark_value)s
+                                 , last_refresh     = CURRENT_TIMESTAMP
+                                 , last_duration    = %(last_duration)s
+                                 , modified         = CURRENT_TIMESTAMP
+                             WHERE target_schema    = %(target_schema)s
+                               AND target_table     = %(target_table)s
+                        """).format(materializations_table=sql.Identifier(DATERO_SCHEMA, 'materializations'))
+                        cur.execute(stmt, {
+                            'watermark_value': watermark,
+                            'last_duration': duration,
+                            'target_schema': target_schema,
+                            'target_table': target_table
+                        })
+
+                print(f'Materialization "{target_schema}.{target_table}" successfully refreshed in {duration:.3f}s')
+
+                return {**item, 'watermark_value': watermark, 'last_duration': duration, 'rows': rows}
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}')
+            raise e
+
+
+    def refresh_concurrently(self, cur, target_schema: str, target_table: str) -> bool:
+        """
+        Whether materialized view could be refreshed without blocking readers.
+        It must be populated already and have a unique index on plain columns without WHERE clause.
+        """
+        cur.execute("""
+            SELECT mv.ispopulated
+               AND EXISTS (
+                   SELECT 1
+                     FROM pg_index                  i
+                    WHERE i.indrelid                = c.oid
+                      AND i.indisunique
+                      AND i.indisvalid
+                      AND i.indpred                 IS NULL
+                      AND i.indexprs                IS NULL
+                   )
+              FROM pg_matviews                      mv
+              JOIN pg_namespace                     n
+                ON n.nspname                        = mv.schemaname
+              JOIN pg_class                         c
+                ON c.relnamespace                   = n.oid
+               AND c.relname                        = mv.matviewname
+             WHERE mv.schemaname                    = %(target_schema)s
+               AND mv.matviewname                   = %(target_table)s
+        """, {'target_schema': target_schema, 'target_table': target_table})
+        row = cur.fetchone()
+
+        return row is not None and bool(row[0])
+
+
+    def refresh_due(self) -> Dict[str, Dict]:
+        """
+        Refresh all materializations which "refresh_interval" has passed since the last refresh.
+        Every one is refreshed in its own transaction. We intentionally continue on error.
+        Materializations being refreshed by another process at the moment are skipped.
+        """
+        items = self.get_materialization_list(due=True)
+
+        res = {}
+        for item in sorted(items, key=lambda item: (item['last_refresh'] is not None, item['last_refresh'] or 0)):
+            name = f'{item["target_schema"]}.{item["target_table"]}'
+            try:
+                result = self.refresh(item['target_schema'], item['target_table'], due_only=True)
+                if result is None:
+                    res[name] = {'status': 'skipped'}
+                else:
+                    res[name] = {'status': 'ok', 'result': result}
+            except Exception as e:
+                print(f'Error during refreshing materialization "{name}": {e}')
+                res[name] = {'status': 'error', 'error': str(e)}
+
+        return res
+
+
+    def delete_materialization(self, target_schema: str, target_table: str, session: Session = None) -> Dict:
+        """Drop local copy and its registration"""
+        stmt = None
+        try:
+            with self.pool.transaction(session) as session:
+                item = self.get_materialization(target_schema, target_table, session)
+                if item is None:
+                    raise ValueError(f'Materialization "{target_schema}.{target_table}" doesn\'t exist')
+
+                with self.pool.connection(session) as conn:
+                    with conn.cursor() as cur:
+                        stmt = sql.SQL(
+                            'DROP TABLE IF EXISTS {target}'
+                            if item['method'] == MaterializationMethod.TABLE.value else
+                            'DROP MATERIALIZED VIEW IF EXISTS {target}'
+                        ).format(target=sql.Identifier(target_schema, target_table))
+                        cur.execute(stmt)
+
+                        stmt = sql.SQL("""
+                            DELETE
+                              FROM {materializations_table}
+                             WHERE target_schema    = %(target_schema)s
+                               AND target_table     = %(target_table)s
+                        """).format(materializations_table=sql.Identifier(DATERO_SCHEMA, 'materializations'))
+                        cur.execute(stmt, {'target_schema': target_schema, 'target_table': target_table})
+
+            msg = f'Materialization "{target_schema}.{target_table}" successfully deleted'
+            print(msg)
+
+            return { 'message': msg }
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}')
+            raise e
+
+
+class RefreshScheduler:
+    """Background thread which periodically refreshes materializations due for refresh"""
+
+    def __init__(self, materialization: Materialization, interval: float = 60):
+        self.materialization = materialization
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def start(self):
+        """Start scheduler thread if it isn't running yet"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='datero-refresh-scheduler', daemon=True)
+        self._thread.start()
+        print(f'Materialization refresh scheduler started. Check interval: {self.interval}s')
+
+
+    def stop(self, timeout: float = None):
+        """Stop scheduler thread. Currently running refresh is completed"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+    def run(self):
+        """Scheduler loop"""
+        while not self._stop.is_set():
+            try:
+                self.materialization.refresh_due()
+            except Exception as e:
+                print(f'Error during materializations refresh: {e}')
+
+            self._stop.wait(self.interval)
@@ -0,0 +1,355 @@
+"""Declarative management of foreign servers defined in config file"""
+
+from typing import Callable, Dict, List, Tuple
+import psycopg2
+from psycopg2 import sql
+from copy import deepcopy
+
+from .. import CONNECTION
+from ..connection import ConnectionPool, Session
+from .schema import Schema
+from .server import Server
+from .user import UserMapping
+from .util import options_differ
+from .tuning import apply_tuning_profile
+from .. import DATERO_SCHEMA
+
+
+class Change:
+    """Single planned change of a foreign server related object"""
+
+    # actions
+    CREATE = 'create'
+    ALTER = 'alter'
+    REPLACE = 'replace'
+    DROP = 'drop'
+    IMPORT = 'import'
+
+    def __init__(
+        self,
+        action: str,
+        object_type: str,
+        server_name: str,
+        statements: List[Tuple[sql.Composable, Dict]],
+        apply: Callable[[Session], None],
+        secret: bool = False
+    ):
+        self.action = action
+        self.object_type = object_type
+        self.server_name = server_name
+        self.statements = statements
+        self.apply = apply
+        self.secret = secret    # bind values must not be shown in the plan output
+
+    def __repr__(self):
+        return f'{self.action} {self.object_type} "{self.server_name}"'
+
+
+class Planner:
+    """
+    Compare foreign servers defined in config file with the live catalog.
+    Produce minimal set of changes required to bring the catalog in line with the config and apply them.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.pool = ConnectionPool(self.config[CONNECTION])
+        self.server = Server(self.config)
+        self.user_mapping = UserMapping(self.config)
+        self.schema = Schema(self.config)
+
+    @property
+    def servers(self) -> Dict:
+        """List of foreign servers"""
+        return self.config['servers'] if 'servers' in self.config else {}
+
+
+    def catalog(self, session: Session = None) -> Dict[str, Dict]:
+        """Current state of foreign servers, current user mappings and Datero metadata keyed by server name"""
+        stmt = """
+            SELECT fs.srvname                      AS server_name
+                 , fdw.fdwname                     AS fdw_name
+                 , d.description                   AS description
+                 , (
+                     SELECT json_object_agg(fso.option_name, fso.option_value)
+                       FROM pg_options_to_table(fs.srvoptions) AS fso(option_name, option_value)
+                   )                               AS foreign_server
+                 , um.umid IS NOT NULL             AS has_user_mapping
+                 , (
+                     SELECT json_object_agg(umo.option_name, umo.option_value)
+                       FROM pg_options_to_table(um.umoptions) AS umo(option_name, option_value)
+                   )                               AS user_mapping
+                 , srv.name IS NOT NULL            AS managed
+                 , srv.custom_options              AS advanced_options
+              FROM pg_foreign_server               fs
+             INNER JOIN pg_foreign_data_wrapper    fdw      ON fdw.oid      = fs.srvfdw
+              LEFT JOIN {servers_table}            srv      ON srv.name     = fs.srvname
+              LEFT JOIN pg_user_mappings           um       ON um.srvid     = fs.oid
+                                                           AND um.usename   = CURRENT_USER
+              LEFT JOIN pg_description             d        ON d.classoid   = fs.tableoid
+                                                           AND d.objoid     = fs.oid
+                                                           AND d.objsubid   = 0
+        """
+
+        query = sql.SQL(stmt).format(
+            servers_table=sql.Identifier(DATERO_SCHEMA, 'servers'),
+        )
+
+        try:
+            with self.pool.connection(session) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(query)
+                    rows = cur.fetchall()
+
+            return {
+                val[0]: {
+                    'server_name': val[0],
+                    'fdw_name': val[1],
+                    'description': val[2],
+                    'foreign_server': val[3] or {},
+                    'has_user_mapping': val[4],
+                    'user_mapping': val[5] or {},
+                    'managed': val[6],
+                    'advanced_options': val[7]
+                } for val in rows
+            }
+
+        except psycopg2.Error as e:
+            print(f'catalog: Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {query}')
+            raise e
+
+
+    def local_schemas(self, session: Session = None) -> set:
+        """Names of existing local schemas"""
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                cur.execute('SELECT nspname FROM pg_namespace')
+                return {row[0] for row in cur.fetchall()}
+
+
+    def desired_state(self) -> Dict[str, Dict]:
+        """Foreign servers definitions from the config file keyed by server name"""
+        res = {}
+        for name, props in self.servers.items():
+            server_name = self.server.normalize_name(name)
+
+            if not self.server.is_valid_name(server_name):
+                print(f'Invalid server name "{server_name}". Skipping...')
+                continue
+
+            server = apply_tuning_profile(self.config, deepcopy(props))
+            server['server_name'] = server_name
+            server['advanced_options'] = self.server.populate_advanced_options(server)
+            res[server_name] = server
+
+        return res
+
+
+    def plan(self, prune: bool = False, session: Session = None) -> List[Change]:
+        """
+        Compute list of changes.
+        Servers registered in Datero metadata but absent in the config are dropped only if "prune" is set.
+        """
+        current = self.catalog(session)
+        schemas = self.local_schemas(session)
+        servers = self.desired_state()
+        changes = []
+
+        for server_name, desired in servers.items():
+            existing = current.get(server_name)
+
+            if existing is None:
+                changes.append(self.create_change(desired))
+            elif existing['fdw_name'] != desired['fdw_name']:
+                changes.append(self.replace_change(existing, desired))
+            else:
+                changes.extend(self.alter_changes(existing, desired))
+
+            conf = desired.get('import_foreign_schema')
+            if conf and conf.get('local_schema') not in schemas:
+                changes.append(self.import_change(desired))
+
+        if prune:
+            for server_name, existing in current.items():
+                if existing['managed'] and server_name not in servers:
+                    changes.append(self.drop_change(existing))
+
+        return changes
+
+
+    def create_change(self, desired: Dict) -> Change:
+        """New foreign server"""
+        server_name = desired['server_name']
+        statements = [self.server.create_server_query(server_name, desired)]
+        if 'user_mapping' in desired:
+            statements.append(self.user_mapping.create_user_mapping_query(server_name, desired['user_mapping']))
+
+        return Change(
+            Change.CREATE, 'server', server_name, statements,
+            lambda session: self.server.create_server(desired, session),
+            secret=True
+        )
+
+
+    def replace_change(self, existing: Dict, desired: Dict) -> Change:
+        """Foreign server with changed FDW. It can only be dropped and created again"""
+        server_name = desired['server_name']
+        statements = [
+            (sql.SQL('DROP SERVER {server} CASCADE').format(server=sql.Identifier(server_name)), None),
+            self.server.create_server_query(server_name, desired)
+        ]
+
+        def apply(session: Session):
+            self.server.delete_server(existing, session)
+            self.server.create_server(desired, session)
+
+        return Change(Change.REPLACE, 'server', server_name, statements, apply, secret=True)
+
+
+    def drop_change(self, existing: Dict) -> Change:
+        """Foreign server absent in the config"""
+        server_name = existing['server_name']
+        statements = [(sql.SQL('DROP SERVER {server} CASCADE').format(server=sql.Identifier(server_name)), None)]
+
+        return Change(
+            Change.DROP, 'server', server_name, statements,
+            lambda session: self.server.delete_server(existing, session)
+        )
+
+
+    def alter_changes(self, existing: Dict, desired: Dict) -> List[Change]:
+        """Minimal changes for already existing foreign server"""
+        server_name = desired['server_name']
+        changes = []
+
+        options = desired.get('foreign_server') or {}
+        if options_differ(options, existing['foreign_server']):
+            srv_query, srv_values = self.server.alter_server_query(
+                server_name, options, existing['foreign_server'], changed_only=True
+            )
+            changes.append(Change(
+                Change.ALTER, 'server', server_name, [(srv_query, srv_values)],
+                lambda session, q=srv_query, v=srv_values: self.execute(q, v, session)
+            ))
+
+        # user mapping is not dropped if it's absent in the config
+        if 'user_mapping' in desired:
+            props = desired['user_mapping'] or {}
+
+            if not existing['has_user_mapping']:
+                um_query, um_values = self.user_mapping.create_user_mapping_query(server_name, props)
+                changes.append(Change(
+                    Change.CREATE, 'user mapping', server_name, [(um_query, um_values)],
+                    lambda session, q=um_query, v=um_values: self.execute(q, v, session),
+                    secret=True
+                ))
+            elif options_differ(props, existing['user_mapping']):
+                um_query, um_values = self.user_mapping.alter_user_mapping_query(
+                    server_name, props, existing['user_mapping'], changed_only=True
+                )
+                changes.append(Change(
+                    Change.ALTER, 'user mapping', server_name, [(um_query, um_values)],
+                    lambda session, q=um_query, v=um_values: self.execute(q, v, session),
+                    secret=True
+                ))
+
+        description = desired.get('description')
+        advanced_options = desired.get('advanced_options')
+        if not existing['managed'] \
+            or existing['description'] != description \
+            or existing['advanced_options'] != advanced_options:
+
+            def apply(session: Session):
+                self.server.set_description(server_name, description, session)
+                if existing['managed']:
+                    self.server.update_server_metadata(
+                        server_name, desired['fdw_name'], description, advanced_options, session
+                    )
+                else:
+                    self.server.create_server_metadata(
+                        server_name, desired['fdw_name'], description, advanced_options, session
+                    )
+
+            changes.append(Change(
+                Change.ALTER if existing['managed'] else Change.CREATE, 'metadata', server_name,
+                [(
+                    sql.SQL('COMMENT ON SERVER {server} IS %(description)s').format(server=sql.Identifier(server_name)),
+                    {'description': description}
+                )],
+                apply
+            ))
+
+        return changes
+
+
+    def import_change(self, desired: Dict) -> Change:
+        """Import of not yet existing local schema"""
+        server_name = desired['server_name']
+        conf = desired['import_foreign_schema']
+        data = {
+            'server_name': server_name,
+            'remote_schema': conf['remote_schema'],
+            'local_schema': conf['local_schema'],
+            **({'options': conf['options']} if conf.get('options') else {})
+        }
+        query = sql.SQL('IMPORT FOREIGN SCHEMA {remote_schema} FROM SERVER {server} INTO {local_schema}').format(
+            remote_schema=sql.Identifier(data['remote_schema']),
+            server=sql.Identifier(server_name),
+            local_schema=sql.Identifier(data['local_schema'])
+        )
+
+        return Change(
+            Change.IMPORT, 'schema', server_name, [(query, None)],
+            lambda session: self.schema.import_foreign_schema(data, session)
+        )
+
+
+    def execute(self, query: sql.Composable, values: Dict, session: Session = None):
+        """Execute single planned statement"""
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, values)
+
+
+    def render(self, changes: List[Change]) -> List[str]:
+        """Human readable representation of the plan. Secret bind values are masked"""
+        res = []
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                for change in changes:
+                    res.append(f'{change.action.upper()} {change.object_type} "{change.server_name}"')
+                    for query, values in change.statements:
+                        if values and change.secret:
+                            values = {key: '*****' for key in values}
+                        res.append('    ' + cur.mogrify(query, values).decode() + ';')
+
+        return res
+
+
+    def apply(self, changes: List[Change]) -> Dict:
+        """
+        Apply planned changes.
+        Changes of every server are applied in a separate transaction.
+        We intentionally continue on error to apply as many changes as possible.
+        """
+        by_server = {}
+        for change in changes:
+            by_server.setdefault(change.server_name, []).append(change)
+
+        summary = {'applied': [], 'failed': {}}
+        for server_name, server_changes in by_server.items():
+            try:
+                with self.pool.transaction() as session:
+                    for change in server_changes:
+                        change.apply(session)
+                summary['applied'].append(server_name)
+            except Exception as e:
+                print(f'Error during applying changes for server "{server_name}": {e}')
+                summary['failed'][server_name] = str(e)
+            finally:
+                # lookups done before commit could have cached the previous state
+                self.server.invalidate_caches(server_name)
+
+        print(f'Applied changes for {len(summary["applied"])} servers, failed for {len(summary["failed"])} servers')
+
+        return summary
@@ -1,21 +1,33 @@
 """Importing schema from foreign server"""
 
-from typing import Dict
+from typing import Callable, Dict, Iterator, List, Tuple
+import functools
+import threading
 import psycopg2
 from psycopg2 import sql
 
 from .. import CONNECTION
 from ..adapter import Adapter
-from ..connection import ConnectionPool
-from .util import options_and_values, FdwType
+from ..cache import CatalogCache, ResultCache
+from ..connection import ConnectionPool, Session
+from ..limits import ServerLimits
+from ..parallel import run_parallel
+from .util import options_and_values, normalize_name, FdwType, ImportMode
+from .tuning import apply_tuning_profile
 from .. import DATERO_SCHEMA
 
+# progress(completed fraction, message). could raise to stop the operation
+Progress = Callable[[float, str], None]
+
 class Schema:
     """Importing schema from foreign server"""
 
     def __init__(self, config: Dict):
         self.config = config
         self.pool = ConnectionPool(self.config[CONNECTION])
+        self.catalog_cache = CatalogCache(self.config)
+        self.result_cache = ResultCache(self.config)
+        self.limits = ServerLimits(self.config)
 
     @property
     def servers(self):
@@ -23,70 +35,63 @@ class Schema:
         return self.config['servers'] if 'servers' in self.config else {}
 
 
-    def init_foreign_schemas(self):
-        """Init foreign schemas"""
-
-        def recreate_schema():
-            query = sql.SQL('DROP SCHEMA IF EXISTS {local_schema} CASCADE') \
-                .format(local_schema=sql.Identifier(local_schema))
-
-            cur.execute(query)
+    def init_foreign_schemas(self, session: Session = None) -> Dict[str, Dict]:
+        """
+        Import foreign schemas for the servers defined in config.
+        Without session servers are processed concurrently, every one in its own transaction on a separate pooled connection.
+        Within session they are processed one by one in the session transaction.
+        Returns outcome and wall time of every import keyed by server name.
+        """
+        imports = []
+        for server, props in self.servers.items():
+            conf = apply_tuning_profile(self.config, props).get('import_foreign_schema')
+            if not conf:
+                continue
+
+            imports.append({
+                'server_name': normalize_name(server),
+                'remote_schema': conf['remote_schema'],
+                'local_schema': conf['local_schema'],
+                **({'options': conf['options']} if conf.get('options') else {}),
+                **({'mode': conf['mode']} if conf.get('mode') else {}),
+                **({'batch_size': conf['batch_size']} if conf.get('batch_size') else {})
+            })
+
+        parallelism = 1 if session is not None else \
+            min((self.config.get('provisioning') or {}).get('parallelism', 1), self.pool.pool.maxconn)
+
+        # batched imports run concurrently with each other, so connections budget is split between them
+        batch_parallelism = max(parallelism // max(min(parallelism, len(imports)), 1), 1)
+
+        tasks = {}
+        for data in imports:
+            if 'batch_size' in data:
+                data['parallelism'] = batch_parallelism
+            tasks[data['server_name']] = lambda data=data: self.import_foreign_schema(data, session)
+
+        # we intentionally continue on error to import as many schemas as possible
+        res = run_parallel(tasks, parallelism)
+        for server, outcome in res.items():
+            if outcome['status'] == 'ok':
+                print(f'Foreign schema import for server "{server}" took {outcome["elapsed"]:.3f}s')
+            else:
+                print(f'Error during importing foreign schema for server "{server}": {outcome["error"]}')
 
-            query = sql.SQL('CREATE SCHEMA IF NOT EXISTS {local_schema}') \
-                .format(local_schema=sql.Identifier(local_schema))
+        return res
 
-            cur.execute(query)
 
-        try:
-            stmt = None
-            values = None            
+    def get_foreign_schema_list(self, server_name: str, fdw_name: str, session: Session = None, refresh: bool = False):
+        """Get list of available schemas to import. Result is cached, "refresh" flag forces reload"""
+        res = self.catalog_cache.get_or_load(
+            (server_name, 'schema_list'),
+            lambda: self.load_foreign_schema_list(server_name, fdw_name, session),
+            refresh
+        )
+        return list(res)
 
-            with self.pool.connection() as conn:
-                with conn.cursor() as cur:
-                    for server, props in self.servers.items():
-                        ##print(f'{server} - {props}')
-                        conf = props['import_foreign_schema']
-                        remote_schema = conf['remote_schema']
-                        local_schema = conf['local_schema']
-
-                        recreate_schema()
-
-                        stmt = \
-                            'IMPORT FOREIGN SCHEMA {remote_schema} ' \
-                            'FROM SERVER {server} ' \
-                            'INTO {local_schema}'
-
-                        values = None
-                        key = 'options'
-                        if key in conf and len(conf[key]) > 0:
-                            stmt += ' OPTIONS({options})'
-                            options, values = options_and_values(conf[key])
-
-                            query = sql.SQL(stmt).format(
-                                remote_schema=sql.Identifier(remote_schema),
-                                server=sql.Identifier(server),
-                                local_schema=sql.Identifier(local_schema),
-                                options=options
-                            )
-                        else:
-                            query = sql.SQL(stmt).format(
-                                remote_schema=sql.Identifier(remote_schema),
-                                server=sql.Identifier(server),
-                                local_schema=sql.Identifier(local_schema),
-                            )
 
-                        stmt = query.as_string(cur)
-                        cur.execute(query, values)
-                        conn.commit()   # explicitly commit every schema import
-
-                        print(f'Foreign schema "{remote_schema}" from server "{server}" successfully imported into "{local_schema}"')
-        except psycopg2.Error as e:
-            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}\nValues: {values}')
-            raise e
-
-
-    def get_foreign_schema_list(self, server_name: str, fdw_name: str):
-        """Get list of available schemas to import."""
+    def load_foreign_schema_list(self, server_name: str, fdw_name: str, session: Session = None):
+        """Query list of available schemas to import from the foreign server"""
         table_name = f'{server_name}_schema_list'
 
         adapter = Adapter(fdw_name)
@@ -95,7 +100,7 @@ class Schema:
         res = []
         try:
             if stmt is not None:
-                with self.pool.connection() as conn:
+                with self.pool.connection(session) as conn:
                     with conn.cursor() as cur:
                         query = sql.SQL(stmt).format(
                             full_table_name=sql.Identifier(DATERO_SCHEMA, table_name),
@@ -121,9 +126,86 @@ class Schema:
             raise e
 
 
-    def import_foreign_schema(self, data: Dict):
-        """Import foreign schema"""
+    def import_query(
+        self,
+        server_name: str,
+        remote_schema: str,
+        local_schema: str,
+        import_options: Dict = None,
+        limit_to: List[str] = None,
+        except_tables: List[str] = None
+    ) -> Tuple[sql.Composed, Dict]:
+        """
+        IMPORT FOREIGN SCHEMA statement and its bind values. Optionally restricted to the list of tables.
+        Empty "except_tables" list means plain import of all the tables.
+        """
+        if limit_to is not None and len(limit_to) == 0:
+            raise ValueError('LIMIT TO list of the foreign schema import must not be empty')
+
+        stmt = 'IMPORT FOREIGN SCHEMA {remote_schema} '
+        if limit_to is not None:
+            stmt += 'LIMIT TO ({tables}) '
+        elif except_tables:
+            stmt += 'EXCEPT ({tables}) '
+        stmt += \
+            'FROM SERVER {server} ' \
+            'INTO {local_schema}'
+
+        params = {
+            'remote_schema': sql.Identifier(remote_schema),
+            'server': sql.Identifier(server_name),
+            'local_schema': sql.Identifier(local_schema),
+            'tables': sql.SQL(', ').join(map(sql.Identifier, limit_to if limit_to is not None else except_tables or []))
+        }
+
+        values = None
+        if import_options is not None and len(import_options) > 0:
+            stmt += ' OPTIONS({options})'
+            params['options'], values = options_and_values(import_options)
+
+        return (sql.SQL(stmt).format(**params), values)
+
+
+    def import_foreign_schema(self, data: Dict, session: Session = None, progress: Progress = None):
+        """
+        Import foreign schema.
+        In "full" mode (default) local schema is dropped and all the remote tables are imported again.
+        In "incremental" mode only tables missing in the local schema are imported
+        and only foreign tables which no longer exist in the remote schema are dropped.
+        If "batch_size" is specified, full import is split into batches imported in parallel.
+        Optional "progress" callback is called with completed fraction and message after every step.
+        """
+        self.invalidate_caches(data['server_name'])
+
+        try:
+            incremental = data.get('mode') == ImportMode.INCREMENTAL.value \
+                and self.local_schema_exists(data['local_schema'], session)
+
+            # every batch of the batched import takes its own slot of the server concurrency limit
+            if not incremental and data.get('batch_size') and session is None:
+                return self.import_foreign_schema_parallel(data, data['batch_size'], data.get('parallelism'), progress)
+
+            # other imports count as a single operation against the server concurrency limit
+            with self.limits.acquire([data['server_name']]):
+                if incremental:
+                    return self.import_foreign_schema_incremental(data, session, progress)
+
+                return self.import_foreign_schema_full(data, session, progress)
+
+        finally:
+            # lookups done during the import could have cached the previous tables list.
+            # without session even failed import could have committed some of its steps
+            self.pool.after_commit(session, functools.partial(self.invalidate_caches, data['server_name']))
 
+
+    def invalidate_caches(self, server_name: str):
+        """Drop cached catalog lookups and query results of the server"""
+        self.catalog_cache.invalidate_server(server_name)
+        self.result_cache.invalidate_server(server_name)
+
+
+    def import_foreign_schema_full(self, data: Dict, session: Session = None, progress: Progress = None):
+        """Drop local schema and import all the remote tables into the recreated one"""
         def recreate_schema():
             """Recreate schema"""
             query = sql.SQL('DROP SCHEMA IF EXISTS {local_schema} CASCADE') \
@@ -136,12 +218,8 @@ class Schema:
 
             cur.execute(query)
 
-        def set_description():
-            """Set description for schema"""
-            query = sql.SQL('COMMENT ON SCHEMA {schema} IS %s') \
-                .format(schema=sql.Identifier(local_schema)
-                                    )
-            cur.execute(query, (f'Imported from (foreign_server.schema): {server_name}.{remote_schema}',))
+        stmt = None
+        values = None
 
         try:
             server_name = data['server_name']
@@ -150,35 +228,16 @@ class Schema:
 
             import_options = data['options'] if 'options' in data else None
 
-            values = None
-            stmt = \
-                'IMPORT FOREIGN SCHEMA {remote_schema} ' \
-                'FROM SERVER {server} ' \
-                'INTO {local_schema}'
-
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
                     recreate_schema()
-                    set_description()
-
-                    if import_options is not None and len(import_options) > 0:
-                        stmt += ' OPTIONS({options})'
-                        options, values = options_and_values(import_options)
-
-                        query = sql.SQL(stmt).format(
-                            remote_schema=sql.Identifier(remote_schema),
-                            server=sql.Identifier(server_name),
-                            local_schema=sql.Identifier(local_schema),
-                            options=options
-                        )
-                    else:
-                        query = sql.SQL(stmt).format(
-                            remote_schema=sql.Identifier(remote_schema),
-                            server=sql.Identifier(server_name),
-                            local_schema=sql.Identifier(local_schema),
-                        )
+                    self.set_description(cur, server_name, remote_schema, local_schema)
+                    if progress is not None:
+                        progress(0.1, f'Local schema "{local_schema}" recreated')
 
+                    query, values = self.import_query(server_name, remote_schema, local_schema, import_options)
                     stmt = query.as_string(cur)
+                    self.limits.set_statement_timeout(cur, [server_name])
                     cur.execute(query, values)
                     print(f'Foreign schema "{remote_schema}" from server "{server_name}" successfully imported into "{local_schema}"')
 
@@ -189,30 +248,300 @@ class Schema:
             raise e
 
 
-    def get_local_schema_list(self):
-        """Get list of local schemas with set of categorization flags"""
+    def import_foreign_schema_incremental(self, data: Dict, session: Session = None, progress: Progress = None):
+        """
+        Synchronize existing local schema with the remote one.
+        Remote tables list is taken from the server "<server>_table_list" helper table and compared with local foreign tables.
+        New tables are imported with a single LIMIT TO or EXCEPT import, whichever has a shorter tables list.
+        Removed tables are dropped. Already imported tables are left intact, so dependent views keep working.
+        """
+        stmt = None
+        values = None
+
+        try:
+            server_name = data['server_name']
+            remote_schema = data['remote_schema']
+            local_schema = data['local_schema']
+
+            import_options = data['options'] if 'options' in data else None
+
+            with self.pool.transaction(session) as session:
+                adapter = Adapter(self.get_fdw_name(server_name, session))
+                remote_tables = self.get_foreign_table_list(server_name, remote_schema, session, refresh=True)
+                if remote_tables is None:
+                    raise ValueError(f"Foreign server \"{server_name}\" doesn't support tables list. Use full import")
+
+                # remote table names in the form they will have after import
+                remote_tables = {adapter.local_table_name(table, import_options) for table in remote_tables}
+                local_tables = set(self.get_local_foreign_tables(local_schema, session))
+
+                new_tables = sorted(remote_tables - local_tables)
+                removed_tables = sorted(local_tables - remote_tables)
+                kept_tables = sorted(local_tables & remote_tables)
+                if progress is not None:
+                    progress(0.1, f'{len(new_tables)} tables to add, {len(removed_tables)} tables to drop')
+
+                with self.pool.connection(session) as conn:
+                    with conn.cursor() as cur:
+                        if len(removed_tables) > 0:
+                            query = sql.SQL('DROP FOREIGN TABLE IF EXISTS {tables} CASCADE').format(
+                                tables=sql.SQL(', ').join(sql.Identifier(local_schema, table) for table in removed_tables)
+                            )
+                            stmt = query.as_string(cur)
+                            cur.execute(query)
+                            if progress is not None:
+                                progress(0.2, f'{len(removed_tables)} tables dropped')
+
+                        if len(new_tables) > 0:
+                            # without kept tables EXCEPT list is empty, so it's a plain import of the whole schema
+                            if len(new_tables) <= len(kept_tables):
+                                query, values = self.import_query(
+                                    server_name, remote_schema, local_schema, import_options, limit_to=new_tables
+                                )
+                            else:
+                                query, values = self.import_query(
+                                    server_name, remote_schema, local_schema, import_options, except_tables=kept_tables
+                                )
+                            stmt = query.as_string(cur)
+                            self.limits.set_statement_timeout(cur, [server_name])
+                            cur.execute(query, values)
+
+                        self.set_description(cur, server_name, remote_schema, local_schema)
+
+            print(
+                f'Foreign schema "{remote_schema}" from server "{server_name}" incrementally imported into "{local_schema}": '
+                f'{len(new_tables)} tables added, {len(removed_tables)} tables dropped, {len(kept_tables)} tables unchanged'
+            )
+
+            return data
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}\nValues: {values}')
+            raise e
+
+
+    def import_foreign_schema_parallel(
+        self,
+        data: Dict,
+        batch_size: int,
+        parallelism: int = None,
+        progress: Progress = None
+    ) -> Dict:
+        """
+        Full import of the very large remote schema.
+        Remote tables list is split into batches of "batch_size" tables.
+        Every batch is imported with LIMIT TO clause in its own transaction on a separate pooled connection.
+        Up to "parallelism" batches are imported concurrently. Defaults to "provisioning.parallelism" setting.
+        Every batch holds a slot of the server concurrency limit, so the limit caps concurrent batches as well.
+        Optional "progress" callback is called with completed fraction and message after every finished batch.
+        """
+        server_name = data['server_name']
+        remote_schema = data['remote_schema']
+        local_schema = data['local_schema']
+
+        import_options = data['options'] if 'options' in data else None
+
+        if parallelism is None:
+            parallelism = (self.config.get('provisioning') or {}).get('parallelism', 1)
+        parallelism = min(parallelism, self.pool.pool.maxconn)
+
+        adapter = Adapter(self.get_fdw_name(server_name))
+        remote_tables = self.get_foreign_table_list(server_name, remote_schema, refresh=True)
+        if remote_tables is None:
+            raise ValueError(f"Foreign server \"{server_name}\" doesn't support tables list. Use non-batched import")
+
+        tables = sorted({adapter.local_table_name(table, import_options) for table in remote_tables})
+        batches = [tables[i:i + batch_size] for i in range(0, len(tables), batch_size)]
+
+        # schema is recreated upfront, batches are imported into it
+        stmt = None
         try:
-            query = r"""
-                SELECT n.nspname            AS schema_name
-                  FROM pg_namespace         n
-                 WHERE n.nspname            NOT IN ( 'pg_catalog'
-                                                   , 'pg_toast'
-                                                   , 'information_schema'
-                                                   , %(datero)s
-                                                   )
-                   AND n.nspname            NOT LIKE %(datero)s || '\_%%'
-                   AND NOT EXISTS
-                     (
-                       SELECT 1
-                         FROM pg_extension      e
-                        WHERE e.extname         LIKE '%%\_fdw'
-                          AND e.extnamespace    = n.oid
-                     )
-                 ORDER BY n.nspname
-            """
             with self.pool.connection() as conn:
                 with conn.cursor() as cur:
-                    cur.execute(query, {'datero': DATERO_SCHEMA})
+                    for stmt in ('DROP SCHEMA IF EXISTS {local_schema} CASCADE', 'CREATE SCHEMA {local_schema}'):
+                        cur.execute(sql.SQL(stmt).format(local_schema=sql.Identifier(local_schema)))
+                    self.set_description(cur, server_name, remote_schema, local_schema)
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}')
+            raise e
+
+        lock = threading.Lock()
+        done = [0]
+        done_batches = [0]
+
+        def import_batch(batch: List[str]):
+            query, values = self.import_query(
+                server_name, remote_schema, local_schema, import_options, limit_to=batch
+            )
+            with self.limits.acquire([server_name]):
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cur:
+                        self.limits.set_statement_timeout(cur, [server_name])
+                        cur.execute(query, values)
+
+            with lock:
+                done[0] += len(batch)
+                done_batches[0] += 1
+                if progress is not None:
+                    progress(done_batches[0] / len(batches), f'{done_batches[0]} of {len(batches)} batches imported')
+
+            return len(batch)
+
+        res = run_parallel(
+            {idx: lambda batch=batch: import_batch(batch) for idx, batch in enumerate(batches)},
+            parallelism
+        )
+
+        failed = {idx: outcome['error'] for idx, outcome in res.items() if outcome['status'] != 'ok'}
+        summary = {
+            'tables': len(tables),
+            'imported': done[0],
+            'batches': len(batches),
+            'failed_batches': failed
+        }
+
+        print(
+            f'Foreign schema "{remote_schema}" from server "{server_name}" imported into "{local_schema}" '
+            f'in {len(batches)} batches: {done[0]} of {len(tables)} tables imported'
+        )
+        for idx, error in failed.items():
+            print(f'  Batch {idx + 1} failed: {error}')
+
+        if len(failed) > 0:
+            raise RuntimeError(f'{len(failed)} of {len(batches)} import batches failed')
+
+        return {**data, **summary}
+
+
+    def set_description(self, cur, server_name: str, remote_schema: str, local_schema: str):
+        """Set description for imported schema"""
+        query = sql.SQL('COMMENT ON SCHEMA {schema} IS %s') \
+            .format(schema=sql.Identifier(local_schema))
+        cur.execute(query, (f'Imported from (foreign_server.schema): {server_name}.{remote_schema}',))
+
+
+    def get_fdw_name(self, server_name: str, session: Session = None) -> str:
+        """Get FDW name of the foreign server"""
+        query = r"""
+            SELECT fdw.fdwname                     AS fdw_name
+              FROM pg_foreign_server               fs
+             INNER JOIN pg_foreign_data_wrapper    fdw      ON fdw.oid      = fs.srvfdw
+             WHERE fs.srvname                      = %(server_name)s
+        """
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, {'server_name': server_name})
+                row = cur.fetchone()
+
+        if row is None:
+            raise ValueError(f"Foreign server \"{server_name}\" doesn't exist")
+
+        return row[0]
+
+
+    def get_foreign_table_list(
+        self,
+        server_name: str,
+        remote_schema: str,
+        session: Session = None,
+        refresh: bool = False
+    ) -> List[str]:
+        """
+        Get list of remote tables and views in the remote schema.
+        Returns None if foreign server doesn't support tables list.
+        Result is cached, "refresh" flag forces reload.
+        """
+        res = self.catalog_cache.get_or_load(
+            (server_name, 'table_list', remote_schema),
+            lambda: self.load_foreign_table_list(server_name, remote_schema, session),
+            refresh
+        )
+        return None if res is None else list(res)
+
+
+    def load_foreign_table_list(self, server_name: str, remote_schema: str, session: Session = None) -> List[str]:
+        """Query list of remote tables and views in the remote schema from the foreign server"""
+        adapter = Adapter(self.get_fdw_name(server_name, session))
+        stmt = adapter.table_list()
+
+        if stmt is None:
+            return None
+
+        try:
+            # filter by schema is pushed down to the remote server
+            stmt = 'SELECT t.table_name FROM (' + stmt.strip().rstrip(';') + ') t WHERE t.table_schema = %(remote_schema)s'
+
+            with self.pool.connection(session) as conn:
+                with conn.cursor() as cur:
+                    query = sql.SQL(stmt).format(
+                        full_table_name=sql.Identifier(DATERO_SCHEMA, f'{server_name}_table_list'),
+                    )
+                    stmt = query.as_string(cur)
+                    cur.execute(query, {'remote_schema': remote_schema})
+                    rows = cur.fetchall()
+
+            return [val[0] for val in rows]
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}')
+            raise e
+
+
+    def local_schema_exists(self, schema_name: str, session: Session = None) -> bool:
+        """Check if local schema exists"""
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1 FROM pg_namespace WHERE nspname = %(schema_name)s', {'schema_name': schema_name})
+                return cur.fetchone() is not None
+
+
+    def get_local_foreign_tables(self, schema_name: str, session: Session = None) -> List[str]:
+        """Get list of foreign tables in the local schema"""
+        query = r"""
+            SELECT c.relname            AS table_name
+              FROM pg_class             c
+             INNER JOIN
+                   pg_namespace         n
+                ON n.oid                = c.relnamespace
+             WHERE n.nspname            = %(schema_name)s
+               AND c.relkind            = 'f'
+        """
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, {'schema_name': schema_name})
+                return [row[0] for row in cur.fetchall()]
+
+
+    def get_local_schema_list_query(self) -> Tuple[str, Dict]:
+        """Query of the local schemas list and its bind values. Shared by sync and async API"""
+        query = r"""
+            SELECT n.nspname            AS schema_name
+              FROM pg_namespace         n
+             WHERE n.nspname            NOT IN ( 'pg_catalog'
+                                               , 'pg_toast'
+                                               , 'information_schema'
+                                               , %(datero)s
+                                               )
+               AND n.nspname            NOT LIKE %(datero)s || '\_%%'
+               AND NOT EXISTS
+                 (
+                   SELECT 1
+                     FROM pg_extension      e
+                    WHERE e.extname         LIKE '%%\_fdw'
+                      AND e.extnamespace    = n.oid
+                 )
+             ORDER BY n.nspname
+        """
+        return (query, {'datero': DATERO_SCHEMA})
+
+
+    def get_local_schema_list(self, session: Session = None):
+        """Get list of local schemas with set of categorization flags"""
+        query, params = self.get_local_schema_list_query()
+        try:
+            with self.pool.connection(session) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, params)
                     rows = cur.fetchall()
 
             res = [val[0] for val in rows]
@@ -223,7 +552,7 @@ class Schema:
             raise e
 
 
-    def get_local_schema_objects(self, schema_name: str):
+    def get_local_schema_objects(self, schema_name: str, session: Session = None):
         """Get list of local schema objects"""
         try:
             query = r"""
@@ -251,7 +580,7 @@ class Schema:
                        object_type
                      , object_name
             """
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
                     cur.execute(query, {'schema_name': schema_name, 'datero': DATERO_SCHEMA})
                     rows = cur.fetchall()
@@ -268,7 +597,7 @@ class Schema:
             raise e
 
 
-    def get_object_details(self, schema_name: str, object_name: str, object_type: str):
+    def get_object_details(self, schema_name: str, object_name: str, object_type: str, session: Session = None):
         """Get list of columns for a given table/view"""
         try:
             query = r"""
@@ -318,7 +647,7 @@ class Schema:
                 'object_type': object_type,
                 'datero': DATERO_SCHEMA
             }
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
                     cur.execute(query, params)
                     row = cur.fetchone()
@@ -334,3 +663,129 @@ class Schema:
         except psycopg2.Error as e:
             print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {query}\nParams: {params}')
             raise e
+
+
+    def get_objects_details_query(
+        self,
+        schema_name: str,
+        object_names: List[str] = None,
+        after: Tuple[str, str] = None,
+        limit: int = None
+    ) -> Tuple[str, Dict]:
+        """Query of the objects columns page and its bind values. Shared by sync and async API"""
+        query = r"""
+            SELECT c.relname                                AS object_name
+                 , c.relkind                                AS object_type
+                 , JSON_AGG
+                   ( JSON_BUILD_OBJECT('name', a.attname, 'data_type', t.typname)
+                     ORDER BY a.attnum
+                   )                                        AS columns
+              FROM pg_class             c
+             INNER JOIN
+                   pg_attribute         a
+                ON a.attrelid           = c.oid
+             INNER JOIN
+                   pg_type              t
+                ON t.oid                = a.atttypid
+             INNER JOIN
+                   pg_namespace         n
+                ON n.oid                = c.relnamespace
+             WHERE n.nspname            = %(schema_name)s
+               AND (%(object_names)s::TEXT[] IS NULL OR c.relname = ANY(%(object_names)s::TEXT[]))
+               AND (%(after_type)s::TEXT IS NULL OR (c.relkind, c.relname) > (%(after_type)s::"char", %(after_name)s::NAME))
+               AND a.attnum             > 0
+               AND NOT a.attisdropped
+               AND c.relkind            IN ('f', 'r', 'p', 'v', 'm')
+               AND n.nspname            NOT IN ( 'pg_catalog'
+                                               , 'pg_toast'
+                                               , 'information_schema'
+                                               , %(datero)s
+                                               )
+               AND NOT EXISTS
+                 (
+                   SELECT 1
+                     FROM pg_extension      e
+                    WHERE e.extname         LIKE '%%\_fdw'
+                      AND e.extnamespace    = n.oid
+                 )
+             GROUP BY
+                   c.relkind
+                 , c.relname
+             ORDER BY
+                   c.relkind
+                 , c.relname
+             LIMIT %(limit)s
+        """
+        params = {
+            'schema_name': schema_name,
+            'object_names': object_names,
+            'after_type': after[0] if after is not None else None,
+            'after_name': after[1] if after is not None else None,
+            # one extra row tells whether there is a next page
+            'limit': limit + 1 if limit is not None else None,
+            'datero': DATERO_SCHEMA
+        }
+        return (query, params)
+
+
+    def get_objects_details_result(self, rows: List[tuple], limit: int = None) -> Dict:
+        """Page of objects columns from the query rows"""
+        has_next = limit is not None and len(rows) > limit
+        rows = rows[:limit] if has_next else rows
+
+        return {
+            'objects': [{
+                'object_name': val[0],
+                'object_type': val[1],
+                'columns': val[2]
+            } for val in rows],
+            'next': (rows[-1][1], rows[-1][0]) if has_next else None
+        }
+
+
+    def get_objects_details(
+        self,
+        schema_name: str,
+        object_names: List[str] = None,
+        after: Tuple[str, str] = None,
+        limit: int = None,
+        session: Session = None
+    ) -> Dict:
+        """
+        Get list of columns for all tables/views in a schema or for the given list of them in a single query.
+        Objects are ordered by (object_type, object_name) pair which is used as a keyset for pagination.
+        To get the next page pass "next" value of the previous page as "after" parameter.
+        Returns { 'objects': [ { object_name, object_type, columns } ], 'next': (object_type, object_name) or None }
+        """
+        try:
+            query, params = self.get_objects_details_query(schema_name, object_names, after, limit)
+            with self.pool.connection(session) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, params)
+                    rows = cur.fetchall()
+
+            res = self.get_objects_details_result(rows, limit)
+
+            return res
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {query}\nParams: {params}')
+            raise e
+
+
+    def iter_objects_details(
+        self,
+        schema_name: str,
+        object_names: List[str] = None,
+        page_size: int = 500
+    ) -> Iterator[List[Dict]]:
+        """Stream columns of all tables/views in a schema page by page. Every page is fetched with a single query"""
+        after = None
+        while True:
+            page = self.get_objects_details(schema_name, object_names, after, page_size)
+            if len(page['objects']) > 0:
+                yield page['objects']
+
+            after = page['next']
+            if after is None:
+                break
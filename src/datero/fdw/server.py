@@ -1,16 +1,22 @@
 """Foreign server management"""
 
-from typing import Dict
+from typing import Dict, List, Tuple
 import psycopg2
 from psycopg2 import sql
 from copy import deepcopy
 import json
+import time
+import functools
 
 from .. import CONNECTION
-from ..connection import ConnectionPool
+from ..connection import ConnectionPool, Session
+from ..limits import ServerLimits
 from ..adapter import Adapter
+from ..cache import CatalogCache, ResultCache
+from ..parallel import run_parallel
 from .user import UserMapping
-from .util import options_and_values
+from .util import options_and_values, normalize_name
+from .tuning import apply_tuning_profile
 from .. import DATERO_SCHEMA
 
 
@@ -20,6 +26,9 @@ class Server:
     def __init__(self, config: Dict):
         self.config = config
         self.pool = ConnectionPool(self.config[CONNECTION])
+        self.catalog_cache = CatalogCache(self.config)
+        self.result_cache = ResultCache(self.config)
+        self.limits = ServerLimits(self.config)
         self.user_mapping = UserMapping(self.config)
 
     @property
@@ -28,8 +37,8 @@ class Server:
         return self.config['servers'] if 'servers' in self.config else {}
 
 
-    def server_list(self):
-        """Get list of foreign servers"""
+    def server_list_query(self, server_name: str = None) -> Tuple[sql.Composed, Dict]:
+        """Query of the foreign servers list and its bind values. Shared by sync and async API"""
         stmt = """
             SELECT fs.srvname                      AS server_name
                  , fdw.fdwname                     AS fdw_name
@@ -51,27 +60,41 @@ class Server:
               LEFT JOIN pg_description             d        ON d.classoid   = fs.tableoid
                                                            AND d.objoid     = fs.oid
                                                            AND d.objsubid   = 0
+             {where}
              ORDER BY d.description
         """
 
         query = sql.SQL(stmt).format(
             servers_table=sql.Identifier(DATERO_SCHEMA, 'servers'),
+            where=sql.SQL('WHERE fs.srvname = %(server_name)s' if server_name is not None else '')
         )
 
+        return (query, {'server_name': server_name})
+
+
+    def server_list_result(self, rows: List[tuple]) -> List[Dict]:
+        """Foreign servers from the query rows"""
+        return [{
+            'server_name': val[0],
+            'fdw_name': val[1],
+            'description': val[2],
+            'foreign_server': val[3],
+            'user_mapping': val[4],
+            **({'advanced_options': val[5]} if val[5] is not None else {})
+        } for val in rows]
+
+
+    def server_list(self, server_name: str = None, session: Session = None):
+        """Get list of foreign servers. Optionally filtered by server name"""
+        query, values = self.server_list_query(server_name)
+
         try:
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
-                    cur.execute(query)
+                    cur.execute(query, values)
                     rows = cur.fetchall()
 
-            res = [{
-                'server_name': val[0],
-                'fdw_name': val[1],
-                'description': val[2],
-                'foreign_server': val[3],
-                'user_mapping': val[4],
-                **({'advanced_options': val[5]} if val[5] is not None else {})
-            } for val in rows]
+            res = self.server_list_result(rows)
 
             return res
 
@@ -80,44 +103,106 @@ class Server:
             raise e
 
 
-    def get_server(self, server_name: str) -> Dict:
+    def get_server(self, server_name: str, session: Session = None) -> Dict:
         """Get server details"""
-        result = list(filter(lambda x: x['server_name'] == server_name, self.server_list()))
+        result = self.server_list(server_name, session)
         return result[0] if len(result) > 0 else None
 
 
-    def init_servers(self):
-        """Create foreign servers defined in config if any"""
+    def server_index(self, session: Session = None) -> Dict[str, Dict]:
+        """Existing foreign servers keyed by server name. Fetched with a single catalog query"""
+        return {server['server_name']: server for server in self.server_list(session=session)}
+
+
+    @property
+    def parallelism(self) -> int:
+        """Number of servers processed concurrently. Limited by the connection pool size"""
+        return min((self.config.get('provisioning') or {}).get('parallelism', 1), self.pool.pool.maxconn)
+
+
+    def init_servers(self) -> Dict:
+        """
+        Create foreign servers defined in config if any.
+        Existing servers are looked up in the catalog snapshot taken once before processing.
+        Missing servers are created concurrently, every one in its own transaction on a separate pooled connection.
+        Returns summary of the processing.
+        """
+        summary = {
+            'existing': [],
+            'invalid': [],
+            'created': {},  # server name -> creation time in seconds
+            'failed': {},   # server name -> error message
+            'check_time': 0.0,
+            'total_time': 0.0
+        }
+
         if self.servers:
             print('Creating foreign servers from config.yaml:', len(self.servers))
+
+            started = time.perf_counter()
+            index = self.server_index()
+            summary['check_time'] = time.perf_counter() - started
+
+            tasks = {}
             for name, props in self.servers.items():
-                
-                # replace spaces and hypens with underscores
-                server_name = name.replace(' ', '_').replace('-', '_')
+                server_name = self.normalize_name(name)
 
                 # validate server name according to the required rules:
                 if not self.is_valid_name(server_name):
-                    print(f'Invalid server name "{server_name}". Skipping...')
+                    summary['invalid'].append(server_name)
                     continue
 
-                server = self.get_server(server_name)
+                if server_name in index:
+                    summary['existing'].append(server_name)
+                    continue
 
-                if server is not None:
-                    print(f'Server "{server_name}" already exists. Skipping...')
+                server = deepcopy(props)
+                server['server_name'] = server_name
+                server['advanced_options'] = self.populate_advanced_options(server)
+                #print(f'Input: {server}')
+
+                tasks[server_name] = lambda server=server: self.create_server(server)
+
+            # we intentionally continue on error to create as many servers as possible
+            for server_name, res in run_parallel(tasks, self.parallelism).items():
+                if res['status'] == 'ok':
+                    summary['created'][server_name] = res['elapsed']
                 else:
-                    server = deepcopy(props)
-                    server['server_name'] = server_name
-                    server['advanced_options'] = self.populate_advanced_options(server)
-                    #print(f'Input: {server}')
-
-                    # we intentionally continue on error to create as many servers as possible
-                    try:
-                        self.create_server(server)
-                    except Exception as e:
-                        print(f'Error during creating server {server_name}: {e}')
+                    print(f'Error during creating server {server_name}: {res["error"]}')
+                    summary['failed'][server_name] = res['error']
+
+            summary['total_time'] = time.perf_counter() - started
+            self.print_summary(summary)
         else:
             print('No foreign servers defined in config.yaml. Nothing to create.')
 
+        return summary
+
+
+    def print_summary(self, summary: Dict):
+        """Print results of foreign servers processing"""
+        print(
+            f'Foreign servers: {len(self.servers)} in config, '
+            f'{len(summary["existing"])} already exist, '
+            f'{len(summary["created"])} created, '
+            f'{len(summary["failed"])} failed, '
+            f'{len(summary["invalid"])} invalid names'
+        )
+        print(f'  Existence check: {summary["check_time"]:.3f}s')
+        print(f'  Total time: {summary["total_time"]:.3f}s, parallelism: {self.parallelism}')
+
+        for server_name, elapsed in summary['created'].items():
+            print(f'  Created "{server_name}" in {elapsed:.3f}s')
+        for server_name, error in summary['failed'].items():
+            print(f'  Failed "{server_name}": {error}')
+        for server_name in summary['invalid']:
+            print(f'  Invalid server name "{server_name}". Skipped')
+
+
+    def normalize_name(self, name: str) -> str:
+        """Server name derived from the config file entry name"""
+        return normalize_name(name)
+
 
     def is_valid_name(self, name: str) -> bool:
         """Check if the name is a valid identifier"""
@@ -134,125 +219,196 @@ class Server:
         return all(c.isalnum() or c in ('-', '_') for c in name)
 
 
-    def create_server_by_name(self, server_name: str):
+    def create_server_by_name(self, server_name: str, session: Session = None):
         """Create foreign server by entry name in config file"""
-        return self.create_server(self.servers[server_name])
-
+        return self.create_server(self.servers[server_name], session)
 
-    def create_server(self, data: Dict):
-        """Create foreign server"""
-        try:
-            if 'server_name' not in data:
-                server_name = self.gen_server_name(data)
-            else:
-                server_name = data['server_name']
 
-            stmt = 'CREATE SERVER {server} FOREIGN DATA WRAPPER {fdw_name}'
-            values = None
+    def create_server(self, data: Dict, session: Session = None):
+        """
+        Create foreign server.
+        All steps are done in a single transaction. Either in the one of the given session or in a new one.
+        Options of the "tuning_profile" are added to the ones specified explicitly.
+        """
+        stmt = None
+        values = None
+        data = apply_tuning_profile(self.config, data)
 
-            with self.pool.connection() as conn:
-                with conn.cursor() as cur:
-                    key = 'foreign_server'
-                    if key in data and len(data[key]) > 0:
-                        stmt += ' OPTIONS ({options})'
-                        options, values = options_and_values(data[key])
+        try:
+            with self.pool.transaction(session) as session:
+                if 'server_name' not in data:
+                    server_name = self.gen_server_name(data, session)
+                else:
+                    server_name = data['server_name']
 
-                        query = sql.SQL(stmt).format(
-                            server=sql.Identifier(server_name),
-                            fdw_name=sql.Identifier(data['fdw_name']),
-                            options=options
-                        )
-                    else:
-                        query = sql.SQL(stmt).format(
-                            server=sql.Identifier(server_name),
-                            fdw_name=sql.Identifier(data['fdw_name'])
-                        )
+                with self.pool.connection(session) as conn:
+                    with conn.cursor() as cur:
+                        query, values = self.create_server_query(server_name, data)
+                        stmt = query.as_string(cur)
+                        cur.execute(query, values)
 
-                    stmt = query.as_string(cur)
-                    cur.execute(query, values)
+                # user mapping could have 0 options
+                key = 'user_mapping'
+                if key in data:
+                    self.user_mapping.create_user_mapping(
+                        server_name,
+                        data[key],
+                        session
+                    )
 
-            # user mapping could have 0 options
-            key = 'user_mapping'
-            if key in data:
-                self.user_mapping.create_user_mapping(
+                self.set_description(server_name, data['description'], session)
+                self.create_sys_views(server_name, data['fdw_name'], session)
+                self.create_server_metadata(
                     server_name,
-                    data[key]
+                    data['fdw_name'],
+                    data['description'],
+                    None if 'advanced_options' not in data else data['advanced_options'],
+                    session
                 )
 
-            self.set_description(server_name, data['description'])
-            self.create_sys_views(server_name, data['fdw_name'])
-            self.create_server_metadata(
-                server_name, 
-                data['fdw_name'], 
-                data['description'], 
-                None if 'advanced_options' not in data else data['advanced_options']
-            )
+                print(f'Foreign server "{server_name}" successfully created')
 
-            print(f'Foreign server "{server_name}" successfully created')
-
-            return self.get_server(server_name)
+                return self.get_server(server_name, session)
 
         except psycopg2.Error as e:
             print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}\nValues: {values}')
             raise e
 
 
-    def update_server(self, data: Dict):
-        """Update foreign server"""
-        try:
-            self.set_description(data['server_name'], data['description'])
-            stmt = None
-            values = None
+    def create_server_query(self, server_name: str, data: Dict) -> Tuple[sql.Composed, Dict]:
+        """CREATE SERVER statement and its bind values"""
+        stmt = 'CREATE SERVER {server} FOREIGN DATA WRAPPER {fdw_name}'
+        values = None
 
-            cur_server_options = self.get_server_options(data['server_name'])
-            #print(f'Current server options: {cur_server_options}')
+        key = 'foreign_server'
+        if key in data and len(data[key]) > 0:
+            stmt += ' OPTIONS ({options})'
+            options, values = options_and_values(data[key])
 
-            with self.pool.connection() as conn:
-                with conn.cursor() as cur:
-                    key = 'foreign_server'
-                    if key in data and len(data[key]) > 0:
-                        stmt = 'ALTER SERVER {server} OPTIONS ({options})'
+            query = sql.SQL(stmt).format(
+                server=sql.Identifier(server_name),
+                fdw_name=sql.Identifier(data['fdw_name']),
+                options=options
+            )
+        else:
+            query = sql.SQL(stmt).format(
+                server=sql.Identifier(server_name),
+                fdw_name=sql.Identifier(data['fdw_name'])
+            )
 
-                        options, values = options_and_values(input_options=data[key], current_options=cur_server_options)
-                        #print(f'New server options: {options.as_string(cur)}, values: {values}')
+        return (query, values)
 
-                        query = sql.SQL(stmt).format(
-                            server=sql.Identifier(data['server_name']),
-                            fdw_name=sql.Identifier(data['fdw_name']),
-                            options=options
-                        )
-                        stmt = query.as_string(cur)
-                        #print(f'Query: {stmt}')
-                        cur.execute(query, values)
 
-            key = 'user_mapping'
-            if key in data and len(data[key]) > 0:
-                self.user_mapping.alter_user_mapping(
+    def alter_server_query(
+        self,
+        server_name: str,
+        options: Dict,
+        current_options: Dict,
+        changed_only: bool = False
+    ) -> Tuple[sql.Composed, Dict]:
+        """ALTER SERVER statement and its bind values. Options absent in the input are dropped"""
+        stmt = 'ALTER SERVER {server} OPTIONS ({options})'
+        keys, values = options_and_values(options, current_options, changed_only)
+
+        query = sql.SQL(stmt).format(
+            server=sql.Identifier(server_name),
+            options=keys
+        )
+
+        return (query, values)
+
+
+    def update_server(self, data: Dict, session: Session = None):
+        """
+        Update foreign server.
+        All steps are done in a single transaction. Either in the one of the given session or in a new one.
+        Options of the "tuning_profile" are added to the ones specified explicitly.
+        Without "tuning_profile" key the profile server was created or last updated with is applied.
+        """
+        stmt = None
+        values = None
+
+        # foreign server options could point to a different remote database
+        self.invalidate_caches(data['server_name'])
+
+        try:
+            with self.pool.transaction(session) as session:
+                data = self.with_tuning_profile(data, session)
+                self.set_description(data['server_name'], data['description'], session)
+
+                cur_server_options = self.get_server_options(data['server_name'], session)
+                #print(f'Current server options: {cur_server_options}')
+
+                with self.pool.connection(session) as conn:
+                    with conn.cursor() as cur:
+                        key = 'foreign_server'
+                        if key in data and len(data[key]) > 0:
+                            query, values = self.alter_server_query(data['server_name'], data[key], cur_server_options)
+                            stmt = query.as_string(cur)
+                            #print(f'Query: {stmt}')
+                            cur.execute(query, values)
+
+                key = 'user_mapping'
+                if key in data and len(data[key]) > 0:
+                    self.user_mapping.alter_user_mapping(
+                        data['server_name'],
+                        data['user_mapping'],
+                        session
+                    )
+
+                self.update_server_metadata(
                     data['server_name'],
-                    data['user_mapping']
+                    data['fdw_name'],
+                    data['description'],
+                    None if 'advanced_options' not in data else data['advanced_options'],
+                    session
                 )
+                print(f'Foreign server "{data["server_name"]}" successfully updated')
 
-            self.update_server_metadata(
-                data['server_name'], 
-                data['fdw_name'], 
-                data['description'], 
-                None if 'advanced_options' not in data else data['advanced_options']
-            )
-            print(f'Foreign server "{data["server_name"]}" successfully updated')
+                # lookups done until commit could have cached the previous state
+                self.pool.after_commit(session, functools.partial(self.invalidate_caches, data['server_name']))
 
-            return self.get_server(data["server_name"])
+                return self.get_server(data["server_name"], session)
 
         except psycopg2.Error as e:
             print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}\nValues: {values}')
             raise e
 
 
-    def delete_server(self, data: Dict):
-        """Delete foreign server"""
+    def with_tuning_profile(self, data: Dict, session: Session = None) -> Dict:
+        """
+        Server definition with the options of its tuning profile added.
+        Profile is taken from the input or, if the key is absent, from the stored advanced options.
+        Explicit empty value detaches the profile.
+        """
+        profile = data.get('tuning_profile')
+        if 'tuning_profile' not in data:
+            profile = (data.get('advanced_options') or {}).get('tuning_profile')
+            if profile is None:
+                server = self.get_server(data['server_name'], session) or {}
+                profile = (server.get('advanced_options') or {}).get('tuning_profile')
+
+        if not profile:
+            return data
+
+        res = apply_tuning_profile(self.config, {**data, 'tuning_profile': profile})
+        res['advanced_options'] = {**(data.get('advanced_options') or {}), 'tuning_profile': profile}
+
+        return res
+
+
+    def delete_server(self, data: Dict, session: Session = None):
+        """
+        Delete foreign server.
+        Without session every imported schema deletion is committed separately.
+        Within session everything is deleted in the session transaction.
+        """
+        self.invalidate_caches(data['server_name'])
+
         try:
             stmt = None
 
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
 
                     stmt = 'DROP SERVER {server} CASCADE'
@@ -262,27 +418,41 @@ class Server:
                     cur.execute(query)
 
                     stmt = 'DROP SCHEMA {schema} CASCADE'
-                    for schema in self.get_imported_schemas(data["server_name"]):
+                    for schema in self.get_imported_schemas(data["server_name"], session):
                         query = sql.SQL(stmt).format(
                             schema=sql.Identifier(schema)
                         )
                         cur.execute(query)
-                        conn.commit()   # explicitly commit every schema deletion
+                        if session is None:
+                            conn.commit()   # explicitly commit every schema deletion
                         print(f'Schema "{schema}" successfully deleted')
 
-            self.delete_server_metadata(data["server_name"])
+            self.delete_server_metadata(data["server_name"], session)
 
             msg = f'Server "{data["description"]}" successfully deleted'
             print(msg)
 
-            return { 'message': msg }
-
         except psycopg2.Error as e:
             print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}')
             raise e
 
+        # lookups done until commit could have cached the previous state
+        self.pool.after_commit(session, functools.partial(self.invalidate_caches, data['server_name']))
+        return { 'message': msg }
+
+
+    def invalidate_caches(self, server_name: str):
+        """
+        Drop cached catalog lookups, query results and limits of the server.
+        Called both before the change and after its commit, so entries loaded by concurrent lookups meanwhile
+        are dropped too. Within session the latter is run on the session commit.
+        """
+        self.catalog_cache.invalidate_server(server_name)
+        self.result_cache.invalidate_server(server_name)
+        self.limits.invalidate()
+
 
-    def gen_server_name(self, data: Dict):
+    def gen_server_name(self, data: Dict, session: Session = None):
         """Generate server name"""
         query = r"""
             SELECT COALESCE
@@ -299,7 +469,7 @@ class Server:
              WHERE fdw.fdwname = %(fdw_name)s
         """
 
-        with self.pool.connection() as conn:
+        with self.pool.connection(session) as conn:
             with conn.cursor() as cur:
                 cur.execute(query, {'fdw_name': data['fdw_name']})
                 row = cur.fetchone()
@@ -310,9 +480,9 @@ class Server:
         return server_name
 
 
-    def set_description(self, server_name: str, description: str):
+    def set_description(self, server_name: str, description: str, session: Session = None):
         """Update user-defined name"""
-        with self.pool.connection() as conn:
+        with self.pool.connection(session) as conn:
             with conn.cursor() as cur:
                 stmt = 'COMMENT ON SERVER {server} IS %s'
                 query = sql.SQL(stmt).format(
@@ -322,17 +492,17 @@ class Server:
                 print(f'Description for "{server_name}" server successfully updated')
 
 
-    def create_sys_views(self, server_name: str, fdw_name: str):
+    def create_sys_views(self, server_name: str, fdw_name: str, session: Session = None):
         """Supplemental views to support schema/table import operations."""
         adapter = Adapter(fdw_name)
-        self.create_foreign_table(adapter.schema_list_table(), server_name, f'{server_name}_schema_list')
-        self.create_foreign_table(adapter.table_list_table(), server_name, f'{server_name}_table_list')
+        self.create_foreign_table(adapter.schema_list_table(), server_name, f'{server_name}_schema_list', session)
+        self.create_foreign_table(adapter.table_list_table(), server_name, f'{server_name}_table_list', session)
 
 
-    def create_foreign_table(self, stmt: str, server_name: str, table_name: str):
+    def create_foreign_table(self, stmt: str, server_name: str, table_name: str, session: Session = None):
         """Create helper dictionary foreign table in a public schema"""
         if stmt is not None:
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
                     query = sql.SQL(stmt).format(
                         full_table_name=sql.Identifier(DATERO_SCHEMA, table_name),
@@ -343,7 +513,7 @@ class Server:
 
 
     # get list of imported schemas
-    def get_imported_schemas(self, server_name: str):
+    def get_imported_schemas(self, server_name: str, session: Session = None):
         """Get list of imported schemas by specified server"""
         try:
             query = r"""
@@ -354,7 +524,7 @@ class Server:
                     ON dsc.objoid       = nsp.oid
                  WHERE dsc.description  LIKE %(comment)s
             """
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
                     cur.execute(query, {'comment': f'{server_name}#{DATERO_SCHEMA}#%'})
                     res = [row[0] for row in cur.fetchall()]
@@ -366,7 +536,7 @@ class Server:
             raise e
 
 
-    def get_server_options(self, server_name: str):
+    def get_server_options(self, server_name: str, session: Session = None):
         """Get server options"""
         query = r"""
             SELECT fso.option_name                          AS option_name
@@ -376,7 +546,7 @@ class Server:
              WHERE fs.srvname = %(server_name)s
         """
 
-        with self.pool.connection() as conn:
+        with self.pool.connection(session) as conn:
             with conn.cursor() as cur:
                 cur.execute(query, {'server_name': server_name})
                 ds = cur.fetchall()
@@ -387,7 +557,7 @@ class Server:
         return res
 
 
-    def create_server_metadata(self, server_name: str, fdw_name: str, description: str, custom_options: Dict):
+    def create_server_metadata(self, server_name: str, fdw_name: str, description: str, custom_options: Dict, session: Session = None):
         """Store server entry in the servers table"""
 
         stmt = """
@@ -406,7 +576,7 @@ class Server:
                  )
         """
 
-        with self.pool.connection() as conn:
+        with self.pool.connection(session) as conn:
             with conn.cursor() as cur:
                 query = sql.SQL(stmt).format(
                     servers_table=sql.Identifier(DATERO_SCHEMA, 'servers'),
@@ -418,10 +588,11 @@ class Server:
                     'custom_options': json.dumps(custom_options) 
                 })
 
+        self.pool.after_commit(session, self.limits.invalidate)
         print(f'Server "{server_name}" metadata successfully registered')
 
 
-    def update_server_metadata(self, server_name: str, fdw_name: str, description: str, custom_options: Dict):
+    def update_server_metadata(self, server_name: str, fdw_name: str, description: str, custom_options: Dict, session: Session = None):
         """Store server entry in the servers table"""
 
         stmt = """
@@ -433,7 +604,7 @@ class Server:
              WHERE name             = %(server_name)s
         """
 
-        with self.pool.connection() as conn:
+        with self.pool.connection(session) as conn:
             with conn.cursor() as cur:
                 query = sql.SQL(stmt).format(
                     servers_table=sql.Identifier(DATERO_SCHEMA, 'servers'),
@@ -445,10 +616,11 @@ class Server:
                     'custom_options': json.dumps(custom_options) 
                 })
 
+        self.pool.after_commit(session, self.limits.invalidate)
         print(f'Server "{server_name}" metadata successfully updated')
 
 
-    def delete_server_metadata(self, server_name: str):
+    def delete_server_metadata(self, server_name: str, session: Session = None):
         """Delete server metadata"""
         stmt = """
             DELETE 
@@ -456,19 +628,21 @@ class Server:
              WHERE name = %(server_name)s
         """
 
-        with self.pool.connection() as conn:
+        with self.pool.connection(session) as conn:
             with conn.cursor() as cur:
                 query = sql.SQL(stmt).format(
                     servers_table=sql.Identifier(DATERO_SCHEMA, 'servers'),
                 )
                 cur.execute(query, { 'server_name': server_name })
 
+        self.pool.after_commit(session, self.limits.invalidate)
         print(f'Server "{server_name}" metadata successfully deleted')
 
     
     def populate_advanced_options(self, server: Dict) -> Dict:
-        """Populate advanced options from the input options"""
+        """Populate advanced options from the input options. Options of the "tuning_profile" are included"""
         advanced_options = {}
+        server = apply_tuning_profile(self.config, server)
 
         if 'advanced' in self.config['fdw_options'][server['fdw_name']]:
             fdw_advanced_options = self.config['fdw_options'][server['fdw_name']]['advanced']
@@ -487,5 +661,43 @@ class Server:
 
                     if len(advanced_options[section]) == 0:
                         del advanced_options[section]
-        
-        return None if len(advanced_options) == 0 else advanced_options
\ No newline at end of file
+
+        # concurrency limits and statement timeout enforced by Datero itself
+        if server.get('limits'):
+            advanced_options['limits'] = server['limits']
+
+        # updates which don't specify the profile keep its options
+        if server.get('tuning_profile'):
+            advanced_options['tuning_profile'] = server['tuning_profile']
+
+        return None if len(advanced_options) == 0 else advanced_options
+
+
+    def set_limits(self, server_name: str, limits: Dict = None, session: Session = None):
+        """
+        Set or, if "limits" is empty, remove server limits stored in its custom options:
+        max_concurrency, queue_timeout (seconds), statement_timeout (milliseconds)
+        """
+        stmt = """
+            UPDATE {servers_table}
+               SET custom_options   = CASE
+                                        WHEN %(limits)s::jsonb IS NULL
+                                        THEN custom_options - 'limits'
+                                        ELSE COALESCE(custom_options, '{{}}'::jsonb) || jsonb_build_object('limits', %(limits)s::jsonb)
+                                      END
+                 , modified         = CURRENT_TIMESTAMP
+             WHERE name             = %(server_name)s
+        """
+
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                query = sql.SQL(stmt).format(
+                    servers_table=sql.Identifier(DATERO_SCHEMA, 'servers'),
+                )
+                cur.execute(query, {
+                    'server_name': server_name,
+                    'limits': json.dumps(limits) if limits else None
+                })
+
+        self.pool.after_commit(session, self.limits.invalidate)
+        print(f'Server "{server_name}" limits successfully {"set" if limits else "removed"}')
\ No newline at end of file
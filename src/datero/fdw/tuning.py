@@ -0,0 +1,39 @@
+"""FDW tuning profiles"""
+
+from typing import Dict
+from copy import deepcopy
+
+TUNING_PROFILES = 'tuning_profiles'
+
+# sections with options of the foreign tables. at import time they are passed as IMPORT FOREIGN SCHEMA options
+TABLE_SECTIONS = ['import_foreign_schema', 'create_foreign_table']
+
+
+def profile_options(config: Dict, profile: str, fdw_name: str) -> Dict:
+    """Options of the tuning profile for the given FDW grouped by FDW spec sections"""
+    profiles = config.get(TUNING_PROFILES) or {}
+    if profile not in profiles:
+        raise ValueError(f'Unknown tuning profile "{profile}". Available profiles: {", ".join(profiles)}')
+
+    return deepcopy((profiles[profile] or {}).get(fdw_name) or {})
+
+
+def apply_tuning_profile(config: Dict, data: Dict) -> Dict:
+    """
+    Server definition with the options of its "tuning_profile" added.
+    Explicitly specified options take precedence over the profile ones.
+    Table level options are added to the import options only if server has import section.
+    """
+    profile = data.get('tuning_profile')
+    if not profile:
+        return data
+
+    res = deepcopy(data)
+    for section, options in profile_options(config, profile, data['fdw_name']).items():
+        if section in TABLE_SECTIONS:
+            if res.get('import_foreign_schema'):
+                res['import_foreign_schema']['options'] = {**options, **(res['import_foreign_schema'].get('options') or {})}
+        else:
+            res[section] = {**options, **(res.get(section) or {})}
+
+    return res
@@ -1,11 +1,11 @@
 """Foreign server user mapping management"""
 
-from typing import Dict
+from typing import Dict, Tuple
 import psycopg2
 from psycopg2 import sql
 
 from .. import CONNECTION
-from ..connection import ConnectionPool
+from ..connection import ConnectionPool, Session
 from .util import options_and_values
 
 class UserMapping:
@@ -21,7 +21,7 @@ class UserMapping:
         return self.config['servers'] if 'servers' in self.config else {}
 
 
-    def init_user_mappings(self):
+    def init_user_mappings(self, session: Session = None):
         """Create user mapping for a foreign servers"""
         try:
             values = None
@@ -30,7 +30,7 @@ class UserMapping:
                 'SERVER {server} ' \
                 'OPTIONS ({options})'
 
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
                     for server, props in self.servers.items():
                         options, values = options_and_values(props['user_mapping'])
@@ -48,27 +48,15 @@ class UserMapping:
             raise e
 
 
-    def create_user_mapping(self, server: str, props: Dict):
+    def create_user_mapping(self, server: str, props: Dict, session: Session = None):
         """Create user mapping for a foreign server"""
         try:
-            stmt = 'CREATE USER MAPPING FOR CURRENT_USER SERVER {server}'
+            stmt = None
             values = None
 
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
-                    if props is not None and len(props) > 0:
-                        stmt += ' OPTIONS ({options})'
-                        options, values = options_and_values(props)
-
-                        query = sql.SQL(stmt).format(
-                            server=sql.Identifier(server),
-                            options=options
-                        )
-                    else:
-                        query = sql.SQL(stmt).format(
-                            server=sql.Identifier(server)
-                        )
-
+                    query, values = self.create_user_mapping_query(server, props)
                     stmt = query.as_string(cur)
                     cur.execute(query, values)
                     print(f'User mapping for foreign server "{server}" successfully created')
@@ -78,27 +66,62 @@ class UserMapping:
             raise e
 
 
-    def alter_user_mapping(self, server: str, props: Dict):
+    def create_user_mapping_query(self, server: str, props: Dict) -> Tuple[sql.Composed, Dict]:
+        """CREATE USER MAPPING statement and its bind values"""
+        stmt = 'CREATE USER MAPPING FOR CURRENT_USER SERVER {server}'
+        values = None
+
+        if props is not None and len(props) > 0:
+            stmt += ' OPTIONS ({options})'
+            options, values = options_and_values(props)
+
+            query = sql.SQL(stmt).format(
+                server=sql.Identifier(server),
+                options=options
+            )
+        else:
+            query = sql.SQL(stmt).format(
+                server=sql.Identifier(server)
+            )
+
+        return (query, values)
+
+
+    def alter_user_mapping_query(
+        self,
+        server: str,
+        props: Dict,
+        current_options: Dict,
+        changed_only: bool = False
+    ) -> Tuple[sql.Composed, Dict]:
+        """ALTER USER MAPPING statement and its bind values. Options absent in the input are dropped"""
+        stmt = \
+            'ALTER USER MAPPING FOR CURRENT_USER ' \
+            'SERVER {server} ' \
+            'OPTIONS ({options})'
+
+        options, values = options_and_values(props, current_options, changed_only)
+
+        query = sql.SQL(stmt).format(
+            server=sql.Identifier(server),
+            options=options
+        )
+
+        return (query, values)
+
+
+    def alter_user_mapping(self, server: str, props: Dict, session: Session = None):
         """Alter user mapping for a foreign server"""
         try:
+            stmt = None
             values = None
-            stmt = \
-                'ALTER USER MAPPING FOR CURRENT_USER ' \
-                'SERVER {server} ' \
-                'OPTIONS ({options})'
 
-            cur_user_mapping_options = self.get_user_mapping_options(server)
+            cur_user_mapping_options = self.get_user_mapping_options(server, session)
             #print(f'Current user mapping options: {cur_user_mapping_options}')
 
-            with self.pool.connection() as conn:
+            with self.pool.connection(session) as conn:
                 with conn.cursor() as cur:
-                    options, values = options_and_values(input_options=props, current_options=cur_user_mapping_options)
-                    #print(f'New user mapping options: {options.as_string(cur)}, values: {values}')
-
-                    query = sql.SQL(stmt).format(
-                        server=sql.Identifier(server),
-                        options=options
-                    )
+                    query, values = self.alter_user_mapping_query(server, props, cur_user_mapping_options)
                     stmt = query.as_string(cur)
                     #print(f'Query: {stmt}')
                     cur.execute(query, values)
@@ -109,7 +132,7 @@ class UserMapping:
             raise e
 
 
-    def get_user_mapping_options(self, server_name: str):
+    def get_user_mapping_options(self, server_name: str, session: Session = None):
         """Get user mapping options"""
         query = r"""
             SELECT umo.option_name                          AS option_name
@@ -119,7 +142,7 @@ class UserMapping:
              WHERE um.srvname = %(server_name)s
         """
 
-        with self.pool.connection() as conn:
+        with self.pool.connection(session) as conn:
             with conn.cursor() as cur:
                 cur.execute(query, {'server_name': server_name})
                 ds = cur.fetchall()
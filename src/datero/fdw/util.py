@@ -4,13 +4,18 @@ from typing import Dict, Tuple
 from enum import Enum
 from psycopg2 import sql
 
-def options_and_values(input_options: Dict, current_options: Dict = {}) -> Tuple[sql.SQL, Dict]:
-    """Prepare list of key-value options in a safe bind variables manner"""
+def options_and_values(input_options: Dict, current_options: Dict = {}, changed_only: bool = False) -> Tuple[sql.SQL, Dict]:
+    """
+    Prepare list of key-value options in a safe bind variables manner.
+    If "changed_only" is set, options with the same current value are skipped.
+    """
 
     # for Create operation modifier must be '' empty string
     # for Update it could be either 'set' or 'add'
     add_or_empty = '' if current_options == {} else 'add'
 
+    options = changed_options(input_options, current_options) if changed_only else input_options
+
     # direct path to specify SET/ADD modifiers
     new_existing_options = [
         sql.SQL(' ').join([
@@ -18,7 +23,7 @@ def options_and_values(input_options: Dict, current_options: Dict = {}) -> Tuple
             sql.SQL(option),
             sql.Placeholder(option)
         ])
-        for option in input_options.keys()
+        for option in options.keys()
     ]
     drop_options = [
         sql.SQL(' ').join([
@@ -31,12 +36,33 @@ def options_and_values(input_options: Dict, current_options: Dict = {}) -> Tuple
     keys = sql.SQL(', ').join(new_existing_options + drop_options)
 
     values = {}
-    for option, value in input_options.items():
+    for option, value in options.items():
         values[option] = str(value)
 
     return (keys, values)
 
 
+def changed_options(input_options: Dict, current_options: Dict) -> Dict:
+    """Input options which are absent or have different value in the current options"""
+    return {
+        option: value
+        for option, value in input_options.items()
+        if option not in current_options or current_options[option] != str(value)
+    }
+
+
+def options_differ(input_options: Dict, current_options: Dict) -> bool:
+    """Check if applying input options over the current ones changes anything"""
+    return len(changed_options(input_options, current_options)) > 0 \
+        or any(option not in input_options for option in current_options)
+
+
+def normalize_name(name: str) -> str:
+    """Foreign server name derived from the config file entry name"""
+    # replace spaces and hypens with underscores
+    return name.replace(' ', '_').replace('-', '_')
+
+
 class FdwType(Enum):
     """FDW types"""
     MYSQL = 'mysql_fdw'
@@ -53,3 +79,9 @@ class ImportType(Enum):
     """Schema/Table import levels"""
     SCHEMA = 'schema'
     TABLE = 'table'
+
+
+class ImportMode(Enum):
+    """Schema import modes"""
+    FULL = 'full'
+    INCREMENTAL = 'incremental'
@@ -0,0 +1,289 @@
+"""Asynchronous execution of long-running operations"""
+from typing import Any, Callable, Dict, List
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import Enum
+import json
+import threading
+import psycopg2
+from psycopg2 import sql
+
+from . import CONNECTION
+from .connection import ConnectionPool, Session
+from . import DATERO_SCHEMA
+
+# handler(params, session, progress) -> JSON serializable result
+Handler = Callable[[Dict, Session, Callable[[float, str], None]], Any]
+
+
+class JobStatus(Enum):
+    """Job lifecycle states"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+
+class JobCancelled(Exception):
+    """Raised within the job handler to stop the cancelled job between statements"""
+
+
+class JobQueue:
+    """
+    Queue of long-running operations tracked in "datero.jobs" table.
+    Jobs are executed by the local worker pool with at most "jobs.concurrency" of them in flight.
+    Every job runs in its own transaction on a dedicated pooled connection, whose backend pid is recorded,
+    so the job could be cancelled with pg_cancel_backend. Status and progress are stored on a separate connection
+    and are visible to other processes immediately.
+    """
+    CONCURRENCY = 2
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.pool = ConnectionPool(self.config[CONNECTION])
+        self.handlers = {}
+
+        self._executor = None
+        self._futures = {}     # job id -> future
+        self._pids = {}        # job id -> backend pid of the session connection while the job holds it
+        self._cancelled = set()
+        self._lock = threading.Lock()
+
+    @property
+    def concurrency(self) -> int:
+        """
+        Number of concurrently executed jobs.
+        Every running job holds its session connection and needs one more to record its status,
+        so it's limited by the connection pool size minus one.
+        """
+        return max(
+            min((self.config.get('jobs') or {}).get('concurrency', JobQueue.CONCURRENCY), self.pool.pool.maxconn - 1),
+            1
+        )
+
+
+    def register(self, kind: str, handler: Handler):
+        """
+        Register handler of the job kind.
+        Handler is called with job params, session to run all statements in and progress callback.
+        """
+        self.handlers[kind] = handler
+
+
+    def submit(self, kind: str, params: Dict = None) -> int:
+        """Store new job and queue it for execution. Returns job id"""
+        if kind not in self.handlers:
+            raise ValueError(f'Unknown job kind "{kind}". Available kinds: {", ".join(self.handlers)}')
+
+        stmt = sql.SQL("""
+            INSERT
+              INTO {jobs_table}
+                 ( kind
+                 , params
+                 , status
+                 , progress
+                 )
+            VALUES
+                 ( %(kind)s
+                 , %(params)s::jsonb
+                 , %(status)s
+                 , 0
+                 )
+            RETURNING id
+        """).format(jobs_table=sql.Identifier(DATERO_SCHEMA, 'jobs'))
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(stmt, {
+                    'kind': kind,
+                    'params': json.dumps(params, default=str),
+                    'status': JobStatus.QUEUED.value
+                })
+                job_id = cur.fetchone()[0]
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='datero-job')
+            self._futures[job_id] = self._executor.submit(self.execute, job_id, kind, params or {})
+
+        print(f'Job {job_id} "{kind}" submitted')
+
+        return job_id
+
+
+    def execute(self, job_id: int, kind: str, params: Dict):
+        """Run the job and record its outcome"""
+        if job_id in self._cancelled:
+            return
+
+        def progress(value: float = None, message: str = None):
+            """Record job progress. Completed fraction could be unknown"""
+            if job_id in self._cancelled:
+                raise JobCancelled()
+            self.update(job_id, message=message, **({'progress': value} if value is not None else {}))
+
+        try:
+            with self.pool.transaction() as session:
+                try:
+                    with self.pool.connection(session) as conn:
+                        with conn.cursor() as cur:
+                            cur.execute('SELECT pg_backend_pid()')
+                            pid = cur.fetchone()[0]
+
+                    with self._lock:
+                        self._pids[job_id] = pid
+                    self.update(job_id, status=JobStatus.RUNNING.value, backend_pid=pid, started=True)
+                    if job_id in self._cancelled:
+                        raise JobCancelled()
+
+                    result = self.handlers[kind](params, session, progress)
+
+                    # cancelled between statements. nothing was interrupted, so job transaction is rolled back here.
+                    # otherwise the job is committed and can't be cancelled anymore
+                    with self._lock:
+                        if job_id in self._cancelled:
+                            raise JobCancelled()
+                        self._futures.pop(job_id, None)
+                finally:
+                    # connection goes back to the pool next. its backend must not be cancelled on behalf of the job
+                    with self._lock:
+                        self._pids.pop(job_id, None)
+
+            self.update(
+                job_id,
+                status=JobStatus.SUCCEEDED.value,
+                progress=1,
+                result=json.dumps(result, default=str),
+                finished=True
+            )
+            print(f'Job {job_id} "{kind}" succeeded')
+
+        except Exception as e:
+            # cancelled statement raises QueryCanceledError
+            try:
+                if job_id in self._cancelled:
+                    self.update(job_id, status=JobStatus.CANCELLED.value, finished=True)
+                    print(f'Job {job_id} "{kind}" cancelled')
+                else:
+                    self.update(job_id, status=JobStatus.FAILED.value, error=str(e), finished=True)
+                    print(f'Job {job_id} "{kind}" failed: {e}')
+            except Exception as update_error:
+                print(f'Job {job_id} "{kind}" failed: {e}. Failed to record job status: {update_error}')
+
+        finally:
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._cancelled.discard(job_id)
+
+
+    def update(self, job_id: int, **fields):
+        """Update job record. "started" and "finished" flags set corresponding timestamps"""
+        assignments = []
+        for name in ('status', 'progress', 'message', 'result', 'error', 'backend_pid'):
+            if name in fields:
+                assignments.append(sql.SQL('{column} = {value}').format(
+                    column=sql.Identifier(name),
+                    value=sql.SQL('%({name})s::jsonb' if name == 'result' else '%({name})s').format(name=sql.SQL(name))
+                ))
+        for name in ('started', 'finished'):
+            if fields.pop(name, False):
+                assignments.append(sql.SQL('{column} = CURRENT_TIMESTAMP').format(column=sql.Identifier(name)))
+
+        stmt = sql.SQL('UPDATE {jobs_table} SET {assignments} WHERE id = %(id)s').format(
+            jobs_table=sql.Identifier(DATERO_SCHEMA, 'jobs'),
+            assignments=sql.SQL(', ').join(assignments)
+        )
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(stmt, {**fields, 'id': job_id})
+
+
+    def job_list(self, job_id: int = None, status: str = None) -> List[Dict]:
+        """Get list of jobs. Optionally filtered by job id or status. Most recent first"""
+        where = []
+        if job_id is not None:
+            where.append(sql.SQL('j.id = %(id)s'))
+        if status is not None:
+            where.append(sql.SQL('j.status = %(status)s'))
+
+        query = sql.SQL("""
+            SELECT j.id
+                 , j.kind
+                 , j.params
+                 , j.status
+                 , j.progress
+                 , j.message
+                 , j.result
+                 , j.error
+                 , j.backend_pid
+                 , j.submitted
+                 , j.started
+                 , j.finished
+              FROM {jobs_table}     j
+             {where}
+             ORDER BY j.id DESC
+        """).format(
+            jobs_table=sql.Identifier(DATERO_SCHEMA, 'jobs'),
+            where=sql.SQL('WHERE ') + sql.SQL(' AND ').join(where) if where else sql.SQL('')
+        )
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, {'id': job_id, 'status': status})
+                columns = [col.name for col in cur.description]
+                return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+    def poll(self, job_id: int) -> Dict:
+        """Get job status, progress and result"""
+        res = self.job_list(job_id)
+        return res[0] if len(res) > 0 else None
+
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancel queued or running job.
+        Running statement of the job is interrupted by pg_cancel_backend. Job transaction is rolled back.
+        Cancel is sent under the lock while the job holds its connection, so it can't hit a statement of another
+        operation which got the same connection from the pool afterwards.
+        Returns False if the job is already finished or isn't executed by this process.
+        """
+        try:
+            # connection is taken upfront. job releases its one under the same lock, so waiting for a free one
+            # while holding the lock could deadlock on exhausted pool
+            with self.pool.connection() as conn:
+                with self._lock:
+                    future: Future = self._futures.get(job_id)
+                    if future is None:
+                        return False
+
+                    self._cancelled.add(job_id)
+                    started = not future.cancel()
+                    if not started:
+                        self._futures.pop(job_id, None)
+                        self._cancelled.discard(job_id)
+                    elif self._pids.get(job_id) is not None:
+                        with conn.cursor() as cur:
+                            cur.execute('SELECT pg_cancel_backend(%(pid)s)', {'pid': self._pids[job_id]})
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nJob: {job_id}')
+            raise e
+
+        if not started:
+            self.update(job_id, status=JobStatus.CANCELLED.value, finished=True)
+            print(f'Job {job_id} cancelled')
+
+        return True
+
+
+    def shutdown(self, wait: bool = True):
+        """Stop worker pool. Queued jobs are cancelled"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            for job_id in list(self._futures):
+                self.cancel(job_id)
+            executor.shutdown(wait=wait)
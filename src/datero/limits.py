@@ -0,0 +1,157 @@
+"""Per foreign server concurrency limits and statement timeouts"""
+from typing import Dict, Iterable
+from contextlib import contextmanager
+import threading
+import psycopg2
+from psycopg2 import sql
+
+from . import CONNECTION
+from .cache import TTLCache
+from .connection import ConnectionPool, Session
+from . import DATERO_SCHEMA
+
+
+class ServerBusyError(Exception):
+    """Raised when the foreign server concurrency limit is reached and the operation can't wait any longer"""
+
+
+class ServerLimits:
+    """
+    Registry of per foreign server limits singleton.
+    Limits are stored in "limits" key of the server custom options in "datero.servers" table:
+        max_concurrency: maximum number of concurrent operations of this process targeting the server
+        queue_timeout: seconds to wait for a free slot. 0 rejects excess operations at once, not set waits forever
+        statement_timeout: default statement timeout in milliseconds of the operations targeting the server
+    Limits are cached for "limits.ttl" seconds and reloaded on the server metadata changes.
+    """
+    _lock_instance = threading.Lock()
+
+    def __new__(cls, *_):
+        """Registry object is singleton"""
+        with cls._lock_instance:
+            if not hasattr(cls, 'instance'):
+                cls.instance = super(ServerLimits, cls).__new__(cls)
+                cls._initialized = False
+        return cls.instance
+
+
+    def __init__(self, config: Dict):
+        with ServerLimits._lock_instance:
+            if self._initialized:
+                return
+
+            self.config = config
+            self.pool = ConnectionPool(self.config[CONNECTION])
+            self.cache = TTLCache(1, (self.config.get('limits') or {}).get('ttl', 30))
+
+            self._semaphores = {}   # server name -> (max concurrency, semaphore)
+            self._lock = threading.Lock()
+
+            self._initialized = True
+
+
+    def load(self, session: Session = None) -> Dict[str, Dict]:
+        """
+        Limits of all servers having them keyed by server name.
+        Failed lookup, e.g. of a database without Datero schema, means no limits.
+        It's cached as well, so the lookup isn't retried by every operation.
+        """
+        query = sql.SQL("""
+            SELECT s.name
+                 , s.custom_options -> 'limits'
+              FROM {servers_table}          s
+             WHERE s.custom_options ? 'limits'
+        """).format(servers_table=sql.Identifier(DATERO_SCHEMA, 'servers'))
+
+        try:
+            with self.pool.connection(session) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(query)
+                    return {row[0]: row[1] for row in cur.fetchall() if row[1]}
+        except psycopg2.Error as e:
+            print(f'Failed to load foreign servers limits. Running without limits\nError code: {e.pgcode}\nMessage: {e.pgerror}')
+            return {}
+
+
+    def limits(self) -> Dict[str, Dict]:
+        """Cached limits of all servers"""
+        return self.cache.get_or_load('limits', self.load)
+
+
+    def limited(self) -> set:
+        """Names of the servers having limits"""
+        return set(self.limits().keys())
+
+
+    def invalidate(self):
+        """Reload limits on the next lookup"""
+        self.cache.invalidate()
+
+
+    def semaphore(self, server_name: str, size: int) -> threading.BoundedSemaphore:
+        """Semaphore of the server. Recreated if the limit is changed, holders of the old one release it as usual"""
+        with self._lock:
+            current = self._semaphores.get(server_name)
+            if current is None or current[0] != size:
+                current = (size, threading.BoundedSemaphore(size))
+                self._semaphores[server_name] = current
+            return current[1]
+
+
+    @contextmanager
+    def acquire(self, servers: Iterable[str]):
+        """
+        Hold a slot of every given server for the duration of the operation.
+        Servers are acquired in the name order to avoid deadlocks of operations spanning several servers.
+        Raises ServerBusyError if a slot isn't obtained within the server "queue_timeout".
+        """
+        servers = sorted(set(servers))
+        limits = self.limits() if servers else {}
+        acquired = []
+
+        try:
+            for server_name in servers:
+                conf = limits.get(server_name) or {}
+                if not conf.get('max_concurrency'):
+                    continue
+
+                semaphore = self.semaphore(server_name, int(conf['max_concurrency']))
+                timeout = conf.get('queue_timeout')
+
+                if timeout == 0:
+                    ok = semaphore.acquire(blocking=False)
+                else:
+                    ok = semaphore.acquire(timeout=timeout)
+
+                if not ok:
+                    raise ServerBusyError(
+                        f'Foreign server "{server_name}" is busy: '
+                        f'limit of {conf["max_concurrency"]} concurrent operations is reached'
+                    )
+                acquired.append(semaphore)
+
+            yield
+
+        finally:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+
+
+    def set_statement_timeout(self, cur, servers: Iterable[str]):
+        """
+        Apply the smallest statement timeout of the given servers to the current transaction (SET LOCAL).
+        Within session it remains in effect until the end of the session transaction.
+        """
+        servers = list(servers)
+        if not servers:
+            return
+
+        limits = self.limits()
+        timeouts = [
+            int(limits[server_name]['statement_timeout'])
+            for server_name in servers
+            if (limits.get(server_name) or {}).get('statement_timeout')
+        ]
+
+        if len(timeouts) > 0:
+            cur.execute("SELECT set_config('statement_timeout', %(timeout)s, true)", {'timeout': str(min(timeouts))})
@@ -2,17 +2,26 @@
 import sys
 import argparse
 
-from .app import App
-
 
 def parse_params() -> argparse.Namespace:
     """Parse input parameters"""
     parser = argparse.ArgumentParser()
-    parser.add_argument('-c', '--config_file', help='config file with foreign servers definition')
+    parser.add_argument('-c', '--config_file', help='config file, directory or glob of config files with foreign servers definition')
     parser.add_argument('-r', '--run', action='store_true', help='process config file and create foreign servers')
     parser.add_argument('-s', '--servers', action='store_true', help='print list of created foreign servers')
     parser.add_argument('-f', '--fdw-list', action='store_true', help='print list of available FDWs')
     parser.add_argument('-p', '--health-check', action='store_true', help='run health check')
+    parser.add_argument('-e', '--export', metavar='QUERY', help='export query result via COPY into --output file')
+    parser.add_argument('-o', '--output', help='output file for --export')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'arrow'], default='csv', help='--export output format')
+    parser.add_argument('--benchmark', metavar='QUERY', help='measure rows/sec of query over --server under tuning profiles')
+    parser.add_argument('--server', help='foreign server for --benchmark')
+    parser.add_argument('--profile', action='append', help='tuning profile for --benchmark. could be repeated. all profiles by default')
+    parser.add_argument('--repeat', type=int, default=1, help='number of --benchmark runs per profile. best one is reported')
+    parser.add_argument('--plan', action='store_true', help='print changes required to bring foreign servers in line with config file')
+    parser.add_argument('--apply', action='store_true', help='apply changes required to bring foreign servers in line with config file')
+    parser.add_argument('--prune', action='store_true', help='with --plan/--apply/--watch drop managed foreign servers absent in config file')
+    parser.add_argument('-w', '--watch', action='store_true', help='watch config file and apply changed foreign servers until interrupted')
     parser.add_argument('-v', '--version', action='version', version='0.0.7')
 
     if len(sys.argv) < 2:
@@ -20,6 +29,11 @@ def parse_params() -> argparse.Namespace:
 
     args = parser.parse_args()
 
+    if args.export and args.output is None:
+        parser.error('--export requires --output file')
+    if args.benchmark and args.server is None:
+        parser.error('--benchmark requires --server name')
+
     return args
 
 
@@ -27,6 +41,9 @@ def main():
     """Application entry point"""
     args = parse_params()
 
+    # imported after arguments parsing to keep --help and --version instant
+    from .app import App
+
     app = App(args.config_file)
 
     if args.run:
@@ -40,6 +57,16 @@ def main():
         for row in res:
             #print(f"Name: {row['server_name']}, Description: {row['fdw_name']}")
             print(row)
+    elif args.plan:
+        app.plan(args.prune)
+    elif args.apply:
+        app.apply(args.prune)
+    elif args.watch:
+        app.watch(args.prune)
+    elif args.export:
+        app.export(args.export, args.output, args.format)
+    elif args.benchmark:
+        app.benchmark_profiles(args.server, args.benchmark, args.profile, args.repeat)
     elif args.health_check:
         res = app.health_check
         print(f"Status: {res['status']}, Version: {res['version']}, Heartbeat: {res['heartbeat']}")
@@ -0,0 +1,34 @@
+"""Concurrent execution of independent tasks"""
+from typing import Any, Callable, Dict
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+
+def run_task(task: Callable[[], Any]) -> Dict:
+    """Run single task and record its outcome and wall time"""
+    started = time.perf_counter()
+    try:
+        res = {'status': 'ok', 'result': task()}
+    except Exception as e:
+        res = {'status': 'error', 'error': str(e)}
+
+    res['elapsed'] = time.perf_counter() - started
+    return res
+
+
+def run_parallel(tasks: Dict[str, Callable[[], Any]], parallelism: int = 1) -> Dict[str, Dict]:
+    """
+    Run independent tasks with at most "parallelism" of them in flight.
+    Failure of one task doesn't affect the others.
+    Returns outcome of every task keyed by task name:
+    {'status': 'ok', 'result': <task result>, 'elapsed': <seconds>} or
+    {'status': 'error', 'error': <message>, 'elapsed': <seconds>}
+    """
+    parallelism = max(int(parallelism or 1), 1)
+
+    if parallelism == 1 or len(tasks) < 2:
+        return {name: run_task(task) for name, task in tasks.items()}
+
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(tasks)), thread_name_prefix='datero') as executor:
+        futures = {name: executor.submit(run_task, task) for name, task in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
@@ -1,37 +1,279 @@
-from psycopg2 import pool, OperationalError
+import logging
+import threading
+import time
+from collections import deque
 
-class RestartableConnectionPool(pool.SimpleConnectionPool):
+import psycopg2
+from psycopg2 import extensions, OperationalError
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+
+class BlockingConnectionPool:
+    """
+    Thread-safe connection pool.
+    Connections are opened on demand up to the maximum pool size.
+    When all of them are in use, callers are queued until a connection is returned or the timeout expires.
+    Idle connections above the minimum pool size are closed after being unused for "max_idle" seconds.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float = None, max_idle: float = None, **kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise PoolError(f'Invalid pool size: min {minconn}, max {maxconn}')
+
+        self.minconn = int(minconn)
+        self.maxconn = int(maxconn)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.closed = False
+
+        self._kwargs = kwargs
+        self._idle = deque()    # (connection, returned at) pairs. most recently returned are on the right
+        self._used = {}         # id(connection) -> connection
+        self._returned_at = {}  # id(connection) -> time when checked out connection was returned to the pool last time
+        self._size = 0          # number of opened connections, including ones being opened right now
+        self._cond = threading.Condition()
+
+        for _ in range(self.minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+
+    def _connect(self):
+        """Open new connection"""
+        return psycopg2.connect(**self._kwargs)
+
+
+    def _reap_idle(self):
+        """Close connections which stayed idle for too long. Must be called with the lock held"""
+        if self.max_idle is None:
+            return
+
+        now = time.monotonic()
+        while self._idle and self._size > self.minconn and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            conn.close()
+
+
+    def getconn(self):
+        """
+        Get a connection from the pool.
+        If the pool is exhausted, wait until some connection is returned.
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        conn = None
+
+        with self._cond:
+            while True:
+                if self.closed:
+                    raise PoolError('connection pool is closed')
+
+                self._reap_idle()
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    self._returned_at[id(conn)] = returned_at
+                    break
+
+                if self._size < self.maxconn:
+                    # reserve a slot and open connection outside of the lock
+                    self._size += 1
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolError(f'Timed out after {self.timeout} seconds waiting for a free connection')
+
+                self._cond.wait(remaining)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        with self._cond:
+            self._used[id(conn)] = conn
+
+        return conn
+
+
+    def putconn(self, conn, close: bool = False):
+        """
+        Return connection to the pool. Broken connections or the ones marked with "close" flag are discarded.
+        Connections returned after the pool is closed are just closed, so holders can release them as usual on shutdown.
+        """
+        with self._cond:
+            if self.closed:
+                if not conn.closed:
+                    conn.close()
+                return
+            if self._used.pop(id(conn), None) is None:
+                raise PoolError('trying to put unkeyed connection')
+            self._returned_at.pop(id(conn), None)
+
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                # connection is lost
+                close = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                # connection is in a transaction or in error state
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+
+        with self._cond:
+            if close or conn.closed or self.closed:
+                self._size -= 1
+                if not conn.closed:
+                    conn.close()
+            else:
+                self._idle.append((conn, time.monotonic()))
+
+            self._cond.notify()
+
+
+    def idle_since(self, conn):
+        """Time when checked out connection was put into the pool last time. None for freshly opened connections"""
+        with self._cond:
+            return self._returned_at.get(id(conn))
+
+
+    def discard_idle(self):
+        """Close all idle connections. They are reopened on demand"""
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._size -= 1
+                conn.close()
+
+            self._cond.notify_all()
+
+
+    def closeall(self):
+        """Close all connections, including the ones currently in use"""
+        with self._cond:
+            if self.closed:
+                return
+
+            for conn, _ in self._idle:
+                conn.close()
+            for conn in self._used.values():
+                conn.close()
+
+            self._idle.clear()
+            self._used.clear()
+            self._returned_at.clear()
+            self._size = 0
+            self.closed = True
+            self._cond.notify_all()
+
+
+class RestartableConnectionPool(BlockingConnectionPool):
     """
     Some FDWs cause PostgreSQL server crash and following auto-restart.
     This invalidates all connections in the pool.
     This class is a workaround to handle this situation.
-    It tries to get a valid connection up to 10 times.
+    Connections are validated on checkout according to the validation policy:
+    - always: validate every connection
+    - idle: validate connections which stayed idle longer than "validation_idle_time" seconds
+    - on_failure: validate only connections which were idle in the pool when some connection was found broken
+    Connections idle across a detected failure are validated with any policy.
+    Invalid connections are replaced with new ones using bounded exponential backoff between attempts.
     """
-    
-    def getconn(self, key=None):
+    VALIDATE_ALWAYS = 'always'
+    VALIDATE_IDLE = 'idle'
+    VALIDATE_ON_FAILURE = 'on_failure'
+
+    def __init__(
+        self,
+        minconn: int,
+        maxconn: int,
+        validation: str = VALIDATE_IDLE,
+        validation_idle_time: float = 30,
+        reconnect_attempts: int = 10,
+        reconnect_backoff: float = 0.1,
+        reconnect_max_backoff: float = 5,
+        **kwargs
+    ):
+        if validation not in (self.VALIDATE_ALWAYS, self.VALIDATE_IDLE, self.VALIDATE_ON_FAILURE):
+            raise PoolError(f'Unknown connection validation policy "{validation}"')
+
+        self.validation = validation
+        self.validation_idle_time = validation_idle_time
+        self.reconnect_attempts = max(int(reconnect_attempts), 1)
+        self.reconnect_backoff = reconnect_backoff
+        self.reconnect_max_backoff = reconnect_max_backoff
+        self._failed_at = None  # time when broken connection was detected last time
+
+        super().__init__(minconn, maxconn, **kwargs)
+
+
+    def mark_failed(self):
+        """
+        Register that some connection was found broken.
+        Connections idle at this moment are most probably broken too. They are validated on their next checkout
+        and replaced if they are, so connections which survived the failure are kept.
+        """
+        self._failed_at = time.monotonic()
+
+
+    def needs_validation(self, conn) -> bool:
+        """Check whether connection must be validated according to the validation policy"""
+        if self.validation == self.VALIDATE_ALWAYS:
+            return True
+
+        idle_since = self.idle_since(conn)
+        if idle_since is None:
+            # freshly opened connection
+            return False
+
+        if self._failed_at is not None and idle_since <= self._failed_at:
+            return True
+
+        # without idle time only connections idle across a failure are validated
+        return self.validation == self.VALIDATE_IDLE \
+            and self.validation_idle_time is not None \
+            and time.monotonic() - idle_since > self.validation_idle_time
+
+
+    def getconn(self):
         """
         Get a connection from the pool.
-        If there is an error, try to get a valid connection up to 10 times.
+        If there is an error, try to get a valid connection up to "reconnect_attempts" times.
         """
+        for i in range(self.reconnect_attempts):
+            if i > 0:
+                delay = min(self.reconnect_backoff * 2 ** (i - 1), self.reconnect_max_backoff)
+                logger.warning('Getting connection from the pool. Attempt %d in %.2f seconds', i + 1, delay)
+                time.sleep(delay)
 
-        max_attempts = 10
-        for i in range(max_attempts):
+            conn = None
             try:
-                if i > 0:
-                    print(f"Getting connection from the pool. Attempt {i + 1}")
+                conn = super().getconn()
 
-                conn = super().getconn(key)
-                # Try to perform a simple operation to check if the connection is valid
-                with conn.cursor() as cur:
-                    cur.execute("SELECT 1")
+                if self.needs_validation(conn):
+                    # Try to perform a simple operation to check if the connection is valid
+                    with conn.cursor() as cur:
+                        cur.execute('SELECT 1')
+                    conn.rollback()
 
                 if i > 0:
-                    print(f"Connection obtained from the pool after {i + 1} attempts")
+                    logger.warning('Connection obtained from the pool after %d attempts', i + 1)
 
                 return conn
-            except OperationalError:
+            except OperationalError as e:
                 # If the connection is not valid, close it and discard it from the pool
-                print(f"Failed to get a valid connection. Attempt {i + 1}")
-                self.putconn(conn, key=key, close=True)
+                logger.warning('Failed to get a valid connection. Attempt %d: %s', i + 1, e)
+                if conn is not None:
+                    self.putconn(conn, close=True)
+                self.mark_failed()
 
-        raise OperationalError(f"Failed to get a valid connection after {max_attempts} attempts")
\ No newline at end of file
+        raise OperationalError(f'Failed to get a valid connection after {self.reconnect_attempts} attempts')
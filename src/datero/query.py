@@ -0,0 +1,397 @@
+"""Federated queries execution"""
+from typing import Any, Dict, Iterator, List, Tuple
+from datetime import date
+import queue
+import threading
+import uuid
+import psycopg2
+from psycopg2 import errorcodes, sql
+
+from . import CONNECTION
+from .cache import ResultCache
+from .connection import ConnectionPool, Session
+from .explain import PushdownAdvisor
+from .limits import ServerLimits
+from .parallel import run_parallel
+
+_DONE = object()
+
+
+class Query:
+    """Federated queries execution"""
+    BATCH_SIZE = 10000
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.pool = ConnectionPool(self.config[CONNECTION])
+        self.result_cache = ResultCache(self.config)
+        self.advisor = PushdownAdvisor(self.config)
+        self.limits = ServerLimits(self.config)
+
+    @property
+    def batch_size(self) -> int:
+        """Default number of rows fetched from the server per round trip"""
+        return (self.config.get('query') or {}).get('batch_size', Query.BATCH_SIZE)
+
+    @property
+    def parallelism(self) -> int:
+        """Default number of concurrently scanned slices. Limited by the connection pool size"""
+        return min((self.config.get('query') or {}).get('parallelism', 1), self.pool.pool.maxconn)
+
+
+    def stream(
+        self,
+        stmt: str,
+        params: Dict = None,
+        batch_size: int = None,
+        session: Session = None
+    ) -> Iterator[List[tuple]]:
+        """
+        Execute query and yield its result in batches of up to "batch_size" rows.
+        Rows are read through server-side (named) cursor, so only one batch is held in the client memory
+        and the first batch is available as soon as the server produces it.
+        Connection is held until the generator is exhausted or closed.
+        """
+        batch_size = batch_size or self.batch_size
+        servers = self.limited_servers(stmt, params, session)
+
+        try:
+            with self.limits.acquire(servers):
+                with self.pool.connection(session) as conn:
+                    with conn.cursor() as cur:
+                        self.limits.set_statement_timeout(cur, servers)
+
+                    with conn.cursor(name=f'datero_{uuid.uuid4().hex}') as cur:
+                        cur.itersize = batch_size
+                        cur.execute(stmt, params)
+
+                        while True:
+                            rows = cur.fetchmany(batch_size)
+                            if len(rows) == 0:
+                                break
+                            yield rows
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}\nParams: {params}')
+            raise e
+
+
+    def limited_servers(self, stmt, params: Dict = None, session: Session = None) -> set:
+        """
+        Foreign servers having limits which are scanned by the query. Query plan is examined only if any limits are defined.
+        Statements which can't be explained (DDL, SET, CALL, etc.) are executed without limits.
+        Failed limits lookup or EXPLAIN means no limits as well.
+        """
+        if not self.advisor.is_explainable(stmt):
+            return set()
+
+        try:
+            limited = self.limits.limited()
+            if not limited:
+                return set()
+
+            return self.advisor.servers(stmt, params, session, quiet=True) & limited
+        except psycopg2.Error:
+            # error is reported by the statement execution itself
+            return set()
+
+
+    def fetch(self, stmt: str, params: Dict = None, cache: bool = None, session: Session = None) -> Dict:
+        """
+        Execute query and return its whole result as {'columns': [...], 'rows': [...]}.
+        If result cache is enabled in config or by "cache" flag, identical queries are answered from the cache.
+        Only read-only queries are cached, see "fetch_cached".
+        Cache is bypassed within session, because its transaction could see uncommitted changes.
+        Foreign servers scanned by the query are taken from its plan, so changes of any of them invalidate the entry.
+        """
+        use_cache = (self.result_cache.enabled if cache is None else cache) \
+            and session is None \
+            and self.advisor.is_query(stmt)
+
+        if use_cache:
+            key = ResultCache.key(stmt, params)
+            res = self.result_cache.get(key)
+            if res is None:
+                res = self.fetch_cached(stmt, params, key)
+            if res is not None:
+                return res
+
+        servers = self.limited_servers(stmt, params, session)
+
+        try:
+            with self.limits.acquire(servers):
+                with self.pool.connection(session) as conn:
+                    with conn.cursor() as cur:
+                        self.limits.set_statement_timeout(cur, servers)
+                        cur.execute(stmt, params)
+                        return {
+                            'columns': [col.name for col in cur.description] if cur.description else [],
+                            'rows': cur.fetchall() if cur.description else []
+                        }
+
+        except psycopg2.Error as e:
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}\nParams: {params}')
+            raise e
+
+
+    def fetch_cached(self, stmt: str, params: Dict, key) -> Dict:
+        """
+        Execute query in a read-only transaction and cache its result.
+        Scanned foreign servers are taken from the plan in the same transaction before the query is executed.
+        Statements modifying data, including calls of nextval and other writing functions, fail in such transaction.
+        For them None is returned, so they are executed as usual and never cached.
+        """
+        try:
+            with self.pool.transaction() as session:
+                with self.pool.connection(session) as conn:
+                    with conn.cursor() as cur:
+                        cur.execute('SET TRANSACTION READ ONLY')
+
+                servers = self.advisor.servers(stmt, params, session)
+                limited = servers & self.limits.limited()
+
+                with self.limits.acquire(limited):
+                    with self.pool.connection(session) as conn:
+                        with conn.cursor() as cur:
+                            self.limits.set_statement_timeout(cur, limited)
+                            cur.execute(stmt, params)
+                            if cur.description is None:
+                                return {'columns': [], 'rows': []}
+
+                            res = {
+                                'columns': [col.name for col in cur.description],
+                                'rows': cur.fetchall()
+                            }
+
+        except psycopg2.Error as e:
+            if e.pgcode == errorcodes.READ_ONLY_SQL_TRANSACTION:
+                return None
+            print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}\nParams: {params}')
+            raise e
+
+        self.result_cache.set(key, res, servers)
+        return res
+
+
+    def key_range(self, schema_name: str, table_name: str, key: str, session: Session = None) -> Tuple[Any, Any]:
+        """Min and max values of the key column. Aggregates are pushed down to the foreign server where supported"""
+        stmt = sql.SQL('SELECT MIN({key}), MAX({key}) FROM {table}').format(
+            key=sql.Identifier(key),
+            table=sql.Identifier(schema_name, table_name)
+        )
+
+        with self.pool.connection(session) as conn:
+            with conn.cursor() as cur:
+                cur.execute(stmt)
+                return cur.fetchone()
+
+
+    def slices(
+        self,
+        schema_name: str,
+        table_name: str,
+        key: str,
+        partitions: int,
+        lower: Any = None,
+        upper: Any = None
+    ) -> List[Tuple[sql.Composable, Dict]]:
+        """
+        Split key range into up to "partitions" slices of equal width.
+        Returns list of (WHERE condition, bind values) pairs which together cover every row of the table exactly once.
+        Slices are half-open [lower, upper) except the last one. Rows with NULL key are included into the first slice.
+        Bounds not specified explicitly are taken from the table.
+        """
+        if lower is None or upper is None:
+            min_value, max_value = self.key_range(schema_name, table_name, key)
+            lower = min_value if lower is None else lower
+            upper = max_value if upper is None else upper
+
+        column = sql.Identifier(key)
+        if lower is None:
+            # table is empty or key is always NULL
+            return [(sql.SQL('{key} IS NULL').format(key=column), {})]
+
+        bounds = []
+        for i in range(max(int(partitions), 1)):
+            # integers and dates are split on whole units
+            step = (upper - lower) * i // partitions if isinstance(lower, (int, date)) else (upper - lower) * i / partitions
+            bound = lower + step
+            if len(bounds) == 0 or bound > bounds[-1]:
+                bounds.append(bound)
+
+        res = []
+        for i, bound in enumerate(bounds):
+            if i < len(bounds) - 1:
+                cond = sql.SQL('{key} >= %(lower)s AND {key} < %(upper)s').format(key=column)
+                params = {'lower': bound, 'upper': bounds[i + 1]}
+            else:
+                cond = sql.SQL('{key} >= %(lower)s AND {key} <= %(upper)s').format(key=column)
+                params = {'lower': bound, 'upper': upper}
+
+            if i == 0:
+                cond = sql.SQL('({cond} OR {key} IS NULL)').format(cond=cond, key=column)
+            res.append((cond, params))
+
+        return res
+
+
+    def slice_query(self, schema_name: str, table_name: str, cond: sql.Composable, columns: List[str] = None) -> sql.Composed:
+        """SELECT statement of a single slice"""
+        return sql.SQL('SELECT {columns} FROM {table} WHERE {cond}').format(
+            columns=sql.SQL(', ').join(map(sql.Identifier, columns)) if columns else sql.SQL('*'),
+            table=sql.Identifier(schema_name, table_name),
+            cond=cond
+        )
+
+
+    def scan_partitioned(
+        self,
+        schema_name: str,
+        table_name: str,
+        key: str,
+        partitions: int = None,
+        columns: List[str] = None,
+        lower: Any = None,
+        upper: Any = None,
+        batch_size: int = None
+    ) -> Iterator[List[tuple]]:
+        """
+        Read foreign table by key range slices scanned concurrently and yield merged stream of row batches.
+        Every slice is read on a separate pooled connection, so its WHERE range is pushed down to the foreign server
+        in its own remote query. Batches of different slices are interleaved, rows order is not preserved.
+        At most "parallelism" slices are scanned at a time and only a couple of batches per slice are buffered.
+        """
+        parallelism = partitions or self.parallelism
+        slices = self.slices(schema_name, table_name, key, parallelism, lower, upper)
+        parallelism = min(parallelism, len(slices), self.pool.pool.maxconn)
+
+        pending = queue.Queue()
+        for item in slices:
+            pending.put(item)
+
+        batches = queue.Queue(maxsize=parallelism * 2)
+        stop = threading.Event()
+        errors = []
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    try:
+                        cond, params = pending.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    stream = self.stream(self.slice_query(schema_name, table_name, cond, columns), params, batch_size)
+                    try:
+                        for rows in stream:
+                            if not put(rows):
+                                break
+                    finally:
+                        stream.close()
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                # consumer drains the queue until every worker is done
+                batches.put(_DONE)
+
+        workers = [
+            threading.Thread(target=worker, name=f'datero-scan-{i}', daemon=True)
+            for i in range(parallelism)
+        ]
+        for thread in workers:
+            thread.start()
+
+        try:
+            running = len(workers)
+            while running > 0:
+                rows = batches.get()
+                if rows is _DONE:
+                    running -= 1
+                elif not errors:
+                    yield rows
+
+            if errors:
+                raise errors[0]
+        finally:
+            # consumer could stop iteration early. release workers blocked on the full queue
+            stop.set()
+            for thread in workers:
+                while thread.is_alive():
+                    try:
+                        while True:
+                            batches.get_nowait()
+                    except queue.Empty:
+                        pass
+                    thread.join(0.1)
+
+
+    def load_partitioned(
+        self,
+        schema_name: str,
+        table_name: str,
+        key: str,
+        target_schema: str,
+        target_table: str,
+        partitions: int = None,
+        columns: List[str] = None,
+        lower: Any = None,
+        upper: Any = None
+    ) -> Dict:
+        """
+        Copy foreign table into the local table by key range slices loaded concurrently with INSERT ... SELECT.
+        Target table is created if it doesn't exist.
+        Every slice is loaded in its own transaction, so failed slices could be reloaded without touching the others.
+        Returns outcome of every slice keyed by its range and total number of loaded rows.
+        """
+        parallelism = partitions or self.parallelism
+        slices = self.slices(schema_name, table_name, key, parallelism, lower, upper)
+        target = sql.Identifier(target_schema, target_table)
+
+        stmt = sql.SQL('CREATE TABLE IF NOT EXISTS {target} AS {query} WITH NO DATA').format(
+            target=target,
+            query=self.slice_query(schema_name, table_name, sql.SQL('FALSE'), columns)
+        )
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(stmt)
+
+        def load(cond: sql.Composable, params: Dict):
+            stmt = sql.SQL('INSERT INTO {target} {query}').format(
+                target=target,
+                query=self.slice_query(schema_name, table_name, cond, columns)
+            )
+            servers = self.limited_servers(stmt, params)
+            try:
+                with self.limits.acquire(servers):
+                    with self.pool.connection() as conn:
+                        with conn.cursor() as cur:
+                            self.limits.set_statement_timeout(cur, servers)
+                            cur.execute(stmt, params)
+                            return cur.rowcount
+            except psycopg2.Error as e:
+                print(f'Error code: {e.pgcode}\nMessage: {e.pgerror}\nSQL: {stmt}\nParams: {params}')
+                raise e
+
+        tasks = {
+            f'{params.get("lower")}..{params.get("upper")}': (lambda cond=cond, params=params: load(cond, params))
+            for cond, params in slices
+        }
+        outcomes = run_parallel(tasks, min(parallelism, self.pool.pool.maxconn))
+
+        rows = sum(res['result'] for res in outcomes.values() if res['status'] == 'ok')
+        failed = [name for name, res in outcomes.items() if res['status'] == 'error']
+        print(f'Loaded {rows} rows of "{schema_name}.{table_name}" into "{target_schema}.{target_table}" by {len(slices)} slices')
+        if failed:
+            print(f'Failed slices: {", ".join(failed)}')
+
+        return { 'rows': rows, 'slices': outcomes }
@@ -8,3 +8,38 @@ CREATE TABLE IF NOT EXISTS datero.servers
 , created           TIMESTAMP       DEFAULT CURRENT_TIMESTAMP
 , modified          TIMESTAMP
 );
+
+-- stmt
+CREATE TABLE IF NOT EXISTS datero.materializations
+( id                SERIAL          PRIMARY KEY
+, source_schema     VARCHAR(63)     NOT NULL
+, source_table      VARCHAR(63)     NOT NULL
+, target_schema     VARCHAR(63)     NOT NULL
+, target_table      VARCHAR(63)     NOT NULL
+, method            VARCHAR(20)     NOT NULL
+, refresh_interval  INTEGER
+, watermark_column  VARCHAR(63)
+, watermark_value   TEXT
+, key_columns       TEXT[]
+, last_refresh      TIMESTAMP
+, last_duration     NUMERIC
+, created           TIMESTAMP       DEFAULT CURRENT_TIMESTAMP
+, modified          TIMESTAMP
+, CONSTRAINT materializations_target_uk UNIQUE (target_schema, target_table)
+);
+
+-- stmt
+CREATE TABLE IF NOT EXISTS datero.jobs
+( id                SERIAL          PRIMARY KEY
+, kind              VARCHAR(50)     NOT NULL
+, params            JSONB
+, status            VARCHAR(20)     NOT NULL
+, progress          NUMERIC
+, message           VARCHAR(4000)
+, result            JSONB
+, error             TEXT
+, backend_pid       INTEGER
+, submitted         TIMESTAMP       DEFAULT CURRENT_TIMESTAMP
+, started           TIMESTAMP
+, finished          TIMESTAMP
+);
@@ -0,0 +1,225 @@
+"""Watching config files and applying changes of foreign servers"""
+from typing import Dict, Tuple
+from copy import deepcopy
+import os
+import threading
+import time
+
+from .config import ConfigParser
+from .connection import ConnectionPool
+from .fdw import Server
+from .fdw.tuning import apply_tuning_profile
+from . import CONNECTION
+
+
+class ConfigWatcher:
+    """
+    Background thread which polls modification time of the config files and applies changed foreign servers.
+    Changes are applied once files are left unmodified for "watch.debounce" seconds,
+    so a burst of edits results in a single reload.
+    Reloads are serialized. Servers definitions before and after reload are compared
+    and only the affected servers are created, updated or, if "prune" is set, deleted.
+    Every server is processed in a separate transaction.
+    """
+
+    def __init__(self, cp: ConfigParser, prune: bool = False):
+        self.cp = cp
+        self.config = cp.params
+        self.prune = prune
+        self.pool = ConnectionPool(self.config[CONNECTION])
+        self.server = Server(self.config)
+
+        conf = self.config.get('watch') or {}
+        self.interval = conf.get('interval', 1)
+        self.debounce = conf.get('debounce', 2)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._files = self.files()
+        self._modified = None   # time of the last detected modification not applied yet
+
+
+    def files(self) -> Dict[str, Tuple[int, int]]:
+        """Size and modification time of the user config files keyed by path. New and removed files count as well"""
+        res = {}
+        for path in self.cp.user_config_fragments():
+            try:
+                stat = os.stat(path)
+                res[path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                pass    # removed between listing and stat. next check picks it up
+
+        return res
+
+
+    def start(self):
+        """Start watcher thread if it isn't running yet"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='datero-config-watcher', daemon=True)
+        self._thread.start()
+        print(f'Watching config {self.cp.user_config_file}. Check interval: {self.interval}s, debounce: {self.debounce}s')
+
+
+    def stop(self, timeout: float = None):
+        """Stop watcher thread. Currently running reload is completed"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait for watcher thread to stop. Returns True if it's still running"""
+        thread = self._thread
+        if thread is None:
+            return False
+
+        thread.join(timeout)
+        return thread.is_alive()
+
+
+    def run(self):
+        """Watcher loop"""
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print(f'Error during config reload: {e}')
+
+            self._stop.wait(self.interval)
+
+
+    def check(self):
+        """Detect config files modification and reload config once they are left intact for debounce period"""
+        try:
+            files = self.files()
+        except FileNotFoundError:
+            files = {}  # directory or glob without files. keep waiting for them
+
+        now = time.monotonic()
+        if files != self._files:
+            self._files = files
+            self._modified = now
+            return
+
+        if self._modified is not None and now - self._modified >= self.debounce:
+            self._modified = None
+            self.reload()
+
+
+    def reload(self) -> Dict:
+        """
+        Reload config and apply changed foreign servers.
+        Config with errors isn't applied, current one is kept.
+        Returns summary of the processing.
+        """
+        with self._lock:
+            previous = self.cp.reload()
+            created, updated, deleted = self.diff(self.desired_state(previous), self.desired_state(self.config))
+
+            summary = {'created': [], 'updated': [], 'deleted': [], 'skipped': [], 'failed': {}}
+            if len(created) + len(updated) + len(deleted) == 0:
+                print('Config reloaded. No changes of foreign servers')
+                return summary
+
+            print(f'Config reloaded. Servers to create: {len(created)}, update: {len(updated)}, delete: {len(deleted)}')
+
+            for server_name, server in created.items():
+                self.apply(summary, 'created', server_name, lambda session, server=server: self.create(server, session))
+
+            for server_name, (existing, server) in updated.items():
+                self.apply(
+                    summary, 'updated', server_name,
+                    lambda session, existing=existing, server=server: self.update(existing, server, session)
+                )
+
+            for server_name, existing in deleted.items():
+                if not self.prune:
+                    print(f'Foreign server "{server_name}" is removed from config. Not deleted without prune')
+                    summary['skipped'].append(server_name)
+                    continue
+
+                self.apply(
+                    summary, 'deleted', server_name,
+                    lambda session, existing=existing: self.server.delete_server(self.deletion(existing), session)
+                )
+
+            print(
+                f'Created {len(summary["created"])}, updated {len(summary["updated"])}, '
+                f'deleted {len(summary["deleted"])} servers, failed for {len(summary["failed"])} servers'
+            )
+
+            return summary
+
+
+    def apply(self, summary: Dict, outcome: str, server_name: str, action):
+        """Apply change of a single server in its own transaction. We intentionally continue on error"""
+        try:
+            with self.pool.transaction() as session:
+                action(session)
+            summary[outcome].append(server_name)
+        except Exception as e:
+            print(f'Error during applying changes for server "{server_name}": {e}')
+            summary['failed'][server_name] = str(e)
+        finally:
+            # lookups done before commit could have cached the previous state
+            self.server.invalidate_caches(server_name)
+
+
+    def desired_state(self, params: Dict) -> Dict[str, Dict]:
+        """Foreign servers definitions of the given config keyed by server name. Tuning profiles are applied"""
+        res = {}
+        for name, props in (params.get('servers') or {}).items():
+            server_name = self.server.normalize_name(name)
+
+            if not self.server.is_valid_name(server_name):
+                print(f'Invalid server name "{server_name}". Skipping...')
+                continue
+
+            server = apply_tuning_profile(params, deepcopy(props))
+            server['server_name'] = server_name
+            res[server_name] = server
+
+        return res
+
+
+    @staticmethod
+    def diff(old: Dict[str, Dict], new: Dict[str, Dict]) -> Tuple[Dict, Dict, Dict]:
+        """
+        Structural difference of servers definitions.
+        Returns new servers, changed servers as (old, new) pairs and removed servers keyed by server name.
+        """
+        created = {name: server for name, server in new.items() if name not in old}
+        updated = {name: (old[name], server) for name, server in new.items() if name in old and old[name] != server}
+        deleted = {name: server for name, server in old.items() if name not in new}
+
+        return (created, updated, deleted)
+
+
+    def create(self, server: Dict, session):
+        """Create new server"""
+        server = deepcopy(server)
+        server['advanced_options'] = self.server.populate_advanced_options(server)
+        self.server.create_server(server, session)
+
+
+    def update(self, existing: Dict, server: Dict, session):
+        """Update changed server. Server with changed FDW can only be dropped and created again"""
+        if existing['fdw_name'] != server['fdw_name']:
+            self.server.delete_server(self.deletion(existing), session)
+            self.create(server, session)
+            return
+
+        server = deepcopy(server)
+        server['advanced_options'] = self.server.populate_advanced_options(server)
+        self.server.update_server(server, session)
+
+
+    @staticmethod
+    def deletion(server: Dict) -> Dict:
+        """Input of the server deletion"""
+        return {'server_name': server['server_name'], 'description': server.get('description') or server['server_name']}
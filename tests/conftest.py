@@ -0,0 +1,27 @@
+"""Shared fixtures of the unit tests. They run without database"""
+import pytest
+from psycopg2 import sql
+
+
+def render_sql(query) -> str:
+    """
+    Text of the composed SQL statement.
+    psycopg2 needs a connection to quote identifiers, so they are quoted here the simple way.
+    """
+    if isinstance(query, sql.Composed):
+        return ''.join(render_sql(part) for part in query.seq)
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return '.'.join(f'"{name}"' for name in query.strings)
+    if isinstance(query, sql.Placeholder):
+        return f'%({query.name})s' if query.name else '%s'
+    if isinstance(query, sql.Literal):
+        return repr(query.wrapped)
+    raise TypeError(f'Unexpected SQL part: {query!r}')
+
+
+@pytest.fixture
+def render():
+    """Render composed SQL statement into text"""
+    return render_sql
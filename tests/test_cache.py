@@ -0,0 +1,123 @@
+"""In-memory caches"""
+import pickle
+import time
+
+import pytest
+
+from datero.cache import TTLCache, ResultCache
+
+
+def test_entry_expires_after_ttl():
+    cache = TTLCache(ttl=0.02)
+    cache.set('key', 1)
+
+    assert cache.get('key') == 1
+    time.sleep(0.05)
+    assert cache.get('key') is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_get_or_load_calls_loader_on_miss_only():
+    cache = TTLCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get_or_load('key', loader) == 1
+    assert cache.get_or_load('key', loader) == 1
+    assert cache.get_or_load('key', loader, refresh=True) == 2
+
+
+def test_invalidate_by_predicate():
+    cache = TTLCache()
+    cache.set(('mysql', 'schema_list'), [])
+    cache.set(('mysql', 'table_list', 'dev'), [])
+    cache.set(('oracle', 'schema_list'), [])
+
+    assert cache.invalidate(lambda key: key[0] == 'mysql') == 2
+    assert cache.get(('oracle', 'schema_list')) == []
+
+
+@pytest.fixture
+def result_cache():
+    """Fresh result cache instance. It's a singleton, so every test gets its own one"""
+    def reset():
+        if 'instance' in ResultCache.__dict__:
+            delattr(ResultCache, 'instance')
+
+    def make(**settings):
+        reset()
+        return ResultCache({'cache': {'results': settings}})
+
+    yield make
+    reset()
+
+
+def test_result_cache_key_ignores_whitespace():
+    assert ResultCache.key('SELECT  1\n ;', {'b': 1, 'a': 2}) == ResultCache.key('SELECT 1', {'a': 2, 'b': 1})
+
+
+def test_result_cache_returns_copies(result_cache):
+    cache = result_cache()
+    cache.set('key', {'rows': [[1]]})
+
+    cache.get('key')['rows'].append([2])
+
+    assert cache.get('key') == {'rows': [[1]]}
+
+
+def test_result_cache_evicts_over_memory_budget(result_cache):
+    value = 'x' * 100
+    cache = result_cache(max_bytes=len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) * 2)
+    cache.set('a', value)
+    cache.set('b', value)
+    cache.get('a')
+    cache.set('c', value)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == value
+    assert cache.get('c') == value
+
+
+def test_result_cache_spills_evicted_entries_to_disk(result_cache, tmp_path):
+    value = 'x' * 100
+    cache = result_cache(max_bytes=len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), spill_dir=str(tmp_path))
+    cache.set('a', value)
+    cache.set('b', value)
+
+    assert cache.stats()['disk_bytes'] > 0
+    assert cache.get('a') == value
+    # loaded back into memory, so the other entry is spilled in turn
+    assert cache.get('b') == value
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_result_cache_skips_value_over_budget(result_cache):
+    cache = result_cache(max_bytes=10)
+    cache.set('key', 'x' * 100)
+
+    assert cache.get('key') is None
+
+
+def test_result_cache_invalidates_by_server(result_cache):
+    cache = result_cache()
+    cache.set('a', 1, servers=['mysql'])
+    cache.set('b', 2, servers=['mysql', 'oracle'])
+    cache.set('c', 3, servers=['oracle'])
+
+    assert cache.invalidate_server('mysql') == 2
+    assert cache.get('c') == 3
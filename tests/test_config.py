@@ -0,0 +1,66 @@
+"""Merge of the user config fragments"""
+import json
+
+import pytest
+
+from datero.config import ConfigParser
+
+
+@pytest.fixture
+def parser():
+    """Config parser without parsed config. Singleton constructor is bypassed"""
+    return object.__new__(ConfigParser)
+
+
+def test_fragments_are_merged(parser):
+    res = parser.merge_fragments({
+        'a.yaml': {'servers': {'mysql': {'fdw_name': 'mysql_fdw'}}, 'postgres': {'pool': {'max_size': 20}}},
+        'b.yaml': {'servers': {'oracle': {'fdw_name': 'oracle_fdw'}}, 'postgres': {'pool': {'timeout': 5}}},
+        'empty.yaml': None
+    })
+
+    assert res == {
+        'servers': {'mysql': {'fdw_name': 'mysql_fdw'}, 'oracle': {'fdw_name': 'oracle_fdw'}},
+        'postgres': {'pool': {'max_size': 20, 'timeout': 5}}
+    }
+
+
+def test_server_defined_twice_is_rejected(parser):
+    with pytest.raises(ValueError, match='Foreign server "mysql" is defined in both a.yaml and b.yaml'):
+        parser.merge_fragments({
+            'a.yaml': {'servers': {'mysql': {'fdw_name': 'mysql_fdw'}}},
+            'b.yaml': {'servers': {'mysql': {'description': 'other'}}}
+        })
+
+
+def test_setting_defined_twice_is_rejected(parser):
+    with pytest.raises(ValueError, match='Config setting "postgres.pool.max_size" is defined in both a.yaml and b.yaml'):
+        parser.merge_fragments({
+            'a.yaml': {'postgres': {'pool': {'max_size': 20}}},
+            'b.yaml': {'postgres': {'pool': {'max_size': 30}}}
+        })
+
+
+def test_section_conflicting_with_setting_is_rejected(parser):
+    with pytest.raises(ValueError, match='"cache" is defined in both a.yaml and b.yaml'):
+        parser.merge_fragments({
+            'a.yaml': {'cache': 'off'},
+            'b.yaml': {'cache': {'results': {'enabled': True}}}
+        })
+
+
+def test_fragment_must_be_mapping(parser):
+    with pytest.raises(ValueError, match='must contain a mapping'):
+        parser.merge_fragments({'a.yaml': ['servers']})
+
+
+def test_fragments_with_credentials_are_not_persisted(parser, tmp_path):
+    snapshot_file = str(tmp_path / 'user_test-fragments.json')
+    parser.save_fragments_snapshot(snapshot_file, {
+        'servers.yaml': (10, 1, {'servers': {'mysql': {'user_mapping': {'username': 'u', 'password': 'p'}}}}),
+        'postgres.yaml': (10, 1, {'postgres': {'password': 'p'}}),
+        'cache.yaml': (10, 1, {'cache': {'results': {'enabled': True}}})
+    })
+
+    with open(snapshot_file, encoding='utf-8') as f:
+        assert list(json.load(f)) == ['cache.yaml']
@@ -0,0 +1,37 @@
+"""Regrouping of Arrow record batches"""
+import pytest
+
+from datero.export import rebatch
+
+pa = pytest.importorskip('pyarrow')
+
+
+def batches(*sizes):
+    """Record batches of the given sizes with consecutive "id" values"""
+    res = []
+    start = 0
+    for size in sizes:
+        res.append(pa.record_batch([pa.array(range(start, start + size))], names=['id']))
+        start += size
+    return res
+
+
+def test_batches_are_regrouped_into_fixed_size():
+    source = batches(3, 7, 1, 9)
+    res = list(rebatch(pa, iter(source), source[0].schema, 5))
+
+    assert [batch.num_rows for batch in res] == [5, 5, 5, 5]
+    assert [value for batch in res for value in batch.column(0).to_pylist()] == list(range(20))
+
+
+def test_last_batch_could_be_smaller():
+    source = batches(4, 4)
+    res = list(rebatch(pa, iter(source), source[0].schema, 3))
+
+    assert [batch.num_rows for batch in res] == [3, 3, 2]
+
+
+def test_empty_stream_yields_nothing():
+    schema = pa.schema([('id', pa.int64())])
+
+    assert list(rebatch(pa, iter([]), schema, 10)) == []
@@ -0,0 +1,104 @@
+"""Blocking connection pool without database. Connections are replaced by fakes"""
+import threading
+import time
+
+import pytest
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from datero.pool import BlockingConnectionPool
+
+
+class FakeInfo:
+    transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.info = FakeInfo()
+
+    def close(self):
+        self.closed = True
+
+    def rollback(self):
+        pass
+
+
+class FakePool(BlockingConnectionPool):
+    def _connect(self):
+        return FakeConnection()
+
+
+def test_returned_connection_is_reused():
+    pool = FakePool(0, 2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    assert pool.getconn() is conn
+
+
+def test_exhausted_pool_times_out():
+    pool = FakePool(0, 1, timeout=0.05)
+    pool.getconn()
+
+    started = time.monotonic()
+    with pytest.raises(PoolError, match='Timed out'):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+
+
+def test_waiter_gets_returned_connection():
+    pool = FakePool(0, 1, timeout=5)
+    conn = pool.getconn()
+    res = []
+
+    waiter = threading.Thread(target=lambda: res.append(pool.getconn()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.putconn(conn)
+    waiter.join(1)
+
+    assert res == [conn]
+
+
+def test_idle_connections_above_minimum_are_reaped():
+    pool = FakePool(1, 3, max_idle=0.01)
+    conns = [pool.getconn() for _ in range(3)]
+    for conn in conns:
+        pool.putconn(conn)
+
+    time.sleep(0.05)
+    kept = pool.getconn()
+
+    assert sum(conn.closed for conn in conns) == 2
+    assert not kept.closed
+
+
+def test_broken_connection_is_discarded():
+    pool = FakePool(0, 1)
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_UNKNOWN
+    pool.putconn(conn)
+
+    assert conn.closed
+    assert pool.getconn() is not conn
+
+
+def test_unknown_connection_is_rejected():
+    pool = FakePool(0, 1)
+
+    with pytest.raises(PoolError, match='unkeyed'):
+        pool.putconn(FakeConnection())
+
+
+def test_connection_returned_after_closeall_is_closed():
+    pool = FakePool(0, 2)
+    conn = pool.getconn()
+    pool.closeall()
+
+    pool.putconn(conn)
+
+    assert conn.closed
+    with pytest.raises(PoolError, match='closed'):
+        pool.getconn()
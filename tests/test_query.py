@@ -0,0 +1,54 @@
+"""Key range slicing of the partitioned scans"""
+from datetime import date
+
+from datero.query import Query
+
+
+def make_query(key_range=(None, None)) -> Query:
+    """Query API without connection pool. Key range lookup returns the given bounds"""
+    query = Query.__new__(Query)
+    query.key_range = lambda *_: key_range
+    return query
+
+
+def test_integer_range_split_into_equal_slices(render):
+    slices = make_query().slices('s', 't', 'id', 4, lower=0, upper=100)
+
+    assert [params for _, params in slices] == [
+        {'lower': 0, 'upper': 25},
+        {'lower': 25, 'upper': 50},
+        {'lower': 50, 'upper': 75},
+        {'lower': 75, 'upper': 100}
+    ]
+    # NULL keys go to the first slice, the last one includes the upper bound
+    assert render(slices[0][0]) == '("id" >= %(lower)s AND "id" < %(upper)s OR "id" IS NULL)'
+    assert render(slices[1][0]) == '"id" >= %(lower)s AND "id" < %(upper)s'
+    assert render(slices[-1][0]) == '"id" >= %(lower)s AND "id" <= %(upper)s'
+
+
+def test_narrow_range_produces_fewer_slices():
+    slices = make_query().slices('s', 't', 'id', 10, lower=1, upper=3)
+
+    # integer bounds don't repeat, so no slice is empty
+    assert [params for _, params in slices] == [{'lower': 1, 'upper': 2}, {'lower': 2, 'upper': 3}]
+
+
+def test_dates_split_on_whole_days():
+    slices = make_query().slices('s', 't', 'day', 3, lower=date(2024, 1, 1), upper=date(2024, 1, 11))
+
+    assert all(isinstance(params['lower'], date) for _, params in slices)
+    assert slices[0][1] == {'lower': date(2024, 1, 1), 'upper': date(2024, 1, 4)}
+
+
+def test_missing_bounds_are_taken_from_table():
+    slices = make_query((10, 20)).slices('s', 't', 'id', 2)
+
+    assert slices[0][1] == {'lower': 10, 'upper': 15}
+    assert slices[-1][1] == {'lower': 15, 'upper': 20}
+
+
+def test_empty_table_scans_null_keys_only(render):
+    slices = make_query().slices('s', 't', 'id', 4)
+
+    assert len(slices) == 1
+    assert render(slices[0][0]) == '"id" IS NULL'
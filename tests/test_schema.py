@@ -0,0 +1,55 @@
+"""IMPORT FOREIGN SCHEMA statement"""
+import pytest
+
+from datero.fdw.schema import Schema
+
+
+@pytest.fixture
+def schema():
+    """Schema API without connection pool. Statement building doesn't need it"""
+    return Schema.__new__(Schema)
+
+
+def test_plain_import(schema, render):
+    query, values = schema.import_query('mysql', 'dev', 'mysql')
+
+    assert render(query) == 'IMPORT FOREIGN SCHEMA "dev" FROM SERVER "mysql" INTO "mysql"'
+    assert values is None
+
+
+def test_limit_to(schema, render):
+    query, _ = schema.import_query('mysql', 'dev', 'mysql', limit_to=['orders', 'users'])
+
+    assert render(query) == 'IMPORT FOREIGN SCHEMA "dev" LIMIT TO ("orders", "users") FROM SERVER "mysql" INTO "mysql"'
+
+
+def test_except(schema, render):
+    query, _ = schema.import_query('mysql', 'dev', 'mysql', except_tables=['logs'])
+
+    assert render(query) == 'IMPORT FOREIGN SCHEMA "dev" EXCEPT ("logs") FROM SERVER "mysql" INTO "mysql"'
+
+
+def test_empty_except_means_plain_import(schema, render):
+    query, _ = schema.import_query('mysql', 'dev', 'mysql', except_tables=[])
+
+    assert render(query) == 'IMPORT FOREIGN SCHEMA "dev" FROM SERVER "mysql" INTO "mysql"'
+
+
+def test_empty_limit_to_is_rejected(schema):
+    with pytest.raises(ValueError, match='must not be empty'):
+        schema.import_query('mysql', 'dev', 'mysql', limit_to=[])
+
+
+def test_limit_to_takes_precedence_over_except(schema, render):
+    query, _ = schema.import_query('mysql', 'dev', 'mysql', limit_to=['orders'], except_tables=['logs'])
+
+    assert 'LIMIT TO ("orders")' in render(query)
+    assert 'EXCEPT' not in render(query)
+
+
+def test_import_options(schema, render):
+    query, values = schema.import_query('mysql', 'dev', 'mysql', {'import_default': 'true'})
+
+    assert render(query).startswith('IMPORT FOREIGN SCHEMA "dev" FROM SERVER "mysql" INTO "mysql" OPTIONS(')
+    assert 'import_default' in render(query)
+    assert values == {'import_default': 'true'}
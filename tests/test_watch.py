@@ -0,0 +1,32 @@
+"""Servers difference computed by the config watcher"""
+from datero.watch import ConfigWatcher
+
+
+def server(name, **options):
+    return {'server_name': name, 'fdw_name': 'mysql_fdw', 'foreign_server': options}
+
+
+def test_created_updated_and_deleted_servers():
+    old = {'a': server('a', host='h1'), 'b': server('b', host='h2'), 'c': server('c')}
+    new = {'a': server('a', host='h1'), 'b': server('b', host='h3'), 'd': server('d')}
+
+    created, updated, deleted = ConfigWatcher.diff(old, new)
+
+    assert created == {'d': new['d']}
+    assert updated == {'b': (old['b'], new['b'])}
+    assert deleted == {'c': old['c']}
+
+
+def test_nested_change_counts_as_update():
+    old = {'a': {**server('a'), 'user_mapping': {'username': 'u1'}}}
+    new = {'a': {**server('a'), 'user_mapping': {'username': 'u2'}}}
+
+    _, updated, _ = ConfigWatcher.diff(old, new)
+
+    assert list(updated) == ['a']
+
+
+def test_no_changes():
+    servers = {'a': server('a', host='h1')}
+
+    assert ConfigWatcher.diff(servers, {'a': server('a', host='h1')}) == ({}, {}, {})